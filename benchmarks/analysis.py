@@ -0,0 +1,156 @@
+"""
+Benchmarks the APK analysis hot path on synthetic APKs.
+Times each analysis component and measures its peak memory, and optionally compares the results against a stored baseline.
+
+Example:
+    $ python benchmarks/analysis.py --output baseline.json
+    $ python benchmarks/analysis.py --baseline baseline.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.append(os.path.abspath('.'))
+from androguard.core.bytecodes.apk import APK
+
+from benchmarks.apkgen import build_apk, generate_signer
+from crawler.pipelines.analyze_apks import analyse, get_certs, get_signers, parse_app_links
+
+_MB = 1024 * 1024
+
+# name -> arguments of 'build_apk'
+CASES = {
+    "1mb_v1": dict(size=_MB, schemes=(1,)),
+    "1mb_v2": dict(size=_MB, schemes=(2,)),
+    "1mb_v1v2v3": dict(size=_MB, schemes=(1, 2, 3)),
+    "32mb_v1v2v3": dict(size=32 * _MB, schemes=(1, 2, 3)),
+    "large_manifest_v1v2v3": dict(size=_MB, schemes=(1, 2, 3), permissions=1000, intent_filters=500, hosts_per_filter=4),
+}
+
+
+def _components(path):
+    """
+    Returns the benchmarked components as (name, setup, func)-tuples
+    The setup is not included in the measurements, and its result is passed to the function
+    """
+    def load_apk():
+        return APK(path, testzip=False)
+
+    return [
+        ("apk", lambda: path, lambda p: APK(p, testzip=False)),
+        ("get_certs", load_apk, get_certs),
+        ("get_signers", load_apk, get_signers),
+        ("parse_app_links", lambda: load_apk().get_android_manifest_xml(), parse_app_links),
+        ("analyse", lambda: path, analyse),
+    ]
+
+
+def measure(setup, func, repeat):
+    """
+    Returns the timings (in seconds) and the peak memory (in bytes) of calling func on the result of setup
+    """
+    timings = []
+    for i in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - start)
+
+    # measure memory separately, since tracing allocations slows down execution
+    arg = setup()
+    tracemalloc.start()
+    func(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return dict(
+        min_s=min(timings),
+        median_s=statistics.median(timings),
+        mean_s=statistics.mean(timings),
+        peak_bytes=peak
+    )
+
+
+def run(cases, repeat, workdir):
+    signer = generate_signer()
+    results = {}
+    for case in cases:
+        path = os.path.join(workdir, f"{case}.apk")
+        build_apk(path, signer=signer, **CASES[case])
+
+        results[case] = {}
+        for component, setup, func in _components(path):
+            results[case][component] = measure(setup, func, repeat)
+            print(f"{case:<24} {component:<16} {results[case][component]['median_s'] * 1000:>10.2f} ms {results[case][component]['peak_bytes'] / _MB:>10.2f} MB")
+        os.remove(path)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the list of regressions, i.e. components whose median time or peak memory exceed the baseline by more than the tolerance
+    """
+    regressions = []
+    for case, components in results.items():
+        for component, res in components.items():
+            base = baseline.get(case, {}).get(component, None)
+            if not base:
+                continue
+            for metric in ["median_s", "peak_bytes"]:
+                if base[metric] and res[metric] > base[metric] * (1 + tolerance):
+                    regressions.append((case, component, metric, base[metric], res[metric]))
+    return regressions
+
+
+def main(args):
+    workdir = tempfile.mkdtemp()
+    try:
+        results = run(args.cases, args.repeat, workdir)
+    finally:
+        shutil.rmtree(workdir)
+
+    if args.output:
+        out = dict(
+            meta=dict(
+                timestamp=datetime.now().isoformat(),
+                python=platform.python_version(),
+                platform=platform.platform(),
+                repeat=args.repeat
+            ),
+            results=results
+        )
+        with open(args.output, "w") as f:
+            json.dump(out, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for case, component, metric, base, actual in regressions:
+            print(f"REGRESSION {case}/{component}: {metric} {base:.4g} -> {actual:.4g} ({actual / base:.2f}x)")
+        if regressions:
+            sys.exit(1)
+        print("no regressions compared to baseline")
+
+
+if __name__ == "__main__":
+    logging.getLogger("androguard").setLevel(logging.ERROR)
+
+    parser = argparse.ArgumentParser(description='Benchmark the APK analysis on synthetic APKs')
+    parser.add_argument("--cases", help="Cases to run", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--repeat", help="Number of timed repetitions per component", default=5, type=int)
+    parser.add_argument("--output", help="Path to write the results to as JSON, e.g. to store a new baseline")
+    parser.add_argument("--baseline", help="Path to the JSON results to compare against")
+    parser.add_argument("--tolerance", help="Allowed relative slowdown or memory increase before reporting a regression", default=0.2, type=float)
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,323 @@
+"""
+Generates synthetic, signed APKs for benchmarking and testing the APK analysis.
+The APKs contain a binary AndroidManifest.xml, a filler payload and v1 (JAR), v2 and/or v3 signatures.
+"""
+import base64
+import hashlib
+import io
+import os
+import struct
+import zipfile
+from datetime import datetime, timedelta
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.hazmat.primitives.serialization import pkcs7
+from cryptography.x509.oid import NameOID
+
+_ANDROID_NS = "http://schemas.android.com/apk/res/android"
+
+# resource identifiers of the android attributes used in the generated manifests
+_ATTR_RESOURCE_IDS = {
+    "name": 0x01010003,
+    "label": 0x01010001,
+    "versionCode": 0x0101021b,
+    "versionName": 0x0101021c,
+    "minSdkVersion": 0x0101020c,
+    "targetSdkVersion": 0x01010270,
+    "scheme": 0x01010027,
+    "host": 0x01010028,
+    "autoVerify": 0x010104ee,
+}
+
+_RES_STRING_POOL_TYPE = 0x0001
+_RES_XML_TYPE = 0x0003
+_RES_XML_START_NAMESPACE_TYPE = 0x0100
+_RES_XML_END_NAMESPACE_TYPE = 0x0101
+_RES_XML_START_ELEMENT_TYPE = 0x0102
+_RES_XML_END_ELEMENT_TYPE = 0x0103
+_RES_XML_RESOURCE_MAP_TYPE = 0x0180
+
+_TYPE_STRING = 0x03
+_TYPE_INT_DEC = 0x10
+_TYPE_INT_BOOLEAN = 0x12
+
+_APK_SIG_BLOCK_MAGIC = b"APK Sig Block 42"
+_APK_SIG_KEY_V2 = 0x7109871a
+_APK_SIG_KEY_V3 = 0xf05368c0
+_RSA_PKCS1_SHA256 = 0x0103
+_CHUNK_SIZE = 1024 * 1024
+
+
+class Element:
+    def __init__(self, name, attrs=None, children=None):
+        """
+        Args:
+            name: str
+            attrs: list of (bool, str, value)-tuples
+                whether the attribute is in the android namespace, its name and its value (str, int or bool)
+            children: list of Element
+        """
+        self.name = name
+        self.attrs = attrs or []
+        self.children = children or []
+
+
+def manifest(pkg_name, version_code=1, version_name="1.0", min_sdk=21, target_sdk=30, permissions=10, intent_filters=10, hosts_per_filter=2):
+    """
+    Returns the element tree of an AndroidManifest.xml
+    Every intent filter is auto-verified, and declares the given number of hosts
+    """
+    activities = []
+    for i in range(intent_filters):
+        children = [
+            Element("action", [(True, "name", "android.intent.action.VIEW")]),
+            Element("category", [(True, "name", "android.intent.category.BROWSABLE")]),
+        ]
+        for j in range(hosts_per_filter):
+            children.append(Element("data", [(True, "scheme", "https"), (True, "host", f"*.h{i}-{j}.example.com")]))
+        intent_filter = Element("intent-filter", [(True, "autoVerify", True)], children)
+        activities.append(Element("activity", [(True, "name", f".Activity{i}")], [intent_filter]))
+
+    children = [Element("uses-sdk", [(True, "minSdkVersion", min_sdk), (True, "targetSdkVersion", target_sdk)])]
+    children += [Element("uses-permission", [(True, "name", f"android.permission.PERMISSION_{i}")]) for i in range(permissions)]
+    children.append(Element("application", [(True, "label", "Benchmark")], activities))
+
+    return Element("manifest", [
+        (False, "package", pkg_name),
+        (True, "versionCode", version_code),
+        (True, "versionName", version_name),
+    ], children)
+
+
+class _StringPool:
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+    def add(self, s):
+        if s not in self.index:
+            self.index[s] = len(self.strings)
+            self.strings.append(s)
+        return self.index[s]
+
+    def encode(self):
+        offsets = []
+        data = b""
+        for s in self.strings:
+            offsets.append(len(data))
+            encoded = s.encode("utf-16-le")
+            data += struct.pack("<H", len(s)) + encoded + b"\x00\x00"
+        data += b"\x00" * (-len(data) % 4)
+
+        header_size = 28
+        strings_start = header_size + 4 * len(offsets)
+        size = strings_start + len(data)
+        header = struct.pack("<HHIIIIII", _RES_STRING_POOL_TYPE, header_size, size, len(self.strings), 0, 0, strings_start, 0)
+        return header + b"".join(struct.pack("<I", o) for o in offsets) + data
+
+
+def encode_axml(root):
+    """
+    Encodes an element tree in the binary XML format of Android
+    """
+    pool = _StringPool()
+
+    # attribute names with a resource identifier come first, such that the resource map lines up with the string pool
+    attr_names = []
+
+    def collect(el):
+        for is_android, name, _ in el.attrs:
+            if is_android and name in _ATTR_RESOURCE_IDS and name not in attr_names:
+                attr_names.append(name)
+        for child in el.children:
+            collect(child)
+
+    collect(root)
+    for name in attr_names:
+        pool.add(name)
+    ns_prefix = pool.add("android")
+    ns_uri = pool.add(_ANDROID_NS)
+
+    def element_chunks(el):
+        name_idx = pool.add(el.name)
+        attrs = b""
+        for is_android, name, value in el.attrs:
+            ns = ns_uri if is_android else 0xFFFFFFFF
+            if isinstance(value, bool):
+                raw, typ, data = 0xFFFFFFFF, _TYPE_INT_BOOLEAN, 0xFFFFFFFF if value else 0
+            elif isinstance(value, int):
+                raw, typ, data = 0xFFFFFFFF, _TYPE_INT_DEC, value
+            else:
+                raw = pool.add(value)
+                typ, data = _TYPE_STRING, raw
+            attrs += struct.pack("<IIIHBBI", ns, pool.add(name), raw, 8, 0, typ, data)
+
+        start = struct.pack("<HHIIIIIHHHHHH", _RES_XML_START_ELEMENT_TYPE, 16, 36 + len(attrs), 1, 0xFFFFFFFF,
+                            0xFFFFFFFF, name_idx, 20, 20, len(el.attrs), 0, 0, 0) + attrs
+        body = b"".join(element_chunks(child) for child in el.children)
+        end = struct.pack("<HHIIIII", _RES_XML_END_ELEMENT_TYPE, 16, 24, 1, 0xFFFFFFFF, 0xFFFFFFFF, name_idx)
+        return start + body + end
+
+    elements = element_chunks(root)
+    start_ns = struct.pack("<HHIIIII", _RES_XML_START_NAMESPACE_TYPE, 16, 24, 1, 0xFFFFFFFF, ns_prefix, ns_uri)
+    end_ns = struct.pack("<HHIIIII", _RES_XML_END_NAMESPACE_TYPE, 16, 24, 1, 0xFFFFFFFF, ns_prefix, ns_uri)
+
+    resource_map = b"".join(struct.pack("<I", _ATTR_RESOURCE_IDS[name]) for name in attr_names)
+    resource_map = struct.pack("<HHI", _RES_XML_RESOURCE_MAP_TYPE, 8, 8 + len(resource_map)) + resource_map
+
+    body = pool.encode() + resource_map + start_ns + elements + end_ns
+    return struct.pack("<HHI", _RES_XML_TYPE, 8, 8 + len(body)) + body
+
+
+def generate_signer(common_name="Benchmark", key_size=2048):
+    """
+    Returns a private RSA key and a self-signed certificate
+    """
+    key = rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    now = datetime.utcnow()
+    cert = x509.CertificateBuilder() \
+        .subject_name(name) \
+        .issuer_name(name) \
+        .public_key(key.public_key()) \
+        .serial_number(x509.random_serial_number()) \
+        .not_valid_before(now - timedelta(days=1)) \
+        .not_valid_after(now + timedelta(days=365 * 25)) \
+        .sign(key, hashes.SHA256())
+    return key, cert
+
+
+def _b64_sha256(data):
+    return base64.b64encode(hashlib.sha256(data).digest()).decode()
+
+
+def _v1_signature_files(entries, key, cert):
+    """
+    Returns the files of a JAR signature (MANIFEST.MF, CERT.SF and CERT.RSA) of the given zip entries
+    """
+    mf = "Manifest-Version: 1.0\r\nCreated-By: android_market_crawler benchmarks\r\n\r\n"
+    sf_entries = ""
+    for name, data in entries:
+        section = f"Name: {name}\r\nSHA-256-Digest: {_b64_sha256(data)}\r\n\r\n"
+        mf += section
+        sf_entries += f"Name: {name}\r\nSHA-256-Digest: {_b64_sha256(section.encode())}\r\n\r\n"
+    mf = mf.encode()
+
+    sf = f"Signature-Version: 1.0\r\nCreated-By: android_market_crawler benchmarks\r\nSHA-256-Digest-Manifest: {_b64_sha256(mf)}\r\n\r\n{sf_entries}".encode()
+
+    rsa_block = pkcs7.PKCS7SignatureBuilder() \
+        .set_data(sf) \
+        .add_signer(cert, key, hashes.SHA256()) \
+        .sign(serialization.Encoding.DER, [pkcs7.PKCS7Options.DetachedSignature, pkcs7.PKCS7Options.NoAttributes])
+
+    return [
+        ("META-INF/MANIFEST.MF", mf),
+        ("META-INF/CERT.SF", sf),
+        ("META-INF/CERT.RSA", rsa_block),
+    ]
+
+
+def _lp(data):
+    """
+    Length-prefixes the data, as done throughout the APK signing block
+    """
+    return struct.pack("<I", len(data)) + data
+
+
+def _content_digest(sections):
+    """
+    Returns the chunked SHA256 digest over the given sections of the APK, as defined by the APK signature scheme v2
+    """
+    chunk_digests = []
+    for section in sections:
+        for i in range(0, len(section), _CHUNK_SIZE):
+            chunk = section[i:i + _CHUNK_SIZE]
+            chunk_digests.append(hashlib.sha256(b"\xa5" + struct.pack("<I", len(chunk)) + chunk).digest())
+    return hashlib.sha256(b"\x5a" + struct.pack("<I", len(chunk_digests)) + b"".join(chunk_digests)).digest()
+
+
+def _signer_block(scheme, digest, key, cert, min_sdk=24, max_sdk=0x7fffffff):
+    cert_der = cert.public_bytes(serialization.Encoding.DER)
+    pubkey_der = key.public_key().public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+
+    digests = _lp(_lp(struct.pack("<I", _RSA_PKCS1_SHA256) + _lp(digest)))
+    certs = _lp(_lp(cert_der))
+    if scheme == 3:
+        signed_data = digests + certs + struct.pack("<II", min_sdk, max_sdk) + _lp(b"")
+    else:
+        signed_data = digests + certs + _lp(b"")
+
+    signature = key.sign(signed_data, padding.PKCS1v15(), hashes.SHA256())
+    signatures = _lp(_lp(struct.pack("<I", _RSA_PKCS1_SHA256) + _lp(signature)))
+
+    if scheme == 3:
+        signer = _lp(signed_data) + struct.pack("<II", min_sdk, max_sdk) + signatures + _lp(pubkey_der)
+    else:
+        signer = _lp(signed_data) + signatures + _lp(pubkey_der)
+    return _lp(_lp(signer))
+
+
+def _add_signing_block(raw, schemes, key, cert):
+    """
+    Inserts an APK signing block with v2 and/or v3 signatures in front of the central directory of the zip file
+    """
+    eocd_offset = raw.rfind(b"PK\x05\x06")
+    cd_offset, = struct.unpack("<I", raw[eocd_offset + 16:eocd_offset + 20])
+    contents, cd, eocd = raw[:cd_offset], raw[cd_offset:eocd_offset], raw[eocd_offset:]
+
+    digest = _content_digest([contents, cd, eocd])
+    pairs = b""
+    for scheme in schemes:
+        block_id = _APK_SIG_KEY_V3 if scheme == 3 else _APK_SIG_KEY_V2
+        value = _signer_block(scheme, digest, key, cert)
+        pairs += struct.pack("<QI", len(value) + 4, block_id) + value
+
+    block_size = len(pairs) + 8 + 16
+    block = struct.pack("<Q", block_size) + pairs + struct.pack("<Q", block_size) + _APK_SIG_BLOCK_MAGIC
+
+    eocd = eocd[:16] + struct.pack("<I", cd_offset + len(block)) + eocd[20:]
+    return contents + block + cd + eocd
+
+
+def build_apk(path, pkg_name="com.example.benchmark", size=1024 * 1024, schemes=(1, 2, 3), signer=None, **manifest_kwargs):
+    """
+    Writes a synthetic APK to the given path
+    Args:
+        path: str
+        pkg_name: str
+        size: int
+            approximate size of the APK in bytes, padded with an incompressible payload
+        schemes: iterable of int
+            APK signature schemes to sign the APK with (1, 2 and/or 3)
+        signer: (key, cert)-tuple
+            signer of the APK, generated if not given
+        manifest_kwargs:
+            passed to 'manifest'
+    """
+    key, cert = signer or generate_signer()
+
+    manifest_xml = encode_axml(manifest(pkg_name, **manifest_kwargs))
+    entries = [
+        ("AndroidManifest.xml", manifest_xml),
+        ("classes.dex", b"dex\n035\x00" + os.urandom(1024)),
+        ("assets/payload.bin", os.urandom(max(size - len(manifest_xml), 0))),
+    ]
+    if 1 in schemes:
+        entries += _v1_signature_files(entries, key, cert)
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in entries:
+            compression = zipfile.ZIP_STORED if name == "assets/payload.bin" else zipfile.ZIP_DEFLATED
+            zf.writestr(name, data, compress_type=compression)
+    raw = buf.getvalue()
+
+    v2_v3 = [scheme for scheme in schemes if scheme in (2, 3)]
+    if v2_v3:
+        raw = _add_signing_block(raw, v2_v3, key, cert)
+
+    with open(path, "wb") as f:
+        f.write(raw)
+    return path
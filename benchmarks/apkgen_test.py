@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks.apkgen import build_apk, generate_signer
+from crawler.pipelines.analyze_apks import analyse
+
+
+class TestApkgen(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.signer = generate_signer()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_build_apk(self):
+        path = os.path.join(self.tmpdir, "test.apk")
+        build_apk(path, pkg_name="com.example.test", size=1024, signer=self.signer, permissions=2, intent_filters=1, hosts_per_filter=1)
+        analysis = analyse(path)
+
+        self.assertEqual(analysis['pkg_name'], "com.example.test")
+        self.assertEqual(len(analysis['permissions']['uses']), 2)
+        self.assertEqual(analysis['assetlink_domains'], {"h0-0.example.com": None})
+        for scheme in ["v1", "v2", "v3"]:
+            self.assertEqual(len(analysis['certs'][scheme]), 1)
+            self.assertEqual(len(analysis['signers'][scheme]), 1)
+
+    def test_schemes(self):
+        path = os.path.join(self.tmpdir, "test.apk")
+        build_apk(path, size=1024, schemes=(2,), signer=self.signer)
+        analysis = analyse(path)
+
+        self.assertEqual(len(analysis['signers']['v1']), 0)
+        self.assertEqual(len(analysis['signers']['v2']), 1)
+        self.assertEqual(len(analysis['signers']['v3']), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+Benchmarks the request dupefilters for crawls of many millions of requests.
+Compares Scrapy's RFPDupeFilter, which keeps all fingerprints in memory, with crawler.dupefilter.BloomDupeFilter,
+which keeps them on disk and only a Bloom filter in memory. Every dupefilter runs in a fresh interpreter with its own JOBDIR,
+and sees 'count' unique fingerprints, of which every tenth is requested twice.
+Reports the throughput, peak memory (max RSS), size of the JOBDIR, and the time to reopen the JOBDIR (i.e. resume the crawl).
+
+Example:
+    $ python benchmarks/dupefilter.py --count 50000000 --jobdir /data/bench
+    $ python benchmarks/dupefilter.py --count 1000000 --filters bloom --output dupefilter.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+_FILTERS = {
+    "scrapy": "scrapy.dupefilters.RFPDupeFilter",
+    "bloom": "crawler.dupefilter.BloomDupeFilter"
+}
+
+_PROBE = """
+import hashlib, json, resource, sys, time
+sys.path.append('.')
+from scrapy.utils.misc import load_object
+
+class Fingerprinter:
+    # the 'requests' are fingerprints already
+    def fingerprint(self, request):
+        return request
+
+path, jobdir, count = sys.argv[1], sys.argv[2], int(sys.argv[3])
+cls = load_object(path)
+fingerprinter = Fingerprinter()
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+start = time.perf_counter()
+df = cls(jobdir, fingerprinter=fingerprinter)
+duplicates = 0
+for i in range(count):
+    fp = hashlib.sha1(i.to_bytes(8, 'little')).digest()
+    duplicates += df.request_seen(fp)
+    if i % 10 == 0:
+        duplicates += df.request_seen(fp)
+df.close('finished')
+seconds = time.perf_counter() - start
+max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+start = time.perf_counter()
+df = cls(jobdir, fingerprinter=fingerprinter)
+reopen_seconds = time.perf_counter() - start
+df.close('finished')
+
+print(json.dumps(dict(
+    seconds=seconds,
+    max_rss_mb=max_rss_mb - rss_before,
+    reopen_seconds=reopen_seconds,
+    duplicates=duplicates
+)))
+"""
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def measure(name, count, jobdir):
+    """
+    Returns the throughput, peak memory and disk usage of the dupefilter for 'count' unique fingerprints
+    """
+    path = os.path.join(jobdir, name)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    out = subprocess.run([sys.executable, "-c", _PROBE, _FILTERS[name], path, str(count)], check=True, capture_output=True, text=True).stdout
+    res = json.loads(out.strip().splitlines()[-1])
+    res["requests_per_second"] = (count + (count + 9) // 10) / res["seconds"]
+    res["disk_mb"] = _dir_size(path) / 2 ** 20
+    shutil.rmtree(path, ignore_errors=True)
+    return res
+
+
+def main(args):
+    jobdir = args.jobdir or tempfile.mkdtemp(prefix="dupefilter-benchmark-")
+    results = {}
+    try:
+        for name in args.filters:
+            results[name] = res = measure(name, args.count, jobdir)
+            print(f"{name:<8} {res['requests_per_second']:>10.0f} requests/s {res['max_rss_mb']:>8.0f} MB memory "
+                  f"{res['disk_mb']:>8.0f} MB disk {res['reopen_seconds']:>6.1f} s reopen")
+            assert res["duplicates"] == (args.count + 9) // 10, f"{name} filtered {res['duplicates']} requests"
+    finally:
+        if not args.jobdir:
+            shutil.rmtree(jobdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(dict(count=args.count, results=results), f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the memory and throughput of request dupefilters')
+    parser.add_argument("--count", help="Number of unique request fingerprints", default=50000000, type=int)
+    parser.add_argument("--filters", help="Dupefilters to benchmark", nargs="+", choices=list(_FILTERS), default=list(_FILTERS))
+    parser.add_argument("--jobdir", help="Directory for the JOBDIRs of the dupefilters, defaults to a temporary directory")
+    parser.add_argument("--output", help="Path to write the results to as JSON")
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,150 @@
+"""
+Microbenchmark of the proxy pool.
+Simulates a crawl at a fixed request rate on a simulated clock, in which a fraction of the requests gets rate limited
+and backs off its proxy, and measures the CPU time spent in the pool per request.
+
+With '--mixed', simulates a proxy list of mixed quality instead, and compares the latency and failure rate of requests
+with and without health-weighted proxy selection.
+
+Example:
+    $ python benchmarks/proxy_pool.py --proxies 10000 --rate 1000
+    $ python benchmarks/proxy_pool.py --proxies 1000 --rate 100 --mixed
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+from twisted.internet.task import Clock
+
+sys.path.append(os.path.abspath('.'))
+from crawler.util import BackoffProxyPool, TestCrawler
+
+
+def _proxies(n):
+    return [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}:8080" for i in range(n)]
+
+
+def run(nproxies, rate, duration, backoff_ratio, max_backoff):
+    clock = Clock()
+    clock.advance(time.time())
+    pool = BackoffProxyPool(TestCrawler(), _proxies(nproxies), clock=clock)
+
+    acquired = []
+    waited = 0
+    get_time = 0
+    backoff_time = 0
+    backoffs = 0
+    for second in range(duration):
+        for i in range(rate):
+            clock.advance(1 / rate)
+
+            start = time.perf_counter()
+            d = pool.get_proxy()
+            get_time += time.perf_counter() - start
+
+            d.addCallback(acquired.append)
+            if not d.called:
+                waited += 1
+
+            if acquired and random.random() < backoff_ratio:
+                start = time.perf_counter()
+                pool.backoff(acquired[-1], seconds=random.uniform(1, max_backoff))
+                backoff_time += time.perf_counter() - start
+                backoffs += 1
+
+    requests = rate * duration
+    return dict(
+        requests=requests,
+        waited=waited,
+        backoffs=backoffs,
+        blocked_at_end=nproxies - len(pool._available_proxies()),
+        get_proxy_us=get_time / requests * 1e6,
+        backoff_us=backoff_time / max(backoffs, 1) * 1e6,
+        cpu_share=(get_time + backoff_time) / duration
+    )
+
+
+# (share of proxies, median latency in seconds, failure probability)
+_QUALITIES = [
+    (0.7, 0.3, 0.01),  # good
+    (0.2, 3, 0.02),  # slow
+    (0.1, 0.5, 0.4),  # flaky
+]
+
+
+def run_mixed(nproxies, rate, duration, health_params):
+    clock = Clock()
+    clock.advance(time.time())
+    proxies = _proxies(nproxies)
+    pool = BackoffProxyPool(TestCrawler(), proxies, clock=clock, health_params=health_params)
+
+    qualities = {}
+    for proxy in proxies:
+        r = random.random()
+        for share, latency, failure in _QUALITIES:
+            qualities[proxy] = (latency, failure)
+            r -= share
+            if r < 0:
+                break
+
+    latencies = []
+    failures = 0
+    for i in range(rate * duration):
+        clock.advance(1 / rate)
+        proxy = []
+        pool.get_proxy().addCallback(proxy.append)
+        if not proxy:
+            continue
+        median, failure = qualities[proxy[0]]
+        latency = random.lognormvariate(0, 0.5) * median
+        error = random.random() < failure
+        pool.record(proxy[0], latency, error=error)
+        latencies.append(latency)
+        failures += error
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return dict(
+        requests=len(latencies),
+        p50_s=quantiles[49],
+        p99_s=quantiles[98],
+        failure_rate=failures / len(latencies)
+    )
+
+
+def main_mixed(args):
+    print(f"{args.proxies} proxies of mixed quality, {args.rate} requests/s for {args.duration} simulated seconds")
+    for name, health_params in [("random", {"enabled": False}), ("health-weighted", {})]:
+        random.seed(args.seed)
+        res = run_mixed(args.proxies, args.rate, args.duration, health_params)
+        print(f"  {name:<16} p50 {res['p50_s']:.2f}s, p99 {res['p99_s']:.2f}s, failed {res['failure_rate'] * 100:.2f}% of {res['requests']} requests")
+
+
+def main(args):
+    random.seed(args.seed)
+    res = run(args.proxies, args.rate, args.duration, args.backoff_ratio, args.max_backoff)
+    print(f"{args.proxies} proxies, {args.rate} requests/s for {args.duration} simulated seconds")
+    print(f"  requests:          {res['requests']} ({res['waited']} waited for a proxy)")
+    print(f"  backoffs:          {res['backoffs']} ({res['blocked_at_end']} proxies blocked at the end)")
+    print(f"  get_proxy:         {res['get_proxy_us']:.2f} us/request")
+    print(f"  backoff:           {res['backoff_us']:.2f} us/backoff")
+    print(f"  CPU share of pool: {res['cpu_share'] * 100:.2f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Microbenchmark of the proxy pool')
+    parser.add_argument("--proxies", help="Number of proxies", default=10000, type=int)
+    parser.add_argument("--rate", help="Number of requests per second", default=1000, type=int)
+    parser.add_argument("--duration", help="Number of simulated seconds", default=60, type=int)
+    parser.add_argument("--backoff_ratio", help="Fraction of requests that backs off its proxy", default=0.05, type=float)
+    parser.add_argument("--max_backoff", help="Maximum backoff time in seconds", default=600, type=float)
+    parser.add_argument("--mixed", help="Compare random and health-weighted selection on proxies of mixed quality", action="store_true")
+    parser.add_argument("--seed", default=0, type=int)
+    args = parser.parse_args()
+
+    if args.mixed:
+        main_mixed(args)
+    else:
+        main(args)
@@ -0,0 +1,140 @@
+"""
+Benchmarks the disk queues of the scheduler, which hold the requests of a crawl in the JOBDIR.
+Compares Scrapy's pickle queue with crawler.squeues.MsgpackLifoDiskQueue on requests like those of the crawler:
+every item (app meta and a number of versions) is carried in the meta of several requests, e.g. to download its APKs and icon.
+Reports the enqueue and dequeue throughput, and the size of the queue on disk.
+
+Example:
+    $ python benchmarks/squeues.py
+    $ python benchmarks/squeues.py --items 10000 --versions 20 --output squeues.json
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from scrapy import Request, Spider
+from scrapy.utils.misc import load_object
+from scrapy.utils.test import get_crawler
+
+sys.path.append('.')
+
+_QUEUES = {
+    "pickle": "scrapy.squeues.PickleLifoDiskQueue",
+    "msgpack": "crawler.squeues.MsgpackLifoDiskQueue"
+}
+
+
+class BenchmarkSpider(Spider):
+    name = "benchmark"
+
+    def parse_download(self, response):
+        pass
+
+
+def _item(i, versions):
+    return {
+        'meta': {
+            'pkg_name': f'com.example.app{i}',
+            'app_name': f'Example app {i}',
+            'app_description': 'An example app to benchmark the disk queues. ' * 20,
+            'developer_name': 'Example developer',
+            'developer_email': 'developer@example.com',
+            'categories': ['Tools', 'Productivity'],
+            'downloads': '1,000,000+',
+            'user_rating': 4.5,
+            'icon_url': f'https://example.com/icons/{i}.png',
+            '__pkg_start_time': datetime.datetime.now()
+        },
+        'versions': {
+            f'1.{v}': {
+                'timestamp': datetime.datetime(2022, 1, 1) + datetime.timedelta(days=v),
+                'download_url': f'https://example.com/apks/{i}/{v}.apk',
+                'file_size': 10000000 + v
+            } for v in range(versions)
+        }
+    }
+
+
+def _requests(spider, items, versions, requests_per_item):
+    for i in range(items):
+        item = _item(i, versions)
+        for j in range(requests_per_item):
+            yield Request(
+                f"https://example.com/apks/{i}/{j}.apk",
+                callback=spider.parse_download,
+                headers={"User-Agent": "Mozilla/5.0 (Linux; Android 12)"},
+                meta={"item": item, "download_timeout": 120, "depth": 1, "proxy": "http://127.0.0.1:8080"}
+            )
+
+
+def _size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def measure(name, args, jobdir):
+    """
+    Returns the enqueue and dequeue throughput and the size on disk of the queue
+    """
+    crawler = get_crawler(BenchmarkSpider, {"DISK_QUEUE_PARAMS": {"payload_threshold": args.payload_threshold}})
+    crawler.spider = spider = BenchmarkSpider()
+    path = os.path.join(jobdir, name, "p0")
+    queue_cls = load_object(_QUEUES[name])
+    requests = list(_requests(spider, args.items, args.versions, args.requests_per_item))
+
+    q = queue_cls.from_crawler(crawler, path)
+    start = time.perf_counter()
+    for request in requests:
+        q.push(request)
+    q.close()
+    enqueue_seconds = time.perf_counter() - start
+    size = sum(_size(os.path.join(jobdir, name, f)) for f in os.listdir(os.path.join(jobdir, name)))
+
+    q = queue_cls.from_crawler(crawler, path)
+    start = time.perf_counter()
+    while q.pop():
+        pass
+    q.close()
+    dequeue_seconds = time.perf_counter() - start
+
+    return dict(
+        enqueue_per_second=len(requests) / enqueue_seconds,
+        dequeue_per_second=len(requests) / dequeue_seconds,
+        disk_mb=size / 2 ** 20,
+        bytes_per_request=size / len(requests)
+    )
+
+
+def main(args):
+    jobdir = tempfile.mkdtemp(prefix="squeues-benchmark-")
+    results = {}
+    try:
+        for name in args.queues:
+            results[name] = res = measure(name, args, jobdir)
+            print(f"{name:<8} {res['enqueue_per_second']:>8.0f} enqueues/s {res['dequeue_per_second']:>8.0f} dequeues/s "
+                  f"{res['disk_mb']:>8.1f} MB disk {res['bytes_per_request']:>8.0f} bytes/request")
+    finally:
+        shutil.rmtree(jobdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(dict(vars(args), results=results), f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the throughput and size of the disk queues of requests')
+    parser.add_argument("--items", help="Number of items", default=20000, type=int)
+    parser.add_argument("--versions", help="Number of versions per item", default=10, type=int)
+    parser.add_argument("--requests_per_item", help="Number of queued requests that carry an item", default=3, type=int)
+    parser.add_argument("--payload_threshold", help="Size above which meta values are stored out of line", default=1024, type=int)
+    parser.add_argument("--queues", help="Queues to benchmark", nargs="+", choices=list(_QUEUES), default=list(_QUEUES))
+    parser.add_argument("--output", help="Path to write the results to as JSON")
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,94 @@
+"""
+Benchmarks the startup of a spider process, as launched by scripts/run_all.sh for every market.
+Measures the time and peak memory (max RSS) of importing the spider and all components (pipelines, middlewares and extensions)
+that are enabled in its settings, each in a fresh interpreter.
+
+Example:
+    $ python benchmarks/startup.py --config config/config.template.yml
+    $ python benchmarks/startup.py --config config/config.template.yml --spiders fdroid googleplay --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+_PROBE = """
+import argparse, json, resource, sys, time
+start = time.perf_counter()
+sys.path.append('.')
+import yaml
+from scrapy.utils.misc import load_object
+from scripts import run_spider
+
+name, config_path = sys.argv[1], sys.argv[2]
+with open(config_path) as f:
+    config = yaml.safe_load(f)
+run_spider.args = argparse.Namespace(user_agents_file='config/user_agents.txt', proxies_file='config/proxies.txt')
+spider = run_spider.spider_by_name(name)
+settings = run_spider.get_settings(config, name, '/tmp')
+missing = []
+for key in ['ITEM_PIPELINES', 'DOWNLOADER_MIDDLEWARES', 'SPIDER_MIDDLEWARES', 'EXTENSIONS']:
+    for path, priority in settings[key].items():
+        if priority is None:
+            continue
+        try:
+            load_object(path)
+        except ImportError:
+            missing.append(path)
+print(json.dumps(dict(
+    seconds=time.perf_counter() - start,
+    max_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    modules=len(sys.modules),
+    missing=missing
+)))
+"""
+
+
+def measure(name, config, repeat):
+    """
+    Returns the median startup time and peak memory of the spider over 'repeat' fresh interpreters
+    """
+    runs = []
+    for i in range(repeat):
+        out = subprocess.run([sys.executable, "-c", _PROBE, name, config], check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    return dict(
+        seconds=statistics.median(r['seconds'] for r in runs),
+        max_rss_mb=statistics.median(r['max_rss_mb'] for r in runs),
+        modules=runs[-1]['modules'],
+        missing=runs[-1]['missing']
+    )
+
+
+def main(args):
+    with open(args.spider_list) as f:
+        spiders = args.spiders or [l.strip() for l in f if l.strip()]
+
+    results = {}
+    for name in spiders:
+        try:
+            results[name] = res = measure(name, args.config, args.repeat)
+        except subprocess.CalledProcessError as e:
+            print(f"{name:<12} failed: {e.stderr.strip().splitlines()[-1]}")
+            continue
+        print(f"{name:<12} {res['seconds'] * 1000:>8.0f} ms {res['max_rss_mb']:>8.1f} MB {res['modules']:>6} modules")
+        for path in res['missing']:
+            print(f"  not installed: {path}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the startup time and memory of spider processes')
+    parser.add_argument("--config", help="Path to YAML configuration file", default=os.path.join("config", "config.template.yml"))
+    parser.add_argument("--spider_list", help="File with the names of the spiders to benchmark", default=os.path.join("config", "spider_list.txt"))
+    parser.add_argument("--spiders", help="Names of spiders to benchmark (overrides the spider list)", nargs="+")
+    parser.add_argument("--repeat", help="Number of fresh interpreters per spider", default=5, type=int)
+    parser.add_argument("--output", help="Path to write the results to as JSON")
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,166 @@
+import itertools
+import json
+import logging
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from crawler.pipelines.analyze_apks import analyse, outdated_components
+
+logger = logging.getLogger(__name__)
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path != "/analyse":
+            self.send_error(404)
+            return
+
+        try:
+            content_len = int(self.headers['content-length'])
+            job = json.loads(self.rfile.read(content_len).decode())
+            future = self.server.analysis_server.submit(
+                job['sha256'],
+                job['path'],
+                analysis=job.get('analysis', None),
+                priority=job.get('priority', 0)
+            )
+            analysis = future.result()
+        except (KeyError, ValueError):
+            self.send_error(400)
+            return
+        except Exception:
+            self.send_error(500)
+            return
+
+        self._send_json(analysis)
+
+    def do_GET(self):
+        if self.path != "/stats":
+            self.send_error(404)
+            return
+        self._send_json(self.server.analysis_server.stats())
+
+    def _send_json(self, body_raw):
+        body = bytes(json.dumps(body_raw), "utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class AnalysisServer:
+    """
+    Local service that analyses APKs on behalf of all spider processes on a node.
+    Jobs are queued by priority (higher first, FIFO within a priority) and executed by a single, global pool of worker processes.
+    Analyses are cached by the SHA256 of the APK, and concurrent jobs for the same APK are merged.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, workers=None, cache_size=10000, analyse_func=analyse):
+        self.host = host
+        self.port = port
+        self.cache_size = cache_size
+        self.analyse_func = analyse_func
+
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self.workers = self.pool._max_workers
+
+        self.jobs = queue.PriorityQueue()
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+
+        # one dispatcher per worker process, such that the pool never holds more jobs than it can execute,
+        # and queued jobs are handed out in order of priority
+        for i in range(self.workers):
+            t = threading.Thread(target=self._dispatch, daemon=True)
+            t.start()
+
+    def submit(self, sha, path, analysis=None, priority=0):
+        """
+        Schedules the analysis of the APK with the given SHA256 at the given path
+        Args:
+            sha: str
+            path: str
+            analysis: dict
+                existing analysis of which only the missing or outdated components are computed
+            priority: int
+                higher priorities are analysed first
+
+        Returns: concurrent.futures.Future
+            resolves to the analysis
+        """
+        with self.lock:
+            cached = self.cache.get(sha, None)
+            if cached is not None and not outdated_components(cached):
+                self.cache.move_to_end(sha)
+                self.hits += 1
+                future = Future()
+                future.set_result(dict(cached, path=path))
+                return future
+
+            future = self.inflight.get(sha, None)
+            if future:
+                self.hits += 1
+                return future
+
+            self.misses += 1
+            future = Future()
+            self.inflight[sha] = future
+            self.jobs.put((-priority, next(self.counter), sha, path, analysis, future))
+            return future
+
+    def _dispatch(self):
+        while True:
+            _, _, sha, path, analysis, future = self.jobs.get()
+            try:
+                res = self.pool.submit(self.analyse_func, path, analysis).result()
+            except Exception as e:
+                logger.warning(f"failed to analyse '{path}': {e}")
+                with self.lock:
+                    del self.inflight[sha]
+                future.set_exception(e)
+                continue
+
+            with self.lock:
+                # only cache analyses of APKs that could be parsed
+                if len(res) > 1:
+                    self.cache[sha] = res
+                    if len(self.cache) > self.cache_size:
+                        self.cache.popitem(last=False)
+                del self.inflight[sha]
+            future.set_result(res)
+
+    def stats(self):
+        with self.lock:
+            return dict(
+                workers=self.workers,
+                queued=self.jobs.qsize(),
+                inflight=len(self.inflight),
+                cached=len(self.cache),
+                hits=self.hits,
+                misses=self.misses
+            )
+
+    def start(self):
+        with ThreadingHTTPServer((self.host, self.port), Handler) as server:
+            server.daemon_threads = True
+            server.analysis_server = self
+            self.port = server.server_address[1]
+            print(f"serving APK analyses at {self.host}:{self.port} with {self.workers} workers")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                print("Received SIGINT, shutting down gracefully")
+            finally:
+                self.pool.shutdown(wait=False)
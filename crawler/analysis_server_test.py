@@ -0,0 +1,76 @@
+import json
+import threading
+import time
+import unittest
+from urllib.request import urlopen, Request
+
+from crawler.analysis_server import AnalysisServer
+from crawler.pipelines.analyze_apks import _COMPONENTS
+
+
+def _fake_analyse(path, analysis=None):
+    time.sleep(0.05)
+    res = {name: path for name in _COMPONENTS}
+    res['path'] = path
+    res['component_versions'] = {name: version for name, (version, _) in _COMPONENTS.items()}
+    return res
+
+
+class TestAnalysisServer(unittest.TestCase):
+    def test_submit(self):
+        server = AnalysisServer(workers=1, analyse_func=_fake_analyse)
+
+        # concurrent jobs for the same APK are merged
+        f1 = server.submit("sha1", "/apks/sha1.apk")
+        f2 = server.submit("sha1", "/apks/sha1.apk")
+        self.assertIs(f1, f2)
+        self.assertEqual(f1.result()['pkg_name'], "/apks/sha1.apk")
+
+        # cached by SHA, but with the requested path
+        f3 = server.submit("sha1", "/other/path.apk")
+        self.assertTrue(f3.done())
+        self.assertEqual(f3.result()['path'], "/other/path.apk")
+        self.assertEqual(f3.result()['pkg_name'], "/apks/sha1.apk")
+
+        stats = server.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 2)
+
+    def test_priority(self):
+        server = AnalysisServer(workers=1, analyse_func=_fake_analyse)
+
+        # occupy the single worker, such that subsequent jobs are queued
+        blocker = server.submit("blocker", "blocker")
+        time.sleep(0.01)
+
+        done = []
+        futures = [
+            server.submit("low", "low", priority=0),
+            server.submit("high", "high", priority=10),
+        ]
+        for f in futures:
+            f.add_done_callback(lambda f: done.append(f.result()['path']))
+        for f in [blocker] + futures:
+            f.result()
+        self.assertEqual(done, ["high", "low"])
+
+    def test_http(self):
+        server = AnalysisServer(port=0, workers=1, analyse_func=_fake_analyse)
+        t = threading.Thread(target=server.start, daemon=True)
+        t.start()
+        while not server.port:
+            time.sleep(0.01)
+
+        body = json.dumps({"sha256": "sha1", "path": "/apks/sha1.apk"}).encode()
+        req = Request(f"http://127.0.0.1:{server.port}/analyse", data=body, method="POST")
+        with urlopen(req) as resp:
+            analysis = json.loads(resp.read())
+        self.assertEqual(analysis['path'], "/apks/sha1.apk")
+
+        with urlopen(f"http://127.0.0.1:{server.port}/stats") as resp:
+            stats = json.loads(resp.read())
+        self.assertEqual(stats['cached'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    Set of strings (or bytes) in a fixed amount of memory, at the cost of false positives:
+    'key in bloom' is always True for added keys, and True for a fraction 'error_rate' of other keys, as long as at most 'capacity' keys are added.
+    Uses ~1.2 bytes per key of capacity for an error rate of 1%, and ~1.8 bytes for 0.1%.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.nbits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.nhashes = max(1, round(self.nbits / capacity * math.log(2)))
+        self.bits = bytearray((self.nbits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # double hashing: the i-th position is h1 + i * h2
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.nbits for i in range(self.nhashes)]
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def add(self, key):
+        """
+        Adds the key to the filter
+        Returns: bool
+            whether the key was (probably) in the filter already
+        """
+        seen = True
+        for pos in self._positions(key):
+            mask = 1 << (pos & 7)
+            if not self.bits[pos >> 3] & mask:
+                self.bits[pos >> 3] |= mask
+                seen = False
+        if not seen:
+            self.count += 1
+        return seen
+
+    def __len__(self):
+        return self.count
+
+    def get_state(self):
+        return dict(capacity=self.capacity, error_rate=self.error_rate, bits=bytes(self.bits), count=self.count)
+
+    @classmethod
+    def from_state(cls, state):
+        bloom = cls(state["capacity"], error_rate=state["error_rate"])
+        bloom.bits = bytearray(state["bits"])
+        bloom.count = state["count"]
+        return bloom
+
+
+class ScalableBloomFilter:
+    """
+    Bloom filter that grows with the number of keys, while keeping the overall error rate below 'error_rate' (Almeida et al., 2007).
+    When the current filter is full, a filter with 'growth' times its capacity and a 'tightening' times lower error rate is added,
+    such that the error rates of the filters sum to at most 'error_rate'.
+    """
+
+    def __init__(self, initial_capacity=1000000, error_rate=0.001, growth=2, tightening=0.5):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.filters = []
+        self._add_filter()
+
+    def _add_filter(self):
+        i = len(self.filters)
+        capacity = self.initial_capacity * self.growth ** i
+        error_rate = self.error_rate * (1 - self.tightening) * self.tightening ** i
+        self.filters.append(BloomFilter(capacity, error_rate=error_rate))
+
+    def __contains__(self, key):
+        return any(key in f for f in reversed(self.filters))
+
+    def add(self, key):
+        """
+        Adds the key to the filter
+        Returns: bool
+            whether the key was (probably) in the filter already
+        """
+        if key in self:
+            return True
+        if len(self.filters[-1]) >= self.filters[-1].capacity:
+            self._add_filter()
+        self.filters[-1].add(key)
+        return False
+
+    def __len__(self):
+        return sum(len(f) for f in self.filters)
+
+    @property
+    def nbytes(self):
+        return sum(len(f.bits) for f in self.filters)
+
+    def get_state(self):
+        return dict(
+            initial_capacity=self.initial_capacity,
+            error_rate=self.error_rate,
+            growth=self.growth,
+            tightening=self.tightening,
+            filters=[f.get_state() for f in self.filters]
+        )
+
+    @classmethod
+    def from_state(cls, state):
+        bloom = cls(state["initial_capacity"], error_rate=state["error_rate"], growth=state["growth"], tightening=state["tightening"])
+        bloom.filters = [BloomFilter.from_state(f) for f in state["filters"]]
+        return bloom
@@ -0,0 +1,54 @@
+import unittest
+
+from crawler.bloom import BloomFilter, ScalableBloomFilter
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_membership(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        self.assertFalse(bloom.add("com.example"))
+        self.assertTrue(bloom.add("com.example"))
+        self.assertIn("com.example", bloom)
+        self.assertNotIn("com.other", bloom)
+        self.assertEqual(len(bloom), 1)
+
+    def test_error_rate(self):
+        bloom = BloomFilter(10000, error_rate=0.01)
+        for i in range(10000):
+            bloom.add(f"com.example.app{i}")
+        self.assertTrue(all(f"com.example.app{i}" in bloom for i in range(10000)))
+
+        false_positives = sum(f"org.other.app{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 200)
+
+    def test_state(self):
+        bloom = BloomFilter(100)
+        bloom.add("com.example")
+        restored = BloomFilter.from_state(bloom.get_state())
+        self.assertIn("com.example", restored)
+        self.assertEqual(len(restored), 1)
+
+
+class TestScalableBloomFilter(unittest.TestCase):
+    def test_growth(self):
+        bloom = ScalableBloomFilter(1000, error_rate=0.01)
+        seen = sum(bloom.add(f"com.example.app{i}".encode()) for i in range(10000))
+        self.assertLess(seen, 200)
+        self.assertTrue(all(f"com.example.app{i}".encode() in bloom for i in range(10000)))
+        # 1000 + 2000 + 4000 + 8000 keys
+        self.assertEqual(len(bloom.filters), 4)
+
+        false_positives = sum(f"org.other.app{i}".encode() in bloom for i in range(10000))
+        self.assertLess(false_positives, 200)
+
+    def test_state(self):
+        bloom = ScalableBloomFilter(10)
+        for i in range(100):
+            bloom.add(f"com.example.app{i}")
+        restored = ScalableBloomFilter.from_state(bloom.get_state())
+        self.assertEqual(len(restored.filters), len(bloom.filters))
+        self.assertTrue(all(f"com.example.app{i}" in restored for i in range(100)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import logging
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.utils.job import job_dir
+
+from crawler.bloom import ScalableBloomFilter
+
+logger = logging.getLogger(__name__)
+
+# the first 16 bytes of the (SHA1) request fingerprint, which are as unique as the full fingerprint in practice
+_FINGERPRINT_SIZE = 16
+
+
+class BloomDupeFilter(RFPDupeFilter):
+    """
+    Request dupefilter of bounded memory, for crawls of many millions of requests.
+    Scrapy's RFPDupeFilter keeps the hex fingerprints of all requests in a set (~100 bytes per request),
+    whereas this filter keeps them on disk, in an SQLite table in the JOBDIR, and in memory only a scalable Bloom filter (~2 bytes per request).
+
+    A request that is not in the Bloom filter is new, as a Bloom filter has no false negatives.
+    A request that is in the Bloom filter is looked up on disk, such that false positives of the Bloom filter do not drop new requests,
+    i.e. requests are filtered exactly like RFPDupeFilter does.
+
+    The Bloom filter is saved to the JOBDIR when the spider closes, and rebuilt from the table if a crawl did not close cleanly.
+    The fingerprints of a JOBDIR of RFPDupeFilter ('requests.seen') are imported when the filter is first used in that JOBDIR.
+    Without a JOBDIR, the fingerprints are kept in a temporary directory that is removed when the spider closes.
+
+    Enable it by setting DUPEFILTER_CLASS to 'crawler.dupefilter.BloomDupeFilter', configured by DUPEFILTER_PARAMS:
+        initial_capacity: number of requests of the first Bloom filter, which grows by adding larger filters
+        error_rate: fraction of new requests that is looked up on disk
+        commit_interval: number of new requests after which the fingerprints are committed to disk
+    """
+    db_filename = "requests.seen.db"
+    bloom_filename = "requests.seen.bloom"
+
+    def __init__(self, path=None, debug=False, *, fingerprinter=None, initial_capacity=10000000, error_rate=0.001, commit_interval=10000):
+        # without a path, RFPDupeFilter neither reads nor writes 'requests.seen'
+        super().__init__(None, debug, fingerprinter=fingerprinter)
+        self.commit_interval = commit_interval
+        self.tmpdir = None
+        if not path:
+            self.tmpdir = path = tempfile.mkdtemp(prefix="dupefilter-")
+        self.db_path = os.path.join(path, self.db_filename)
+        self.bloom_path = os.path.join(path, self.bloom_filename)
+
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # a crash loses at most the uncommitted fingerprints, which are requested again
+        self.conn.execute("PRAGMA cache_size=-65536")  # 64 MB, keeps the inner pages of the index in memory
+        self.conn.execute("CREATE TABLE IF NOT EXISTS fingerprints (fp BLOB PRIMARY KEY) WITHOUT ROWID")
+        self.conn.commit()
+        self._uncommitted = 0
+        self.lookups = 0
+        self.false_positives = 0
+
+        self.bloom = self._load_bloom()
+        if self.bloom is None:
+            self.bloom = ScalableBloomFilter(initial_capacity, error_rate=error_rate)
+            self._import_requests_seen(path)
+            self._rebuild_bloom()
+
+    @classmethod
+    def from_settings(cls, settings, *, fingerprinter=None):
+        params = settings.getdict("DUPEFILTER_PARAMS")
+        return cls(
+            job_dir(settings),
+            settings.getbool("DUPEFILTER_DEBUG"),
+            fingerprinter=fingerprinter,
+            initial_capacity=params.get("initial_capacity", 10000000),
+            error_rate=params.get("error_rate", 0.001),
+            commit_interval=params.get("commit_interval", 10000)
+        )
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls.from_settings(crawler.settings, fingerprinter=crawler.request_fingerprinter)
+
+    def _load_bloom(self):
+        """
+        Returns the Bloom filter saved by the previous run, or None if the previous run did not close cleanly
+        """
+        if not os.path.exists(self.bloom_path):
+            return None
+        try:
+            with open(self.bloom_path, "rb") as f:
+                bloom = ScalableBloomFilter.from_state(pickle.load(f))
+        except Exception as e:
+            logger.warning(f"failed to load the Bloom filter from '{self.bloom_path}': {e}")
+            bloom = None
+        # the saved filter is only valid until new fingerprints are added
+        os.remove(self.bloom_path)
+        return bloom
+
+    def _import_requests_seen(self, path):
+        """
+        Imports the hex fingerprints of a JOBDIR of RFPDupeFilter
+        """
+        seen_path = os.path.join(path, "requests.seen")
+        if not os.path.exists(seen_path):
+            return
+        logger.info(f"importing request fingerprints from '{seen_path}'")
+        with open(seen_path) as f:
+            fps = (bytes.fromhex(line.strip())[:_FINGERPRINT_SIZE] for line in f if line.strip())
+            self.conn.executemany("INSERT OR IGNORE INTO fingerprints VALUES (?)", ((fp,) for fp in fps))
+        self.conn.commit()
+        os.rename(seen_path, f"{seen_path}.imported")
+
+    def _rebuild_bloom(self):
+        count = 0
+        for (fp,) in self.conn.execute("SELECT fp FROM fingerprints"):
+            self.bloom.add(fp)
+            count += 1
+        if count:
+            logger.info(f"rebuilt the Bloom filter of {count} request fingerprints from '{self.db_path}'")
+
+    def request_seen(self, request):
+        fp = self.fingerprinter.fingerprint(request)[:_FINGERPRINT_SIZE]
+        if self.bloom.add(fp):
+            self.lookups += 1
+            if self.conn.execute("SELECT 1 FROM fingerprints WHERE fp = ?", (fp,)).fetchone():
+                return True
+            self.false_positives += 1
+        self.conn.execute("INSERT INTO fingerprints VALUES (?)", (fp,))
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_interval:
+            self.conn.commit()
+            self._uncommitted = 0
+        return False
+
+    def close(self, reason):
+        self.conn.commit()
+        self.conn.close()
+        logger.info(f"{len(self.bloom)} request fingerprints in a Bloom filter of {self.bloom.nbytes / 2 ** 20:.1f} MB, "
+                    f"{self.false_positives} of {self.lookups} lookups on disk were false positives")
+        if self.tmpdir:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+            return
+        tmp_path = f"{self.bloom_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self.bloom.get_state(), f, protocol=4)
+        os.replace(tmp_path, self.bloom_path)
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+
+from scrapy import Request
+from scrapy.utils.request import RequestFingerprinter
+
+from crawler.dupefilter import BloomDupeFilter
+
+
+class TestBloomDupeFilter(unittest.TestCase):
+    def setUp(self):
+        self.jobdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.jobdir.cleanup()
+
+    def _dupefilter(self, **kwargs):
+        return BloomDupeFilter(self.jobdir.name, fingerprinter=RequestFingerprinter(), **kwargs)
+
+    def test_request_seen(self):
+        df = self._dupefilter(initial_capacity=100)
+        self.assertFalse(df.request_seen(Request("https://example.com/app?id=1")))
+        self.assertTrue(df.request_seen(Request("https://example.com/app?id=1")))
+        self.assertFalse(df.request_seen(Request("https://example.com/app?id=2")))
+        df.close("finished")
+
+    def test_false_positives(self):
+        # a tiny filter with a high error rate has many false positives, which must not drop new requests
+        df = self._dupefilter(initial_capacity=10, error_rate=0.5)
+        urls = [f"https://example.com/app?id={i}" for i in range(1000)]
+        self.assertFalse(any(df.request_seen(Request(url)) for url in urls))
+        self.assertTrue(all(df.request_seen(Request(url)) for url in urls))
+        self.assertGreater(df.false_positives, 0)
+        df.close("finished")
+
+    def test_resume(self):
+        df = self._dupefilter(commit_interval=1000)
+        df.request_seen(Request("https://example.com/app?id=1"))
+        df.close("shutdown")
+
+        df = self._dupefilter()
+        self.assertTrue(df.request_seen(Request("https://example.com/app?id=1")))
+        # the saved Bloom filter is removed when loaded, so a crash of this run rebuilds it from disk
+        self.assertFalse(os.path.exists(df.bloom_path))
+        df.request_seen(Request("https://example.com/app?id=2"))
+        df.conn.commit()
+        df.conn.close()
+
+        df = self._dupefilter()
+        self.assertTrue(df.request_seen(Request("https://example.com/app?id=1")))
+        self.assertTrue(df.request_seen(Request("https://example.com/app?id=2")))
+        df.close("finished")
+
+    def test_import_requests_seen(self):
+        fingerprinter = RequestFingerprinter()
+        with open(os.path.join(self.jobdir.name, "requests.seen"), "w") as f:
+            f.write(fingerprinter.fingerprint(Request("https://example.com/app?id=1")).hex() + "\n")
+
+        df = self._dupefilter()
+        self.assertTrue(df.request_seen(Request("https://example.com/app?id=1")))
+        self.assertFalse(df.request_seen(Request("https://example.com/app?id=2")))
+        df.close("finished")
+
+    def test_without_jobdir(self):
+        df = BloomDupeFilter(fingerprinter=RequestFingerprinter())
+        self.assertFalse(df.request_seen(Request("https://example.com")))
+        self.assertTrue(df.request_seen(Request("https://example.com")))
+        tmpdir = df.tmpdir
+        df.close("finished")
+        self.assertFalse(os.path.exists(tmpdir))
+
+
+if __name__ == '__main__':
+    unittest.main()
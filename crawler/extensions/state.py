@@ -0,0 +1,74 @@
+import logging
+import os
+import pickle
+
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.job import job_dir
+
+from crawler import util, ratelimit
+from crawler.extensions.stats import _LoopingExtension
+
+logger = logging.getLogger(__name__)
+
+
+class PersistStateExtension(_LoopingExtension):
+    """
+    Enable this extension to checkpoint the proxy backoffs, proxy health and rate limiting state into the JOBDIR,
+    such that a resumed crawl continues at the pace of the previous run, instead of rediscovering its bans and rate limits.
+    The state is restored when the spider opens, and saved periodically and when the spider closes.
+    """
+    filename = "ratelimit.state"
+
+    def __init__(self, crawler, jobdir, interval):
+        self.path = os.path.join(jobdir, self.filename)
+        self.setup_looping_task(self.save, crawler, interval)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        jobdir = job_dir(crawler.settings)
+        if not jobdir:
+            raise NotConfigured
+        interval = crawler.settings.getfloat("STATE_CHECKPOINT_INTERVAL", 60.0)
+        return cls(crawler, jobdir, interval)
+
+    def spider_opened(self):
+        self.load()
+        super().spider_opened()
+
+    def spider_closed(self):
+        super().spider_closed()
+        self.save()
+
+    @staticmethod
+    def _components():
+        """
+        Returns the (name, object)-tuples of the initialized components with persistent state
+        """
+        components = [
+            ("proxy_pool", util.PROXY_POOL),
+            ("limiter", ratelimit.LIMITER),
+            ("controller", ratelimit.CONTROLLER)
+        ]
+        return [(name, component) for name, component in components if component]
+
+    def save(self):
+        state = {name: component.get_state() for name, component in self._components()}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=4)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"failed to load rate limiting state from '{self.path}': {e}")
+            return
+
+        for name, component in self._components():
+            if name in state:
+                component.set_state(state[name])
+        logger.info(f"restored rate limiting state from '{self.path}'")
@@ -0,0 +1,70 @@
+import tempfile
+import unittest
+
+from scrapy.exceptions import NotConfigured
+from twisted.internet.task import Clock
+
+from crawler import util, ratelimit
+from crawler.extensions.state import PersistStateExtension
+from crawler.ratelimit import TokenBucketLimiter, AimdController
+from crawler.util import BackoffProxyPool, TestCrawler
+
+_PROXIES = ["1.1.1.1:80", "2.2.2.2:80"]
+
+
+class TestPersistStateExtension(unittest.TestCase):
+    def setUp(self):
+        self.jobdir = tempfile.TemporaryDirectory()
+        self.clock = Clock()
+        self.clock.advance(1000)
+
+    def tearDown(self):
+        util.PROXY_POOL = None
+        ratelimit.LIMITER = None
+        ratelimit.CONTROLLER = None
+        self.jobdir.cleanup()
+
+    def _init_components(self):
+        util.PROXY_POOL = BackoffProxyPool(TestCrawler(), _PROXIES, clock=self.clock)
+        ratelimit.LIMITER = TokenBucketLimiter(clock=self.clock)
+        ratelimit.LIMITER.configure("market", rate=1, burst=1)
+        ratelimit.CONTROLLER = AimdController(clock=self.clock)
+        ratelimit.CONTROLLER.configure("market", start_rate=2)
+
+    def _extension(self):
+        crawler = TestCrawler()
+        crawler.settings.set("JOBDIR", self.jobdir.name)
+        return PersistStateExtension.from_crawler(crawler)
+
+    def test_restore(self):
+        self._init_components()
+        util.PROXY_POOL.backoff("1.1.1.1:80", seconds=100)
+        util.PROXY_POOL.backoff("2.2.2.2:80", seconds=1)
+        util.PROXY_POOL.record("2.2.2.2:80", 5)
+        ratelimit.LIMITER.reserve("market", "2.2.2.2:80", "example.com")
+        ratelimit.CONTROLLER.states[("market", "2.2.2.2:80")] = ratelimit.AimdState(0.5, self.clock.seconds())
+        self._extension().save()
+
+        # restart
+        self.clock.advance(10)
+        self._init_components()
+        self._extension().load()
+
+        # the expired backoff is not restored
+        self.assertEqual(util.PROXY_POOL._available_proxies(), ["2.2.2.2:80"])
+        self.assertAlmostEqual(util.PROXY_POOL.health.proxies["2.2.2.2:80"].latency, 1.8)
+        self.assertIn(("2.2.2.2:80", "example.com"), ratelimit.LIMITER.buckets)
+        self.assertEqual(ratelimit.CONTROLLER.rate("market", "2.2.2.2:80"), 0.5)
+
+    def test_missing_state(self):
+        self._init_components()
+        self._extension().load()
+        self.assertEqual(util.PROXY_POOL._available_proxies(), _PROXIES)
+
+    def test_not_configured_without_jobdir(self):
+        with self.assertRaises(NotConfigured):
+            PersistStateExtension.from_crawler(TestCrawler())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 from scrapy.exceptions import NotConfigured
 from twisted.internet import task
+from crawler.pipelines.util import init_influxdb_client
 from crawler.util import market_from_spider
 import logging
 import pprint
@@ -22,7 +23,7 @@ class InfluxdbLogs(object):
         interval = crawler.settings.getfloat('LOGSTATS_INTERVAL')
         if not interval:
             raise NotConfigured
-        influxdb_client = crawler.settings.get("INFLUXDB_CLIENT")
+        influxdb_client = init_influxdb_client(crawler.settings.get("INFLUXDB_PARAMS", {}))
         o = cls(crawler, influxdb_client, interval)
 
         crawler.signals.connect(o.spider_opened, signal=signals.spider_opened)
@@ -0,0 +1,132 @@
+import os
+import socket
+import time
+import uuid
+
+from sqlalchemy.sql import text
+
+_frontier_table = "frontier"
+
+_frontier_fields = {
+    "sqlite": "market text, pkg_name text, priority int, attempts int, done int, worker text, lease text, lease_until real, PRIMARY KEY (market, pkg_name)",
+    "postgres": "market varchar(32), pkg_name text, priority int, attempts int, done int, worker text, lease varchar(32), lease_until double precision, PRIMARY KEY (market, pkg_name)"
+}
+
+# PostgreSQL skips rows that are being claimed by other workers, whereas SQLite serializes all writers anyway
+_claim_lock = {
+    "sqlite": "",
+    "postgres": "FOR UPDATE SKIP LOCKED"
+}
+
+
+def default_worker():
+    """
+    Returns a name of this worker that is unique over the hosts that share the database
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Frontier:
+    """
+    Crawl frontier of a market in the database, from which multiple crawlers (e.g. on different hosts) claim the packages to crawl.
+    A claim is a lease that expires after 'lease_time' seconds, unless renewed, such that the packages of a crashed crawler are claimed by others.
+    Packages are claimed in batches by a single UPDATE statement, which is atomic: PostgreSQL skips the rows that are locked by concurrent claims,
+    and SQLite serializes the claims by its database-wide write lock.
+    A package is given up after 'max_attempts' claims that did not complete it.
+    """
+
+    def __init__(self, engine, dbtype, market, worker=None, lease_time=600, max_attempts=3, clock=time.time):
+        self.engine = engine
+        self.dbtype = dbtype
+        self.market = market
+        self.worker = worker or default_worker()
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.clock = clock
+
+        with self.engine.begin() as con:
+            con.execute(text(f"CREATE TABLE IF NOT EXISTS {_frontier_table} ({_frontier_fields[dbtype]})"))
+
+    def add(self, pkgs, priority=0, batch_size=1000):
+        """
+        Adds packages to the frontier, packages that are already in the frontier are left untouched
+        Args:
+            pkgs: iterable of str
+            priority: int
+                packages of higher priority are claimed first
+        Returns: int
+            number of packages offered
+        """
+        qry = text(f"INSERT INTO {_frontier_table} VALUES (:market, :pkg_name, :priority, 0, 0, NULL, NULL, NULL) ON CONFLICT DO NOTHING")
+        count = 0
+        batch = []
+        for pkg in pkgs:
+            batch.append(dict(market=self.market, pkg_name=pkg, priority=priority))
+            if len(batch) >= batch_size:
+                count += self._insert(qry, batch)
+                batch = []
+        if batch:
+            count += self._insert(qry, batch)
+        return count
+
+    def _insert(self, qry, batch):
+        with self.engine.begin() as con:
+            con.execute(qry, batch)
+        return len(batch)
+
+    def claim(self, n):
+        """
+        Claims up to n packages that are neither done nor leased by another worker, highest priority first
+        Returns: list of str
+        """
+        lease = uuid.uuid4().hex
+        now = self.clock()
+        qry = text(f"""
+            UPDATE {_frontier_table} SET worker = :worker, lease = :lease, lease_until = :until, attempts = attempts + 1
+            WHERE (market, pkg_name) IN (
+                SELECT market, pkg_name FROM {_frontier_table}
+                WHERE market = :market AND done = 0 AND attempts < :max_attempts AND (lease_until IS NULL OR lease_until < :now)
+                ORDER BY priority DESC
+                LIMIT :n
+                {_claim_lock[self.dbtype]}
+            )""")
+        vals = dict(
+            worker=self.worker,
+            lease=lease,
+            until=now + self.lease_time,
+            market=self.market,
+            max_attempts=self.max_attempts,
+            now=now,
+            n=n
+        )
+        with self.engine.begin() as con:
+            con.execute(qry, vals)
+            res = con.execute(text(f"SELECT pkg_name FROM {_frontier_table} WHERE lease = :lease"), dict(lease=lease))
+            return [row.pkg_name for row in res]
+
+    def renew(self):
+        """
+        Extends the leases of all packages claimed by this worker that are not done yet
+        Returns: int
+            number of renewed leases
+        """
+        qry = text(f"UPDATE {_frontier_table} SET lease_until = :until WHERE market = :market AND worker = :worker AND done = 0 AND lease IS NOT NULL")
+        with self.engine.begin() as con:
+            res = con.execute(qry, dict(until=self.clock() + self.lease_time, market=self.market, worker=self.worker))
+            return res.rowcount
+
+    def complete(self, pkg):
+        """
+        Marks a package claimed by this worker as done
+        """
+        qry = text(f"UPDATE {_frontier_table} SET done = 1, lease = NULL, lease_until = NULL WHERE market = :market AND pkg_name = :pkg_name AND worker = :worker")
+        with self.engine.begin() as con:
+            con.execute(qry, dict(market=self.market, pkg_name=pkg, worker=self.worker))
+
+    def release(self):
+        """
+        Releases the leases of all packages of this worker that are not done, such that other workers can claim them immediately
+        """
+        qry = text(f"UPDATE {_frontier_table} SET worker = NULL, lease = NULL, lease_until = NULL WHERE market = :market AND worker = :worker AND done = 0")
+        with self.engine.begin() as con:
+            con.execute(qry, dict(market=self.market, worker=self.worker))
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from sqlalchemy import create_engine
+
+from crawler.frontier import Frontier
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000
+
+    def __call__(self):
+        return self.now
+
+
+class TestFrontier(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "test.db")
+        self.engine = create_engine(f"sqlite:///{self.path}")
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def _frontier(self, worker, **kwargs):
+        return Frontier(self.engine, "sqlite", "fdroid", worker=worker, lease_time=60, clock=self.clock, **kwargs)
+
+    def test_claim(self):
+        a = self._frontier("a")
+        b = self._frontier("b")
+        a.add(["low1", "low2"])
+        a.add(["high"], priority=1)
+        b.add(["low1"])  # already in the frontier
+
+        # higher priority first, and packages are only claimed once
+        self.assertEqual(a.claim(1), ["high"])
+        claimed = b.claim(10)
+        self.assertEqual(sorted(claimed), ["low1", "low2"])
+        self.assertEqual(a.claim(10), [])
+
+        # other markets have their own frontier
+        other = Frontier(self.engine, "sqlite", "mi", worker="a", clock=self.clock)
+        self.assertEqual(other.claim(10), [])
+
+    def test_lease(self):
+        a = self._frontier("a")
+        b = self._frontier("b")
+        a.add(["pkg1", "pkg2"])
+        self.assertEqual(len(a.claim(2)), 2)
+
+        # renewed leases do not expire
+        self.clock.now += 50
+        self.assertEqual(a.renew(), 2)
+        self.clock.now += 50
+        self.assertEqual(b.claim(10), [])
+
+        # a completed package is never claimed again, the lease of the other package expires
+        a.complete("pkg1")
+        self.clock.now += 61
+        self.assertEqual(b.claim(10), ["pkg2"])
+
+        # released packages are claimed immediately
+        b.release()
+        self.assertEqual(a.claim(10), ["pkg2"])
+
+    def test_max_attempts(self):
+        a = self._frontier("a", max_attempts=2)
+        a.add(["pkg"])
+        for i in range(2):
+            self.assertEqual(a.claim(1), ["pkg"])
+            a.release()
+        self.assertEqual(a.claim(1), [])
+
+    def test_concurrent_claims(self):
+        self._frontier("setup").add(f"pkg{i}" for i in range(500))
+
+        claimed = {}
+
+        def work(worker):
+            # every worker has its own connection pool, as if it were a separate process
+            engine = create_engine(f"sqlite:///{self.path}", connect_args={"timeout": 30})
+            frontier = Frontier(engine, "sqlite", "fdroid", worker=worker, clock=self.clock)
+            res = []
+            while True:
+                pkgs = frontier.claim(7)
+                if not pkgs:
+                    break
+                res.extend(pkgs)
+            claimed[worker] = res
+            engine.dispose()
+
+        threads = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        all_claimed = [pkg for pkgs in claimed.values() for pkg in pkgs]
+        self.assertEqual(len(all_claimed), 500)
+        self.assertEqual(len(set(all_claimed)), 500)
+
+
+if __name__ == '__main__':
+    unittest.main()
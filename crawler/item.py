@@ -1,6 +1,148 @@
+from collections.abc import MutableMapping
+
+
 class NoPkgError(Exception):
     pass
 
+
+class Record(MutableMapping):
+    """
+    Dict-like record of which the fields are declared as slots, i.e. a mapping of fixed keys without a dict per instance.
+    Records are read and written like the dicts that the pipelines have always passed around (e.g. item['meta'].get('pkg_name')),
+    but only hold their declared fields: a field that is not set is a missing key,
+    and setting an undeclared key raises a KeyError (like scrapy.Item does), rather than silently adding a field.
+
+    Subclasses declare:
+        __slots__: names of the fields
+        _aliases: keys of the fields that are not valid attribute names (e.g. '__pkg_start_time'), by the name of their slot
+        _records: functions by key, that convert the dicts that are set as the value of the field, e.g. to a nested record
+    """
+    __slots__ = ()
+    _aliases = {}
+    _records = {}
+    _attrs = {}  # slot by key
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._attrs = {cls._aliases.get(slot, slot): slot for slot in cls.__slots__}
+
+    def __init__(self, *args, **kwargs):
+        self.update(*args, **kwargs)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, self._attrs[key])
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        attr = self._attrs.get(key)
+        if attr is None:
+            raise KeyError(f"{type(self).__name__} does not support field: {key}")
+        convert = self._records.get(key)
+        if convert is not None and type(value) is dict:
+            value = convert(value)
+        setattr(self, attr, value)
+
+    def __delitem__(self, key):
+        try:
+            delattr(self, self._attrs[key])
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        for key, attr in self._attrs.items():
+            if hasattr(self, attr):
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        attr = self._attrs.get(key)
+        return attr is not None and hasattr(self, attr)
+
+    def get(self, key, default=None):
+        attr = self._attrs.get(key)
+        if attr is None:
+            return default
+        return getattr(self, attr, default)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+    def to_dict(self):
+        """
+        Returns the record as (nested) dicts, as stored in the database and written to meta.json
+        """
+        return {key: as_dict(value) for key, value in self.items()}
+
+
+def as_dict(obj):
+    """
+    Returns the given record, or dict of records (e.g. the versions of an item), as plain dicts, which are serializable to JSON
+    Other values are returned as is
+    """
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    if type(obj) is dict:
+        return {key: as_dict(value) for key, value in obj.items()}
+    return obj
+
+
+class Analysis(Record):
+    """
+    Analysis of an APK, see crawler.pipelines.analyze_apks.analyse
+    Every analysis component registered in crawler.pipelines.analyze_apks must be declared as a field
+    """
+    __slots__ = (
+        "path", "component_versions", "assetlink_status",
+        # components
+        "certs", "signers", "pkg_name", "permissions", "sdk_version", "android_version", "assetlink_domains",
+    )
+
+
+class Version(Record):
+    """
+    Data of a version of an app, by which its APK is downloaded, and the results of downloading and analysing it
+    """
+    __slots__ = (
+        "timestamp", "code", "download_url", "cookies", "headers",
+        # set by the pipelines
+        "skip", "file_success", "file_path", "file_md5", "file_sha256", "file_size", "analysis", "analysis_sha256",
+    )
+    _records = {"analysis": Analysis}
+
+
+class Meta(Record):
+    """
+    Meta data of an app in a market
+    """
+    __slots__ = (
+        "url", "pkg_name", "id", "app_name", "app_description", "app_summary", "description", "developer_name",
+        "developer_address", "developer_email", "developer_website", "creator", "uploader", "icon_url", "categories",
+        "downloads", "user_rating", "content_rating", "languages", "price", "currency", "offer_type", "available",
+        "contains_ads", "restriction", "privacy_policy", "privacy_policy_url", "terms",
+        # set by the pipelines
+        "timestamp", "market", "icon_success", "icon_path", "icon_md5", "icon_sha256", "privacy_policy_path",
+        "privacy_policy_status", "app_ads_path", "ads_path",
+    )
+
+
+def _versions(versions):
+    return {version: Version(values) if type(values) is dict else values for version, values in versions.items()}
+
+
+class Result(Record):
+    """
+    Item of an app in a market, as passed through the pipelines: its meta data and versions (by version name)
+    The spiders yield plain dicts, which are converted to results by the first pipeline (AddUniversalMetaPipeline)
+    """
+    __slots__ = ("meta", "versions", "pkg_start_time", "account")
+    _aliases = {"pkg_start_time": "__pkg_start_time", "account": "_account"}
+    _records = {"meta": Meta, "versions": _versions}
+
+
 def pkg_name_from_result(result):
     meta = result["meta"]
     pkg_name = meta.get("pkg_name", None)
@@ -0,0 +1,95 @@
+import datetime
+import json
+import pickle
+import unittest
+
+from crawler.item import Analysis, Meta, Result, Version, as_dict, pkg_name_from_result, NoPkgError
+from crawler.pipelines.analyze_apks import _COMPONENTS
+
+
+def _item():
+    return {
+        'meta': {'pkg_name': 'com.example', 'app_name': 'Example', 'categories': ['Tools']},
+        'versions': {
+            '1.0': {'timestamp': 1640995200, 'download_url': 'https://example.com/app.apk',
+                    'analysis': {'pkg_name': 'com.example', 'assetlink_domains': {'example.com': None}}}
+        },
+        '__pkg_start_time': datetime.datetime(2022, 1, 1),
+    }
+
+
+class TestResult(unittest.TestCase):
+    def test_from_dict(self):
+        res = Result(_item())
+        self.assertIsInstance(res['meta'], Meta)
+        self.assertIsInstance(res['versions']['1.0'], Version)
+        self.assertIsInstance(res['versions']['1.0']['analysis'], Analysis)
+        # the values of fields, e.g. the domains of an analysis, stay as they are
+        self.assertEqual(res['versions']['1.0']['analysis']['assetlink_domains'], {'example.com': None})
+        self.assertEqual(res, _item())
+
+    def test_mapping(self):
+        meta = Meta(pkg_name='com.example')
+        self.assertEqual(meta['pkg_name'], 'com.example')
+        self.assertEqual(meta.get('app_name', 'unknown'), 'unknown')
+        self.assertNotIn('app_name', meta)
+        self.assertEqual(list(meta), ['pkg_name'])
+        self.assertEqual(len(meta), 1)
+        with self.assertRaises(KeyError):
+            meta['app_name']
+
+        meta['app_name'] = 'Example'
+        self.assertEqual(dict(meta), {'pkg_name': 'com.example', 'app_name': 'Example'})
+        del meta['app_name']
+        with self.assertRaises(KeyError):
+            del meta['app_name']
+        self.assertEqual(meta, {'pkg_name': 'com.example'})
+
+    def test_undeclared_field(self):
+        meta = Meta()
+        with self.assertRaises(KeyError):
+            meta['pkg_nme'] = 'com.example'
+        self.assertIsNone(meta.get('pkg_nme'))
+        with self.assertRaises(KeyError):
+            Result(_item(), versoins={})
+        # records have no dict of attributes
+        with self.assertRaises(AttributeError):
+            meta.pkg_nme = 'com.example'
+
+    def test_aliases(self):
+        res = Result(_item())
+        self.assertEqual(res['__pkg_start_time'], datetime.datetime(2022, 1, 1))
+        del res['__pkg_start_time']
+        self.assertIsNone(res.get('__pkg_start_time'))
+        self.assertEqual(list(res), ['meta', 'versions'])
+
+    def test_as_dict(self):
+        res = Result(_item())
+        del res['__pkg_start_time']
+        d = as_dict(res)
+        self.assertIs(type(d['meta']), dict)
+        self.assertIs(type(d['versions']['1.0']['analysis']), dict)
+        self.assertEqual(json.loads(json.dumps(d)), d)
+        self.assertEqual(as_dict({'meta': res['meta']}), {'meta': d['meta']})
+        self.assertIsNone(as_dict(None))
+
+    def test_pickle(self):
+        res = Result(_item())
+        self.assertEqual(pickle.loads(pickle.dumps(res)), res)
+
+    def test_pkg_name(self):
+        res = Result(_item())
+        self.assertEqual(pkg_name_from_result(res), 'com.example')
+        del res['meta']['pkg_name']
+        self.assertEqual(pkg_name_from_result(res), 'com.example')
+        del res['versions']['1.0']['analysis']
+        with self.assertRaises(NoPkgError):
+            pkg_name_from_result(res)
+
+    def test_analysis_components(self):
+        for name in _COMPONENTS:
+            self.assertIn(name, Analysis._attrs)
+
+
+if __name__ == '__main__':
+    unittest.main()
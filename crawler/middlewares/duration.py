@@ -1,22 +1,52 @@
-from datetime import datetime
+import time
 
+from crawler import util
 
-def report_endtime(request, spider, exception=None):
+# statuses of responses that are generated by a proxy rather than the target site
+_PROXY_AUTH_STATUS = 407
+_GATEWAY_STATUSES = (502, 504)
+
+
+def is_proxy_error(response=None, exception=None):
+    """
+    Returns whether a request failed because of its proxy, i.e. raised an exception (e.g. a timeout or refused connection),
+    was refused by the proxy, or received a gateway error from the proxy itself
+    Other server errors come from the target site (e.g. the protobuf errors of the Google Play API, or an outage of the site),
+    and equally affect all proxies
+    """
+    if exception is not None:
+        return True
+    if response.status == _PROXY_AUTH_STATUS:
+        return True
+    # a gateway error of the target site carries its own body, unlike one of the proxy (e.g. when the site is unreachable)
+    return response.status in _GATEWAY_STATUSES and (not response.body or b"Proxy-Status" in response.headers)
+
+
+def report_endtime(request, spider, response=None, exception=None):
+    """
+    Logs the duration of the request, and records it for the health of its proxy
+    Requests fail when their proxy fails, see is_proxy_error
+    """
     start_time = request.meta.get('__request_start_time', None)
     if not start_time:
         spider.logger.debug(f"Failed to find start time of request {request.url}")
         return
-    end_time = datetime.now()
-    passed = end_time - start_time
-    spider.logger.debug(f"Took {passed} to process {request.url}")
+    passed = time.time() - start_time
+    spider.logger.debug(f"Took {passed:.3f}s to process {request.url}")
+
+    proxy = request.meta.get('proxy', None)
+    if util.PROXY_POOL and proxy:
+        size = len(response.body) if response is not None else 0
+        error = is_proxy_error(response, exception)
+        util.PROXY_POOL.record(proxy, passed, size=size, error=error)
 
 
 class DurationMiddleware:
     def process_request(self, request, spider):
-        request.meta['__request_start_time'] = datetime.now()
+        request.meta['__request_start_time'] = time.time()
 
     def process_response(self, request, response, spider):
-        report_endtime(request, spider)
+        report_endtime(request, spider, response=response)
         return response
 
     def process_exception(self, request, exception, spider):
@@ -0,0 +1,61 @@
+import time
+import unittest
+
+from scrapy import Request, Spider
+from scrapy.http import Response
+from twisted.internet.error import TimeoutError
+from twisted.internet.task import Clock
+
+from crawler import util
+from crawler.middlewares.duration import DurationMiddleware, is_proxy_error
+from crawler.util import BackoffProxyPool, TestCrawler
+
+_PROXY = "1.1.1.1:80"
+
+
+class TestDurationMiddleware(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.clock.advance(time.time())
+        self.crawler = TestCrawler()
+        util.PROXY_POOL = BackoffProxyPool(self.crawler, [_PROXY], clock=self.clock, health_params={"min_samples": 5, "quarantine_time": 60})
+        self.spider = Spider("example")
+        self.mw = DurationMiddleware()
+
+    def tearDown(self):
+        util.PROXY_POOL = None
+
+    def _request(self):
+        request = Request("https://example.com", meta={"proxy": f"http://{_PROXY}"})
+        self.mw.process_request(request, self.spider)
+        return request
+
+    def test_is_proxy_error(self):
+        request = Request("https://example.com")
+        self.assertTrue(is_proxy_error(exception=TimeoutError()))
+        self.assertTrue(is_proxy_error(Response(request.url, status=407, request=request)))
+        self.assertTrue(is_proxy_error(Response(request.url, status=502, request=request)))
+        self.assertTrue(is_proxy_error(Response(request.url, status=504, body=b"<html>", headers={"Proxy-Status": "proxy; error=connection_timeout"}, request=request)))
+        # errors of the target site
+        self.assertFalse(is_proxy_error(Response(request.url, status=500, request=request)))
+        self.assertFalse(is_proxy_error(Response(request.url, status=503, request=request)))
+        self.assertFalse(is_proxy_error(Response(request.url, status=502, body=b"<html>Bad gateway</html>", request=request)))
+        self.assertFalse(is_proxy_error(Response(request.url, status=404, request=request)))
+
+    def test_origin_error(self):
+        # e.g. an error of the Google Play API, or an outage of the target site
+        for i in range(10):
+            request = self._request()
+            self.mw.process_response(request, Response(request.url, status=500, body=b"\x08\x01", request=request), self.spider)
+        self.assertEqual(util.PROXY_POOL._available_proxies(), [_PROXY])
+        self.assertIsNone(self.crawler.stats.get_value("proxies/quarantined"))
+
+    def test_proxy_error(self):
+        for i in range(5):
+            self.mw.process_exception(self._request(), TimeoutError(), self.spider)
+        self.assertEqual(util.PROXY_POOL._available_proxies(), [])
+        self.assertEqual(self.crawler.stats.get_value("proxies/quarantined"), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+from twisted.internet import task
+
+from crawler import pacing
+from crawler.util import market_from_spider
+
+
+class PacingMiddleware:
+    """
+    Delays new requests of a market while it is being paced (see crawler.pacing.Pacer), e.g. after processing an item,
+    and requests with a 'not_before' time in their meta until that time.
+    Requests wait on a reactor timer, so downloads in flight and the item pipelines continue in the meantime.
+    """
+
+    def __init__(self):
+        self.pacer = pacing.init_pacer()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls()
+
+    def process_request(self, request, spider):
+        wait_time = self.pacer.wait_time(market_from_spider(spider))
+        not_before = request.meta.get('not_before', None)
+        if not_before:
+            wait_time = max(wait_time, not_before - self.pacer.clock.seconds())
+        if wait_time <= 0:
+            return
+        d = task.deferLater(self.pacer.clock, wait_time, lambda: None)
+        # the market may have been paced further in the meantime
+        d.addCallback(lambda _: self.process_request(request, spider))
+        return d
@@ -1,30 +1,71 @@
 from urllib.parse import urlparse
 
-from crawler import util
-from crawler.util import init_proxy_pool, NoProxiesError, _is_valid
+from twisted.internet import task
+
+from crawler import util, ratelimit, shared_state
+from crawler.util import init_proxy_pool, market_from_spider
 
 
 class HttpProxyMiddleware:
 
-    def __init__(self, crawler, proxies=[]):
-        init_proxy_pool(crawler, proxies)
+    def __init__(self, crawler, proxies=[], token_bucket={}, health={}, shared={}):
+        state = None
+        if shared.get("enabled", False):
+            state = shared_state.init_shared_state(
+                shared.get("path", "./shared_state.db"),
+                sync_interval=shared.get("sync_interval", 1),
+                timeout=shared.get("timeout", 0.05)
+            )
+        init_proxy_pool(crawler, proxies, health_params=health, shared_state=state)
+        self.limiter = ratelimit.init_limiter(shared_state=state)
+        self.limiter.configure(
+            market_from_spider(crawler.spider),
+            rate=token_bucket.get("rate", 0),
+            burst=token_bucket.get("burst", 1)
+        )
 
     @classmethod
     def from_crawler(cls, crawler):
         return cls(
             crawler,
-            proxies=crawler.settings.getlist("HTTP_PROXIES")
+            proxies=crawler.settings.getlist("HTTP_PROXIES"),
+            token_bucket=crawler.settings.get("RATELIMIT_PARAMS", {}).get("token_bucket", {}),
+            health=crawler.settings.get("PROXY_HEALTH_PARAMS", {}),
+            shared=crawler.settings.get("SHARED_STATE_PARAMS", {})
         )
 
     def process_request(self, request, spider):
-        try:
-            host = urlparse(request.url).hostname
-            proxy = util.PROXY_POOL.get_proxy()
-            if _is_valid(proxy) and host not in ["127.0.0.1", "::1", "localhost"]:
-                full_proxy = f"http://{proxy}"
-                request.meta['proxy'] = full_proxy
-                request.meta['download_slot'] = full_proxy
-            else:
-                request.meta['proxy'] = None
-        except NoProxiesError:
-            pass
+        """
+        Assigns a proxy to the request and applies the rate limit of the (proxy, domain)-pair
+        Returns a Deferred that fires once a proxy is available and the rate limit allows the request,
+        such that the request waits without blocking the reactor
+        """
+        host = urlparse(request.url).hostname
+        if host in ["127.0.0.1", "::1", "localhost"]:
+            request.meta['proxy'] = None
+            return
+
+        d = util.PROXY_POOL.get_proxy()
+        d.addCallback(self._set_proxy, request)
+        d.addCallback(self._limit_rate, request, host, spider)
+        return d
+
+    def _set_proxy(self, proxy, request):
+        # the pool only contains valid proxies
+        if proxy:
+            full_proxy = f"http://{proxy}"
+            request.meta['proxy'] = full_proxy
+            request.meta['download_slot'] = full_proxy
+        else:
+            request.meta['proxy'] = None
+
+    def _limit_rate(self, _, request, host, spider):
+        market = market_from_spider(spider)
+        proxy = request.meta['proxy']
+
+        # the rate adapted by the AIMD controller, if enabled, takes precedence over the configured rate
+        rate = ratelimit.CONTROLLER.rate(market, proxy) if ratelimit.CONTROLLER else None
+
+        delay = self.limiter.reserve(market, proxy, host, rate=rate)
+        if delay:
+            return task.deferLater(self.limiter.clock, delay, lambda: None)
@@ -1,47 +1,81 @@
-import time
-
-from scrapy.downloadermiddlewares.retry import RetryMiddleware
+from scrapy.downloadermiddlewares.retry import get_retry_request
 from scrapy.utils.response import response_status_message
 
-from crawler import util
+from crawler import util, ratelimit
 from crawler.middlewares import sentry
+from crawler.pipelines.util import init_influxdb_client
 from crawler.util import market_from_spider
 
 
-class RatelimitMiddleware(RetryMiddleware):
+class RatelimitMiddleware:
     """
     Middleware for dynamically adjusting querying rate.
-    Maintains a backoff time that increments exponentially every time a 429 is seen and is applied to all subsequent request.
+    Backs off the proxy of a request that is rate limited (429), and retries the request.
+    Unlike Scrapy's RetryMiddleware, it is enabled regardless of RETRY_ENABLED, which the crawler disables for all other responses.
     # inspired by https://stackoverflow.com/questions/43630434/how-to-handle-a-429-too-many-requests-response-in-scrapy
 
-    Configured with two parameters:
+    If enabled, the request rate per proxy is adapted with an AIMD controller (see crawler.ratelimit.AimdController),
+    which is enforced by the HttpProxyMiddleware.
+
+    Configured with the following parameters:
         default_backoff: int
             the default number of seconds to backoff in case of a 429, in case no Retry-After header is seen
-        base_inc: float
-            the number of seconds to increment the backoff time on any requests
+        codes: list of int
+            status codes that indicate rate limiting
+        adaptive: bool
+            whether the request rate is adapted by the AIMD controller, disabled by default
+        time_window_size: float
+            number of seconds of the sliding window over which the ratio of rate limited responses is tracked, 0 disables the controller
+        inc_start: float
+            number of requests per second by which the rate is increased after a window without rate limiting
+        epsilon: float
+            percentage of rate limited responses in the window above which the rate is decreased
+        start_rate: float
+            initial number of requests per second
+        retry_times: int
+            maximum number of times a rate limited request is retried, defaults to RETRY_TIMES
     """
 
-    def __init__(self, crawler, influxdb_client, default_backoff=600, codes=[429]):
-        super(RatelimitMiddleware, self).__init__(crawler.settings)
+    def __init__(self, crawler, influxdb_client, default_backoff=600, codes=[429], controller_params={}, max_retry_times=2):
         self.crawler = crawler
         self.default_backoff = default_backoff
         self.codes = codes
+        self.max_retry_times = max_retry_times
+
+        self.controller = None
+        if controller_params.get("time_window_size", 0):
+            self.controller = ratelimit.init_controller()
+            self.controller.configure(market_from_spider(crawler.spider), **controller_params)
 
         self.influxdb_client = influxdb_client
         self.reset_influxdb(crawler.spider)
 
     @classmethod
     def from_crawler(cls, crawler):
+        params = crawler.settings.get("RATELIMIT_PARAMS", {})
+        controller_params = {}
+        if params.get("adaptive", False):
+            controller_params = {k: params[k] for k in ["time_window_size", "inc_start", "epsilon", "start_rate", "min_rate", "max_rate"] if k in params}
+            controller_params.setdefault("time_window_size", 30)
         return cls(
             crawler,
-            crawler.settings.get("INFLUXDB_CLIENT"),
-            **crawler.settings.get("RATELIMIT_PARAMS", {})
+            init_influxdb_client(crawler.settings.get("INFLUXDB_PARAMS", {})),
+            default_backoff=params.get("default_backoff", 600),
+            codes=params.get("codes", [429]),
+            controller_params=controller_params,
+            max_retry_times=params.get("retry_times", crawler.settings.getint("RETRY_TIMES"))
         )
 
     def process_response(self, request, response, spider):
         status_code = response.status
         market = market_from_spider(spider)
 
+        if self.controller:
+            proxy = request.meta.get('proxy', None)
+            state = self.controller.record(market, proxy, status_code in self.codes)
+            if state:
+                self.capture_controller_influxdb(market, proxy, state)
+
         if status_code in self.codes:
             proxy = request.meta.get('proxy', None)
             backoff = float(response.headers.get("Retry-After", self.default_backoff))
@@ -57,20 +91,13 @@ class RatelimitMiddleware(RetryMiddleware):
 
             util.PROXY_POOL.backoff(proxy, seconds=backoff)
 
+            if request.meta.get('dont_retry', False):
+                return response
             reason = response_status_message(response.status)
-            return self._retry(request, reason, spider) or response
+            max_retry_times = request.meta.get('max_retry_times', self.max_retry_times)
+            return get_retry_request(request, spider=spider, reason=reason, max_retry_times=max_retry_times) or response
         return response
 
-    def pause(self, t):
-        """
-        Pause the crawler 't' seconds
-        """
-        try:
-            self.crawler.engine.pause()
-            time.sleep(t)
-        finally:
-            self.crawler.engine.unpause()
-
     def capture_influxdb(self, market, status, fields):
         point = {
             "measurement": "rate_limiting",
@@ -82,6 +109,20 @@ class RatelimitMiddleware(RetryMiddleware):
         }
         self.influxdb_client.add_point(point)
 
+    def capture_controller_influxdb(self, market, proxy, state):
+        point = {
+            "measurement": "rate_controller",
+            "tags": {
+                "market": market,
+                "proxy": proxy or "none"
+            },
+            "fields": {
+                "rate": float(state.rate),
+                "ratio": float(state.ratio())
+            }
+        }
+        self.influxdb_client.add_point(point)
+
     def reset_influxdb(self, spider):
         """
         Sets all backoff/retry_after to zero
@@ -0,0 +1,82 @@
+import argparse
+import os
+import tempfile
+import unittest
+
+import yaml
+from scrapy import Request, Spider
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+
+from crawler import ratelimit, util
+from crawler.middlewares.ratelimit import RatelimitMiddleware
+from scripts import run_spider
+
+_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "config", "config.template.yml")
+
+
+class ExampleSpider(Spider):
+    name = "example_spider"
+
+
+class TestRatelimitMiddleware(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        with open(_CONFIG_PATH) as f:
+            config = yaml.safe_load(f)
+        # the settings of the crawler, as built by scripts/run_spider.py
+        run_spider.args = argparse.Namespace(
+            user_agents_file=os.path.join(self.tmpdir.name, "user_agents.txt"),
+            proxies_file=os.path.join(self.tmpdir.name, "proxies.txt")
+        )
+        self.settings = run_spider.get_settings(config, ExampleSpider.name, self.tmpdir.name)
+
+        self.crawler = get_crawler(ExampleSpider, self.settings)
+        self.crawler.spider = self.spider = ExampleSpider.from_crawler(self.crawler)
+        ratelimit.CONTROLLER = None
+        util.PROXY_POOL = None
+        util.init_proxy_pool(self.crawler, ["1.1.1.1:80"])
+
+    def tearDown(self):
+        ratelimit.CONTROLLER = None
+        util.PROXY_POOL = None
+        self.tmpdir.cleanup()
+
+    def test_enabled(self):
+        # the crawler disables Scrapy's retries, which must not disable the middleware
+        self.assertFalse(self.settings["RETRY_ENABLED"])
+        mw = RatelimitMiddleware.from_crawler(self.crawler)
+        # the request rate is only adapted when enabled explicitly
+        self.assertIsNone(mw.controller)
+        self.assertIsNone(ratelimit.CONTROLLER)
+
+    def test_adaptive(self):
+        self.settings["RATELIMIT_PARAMS"]["adaptive"] = True
+        crawler = get_crawler(ExampleSpider, self.settings)
+        crawler.spider = ExampleSpider.from_crawler(crawler)
+        mw = RatelimitMiddleware.from_crawler(crawler)
+        self.assertIsNotNone(mw.controller)
+        self.assertIs(ratelimit.CONTROLLER, mw.controller)
+
+    def test_retry(self):
+        mw = RatelimitMiddleware.from_crawler(self.crawler)
+        request = Request("https://example.com", meta={"proxy": "http://1.1.1.1:80"})
+        response = Response("https://example.com", status=429, headers={"Retry-After": "5"}, request=request)
+
+        for i in range(self.settings["RATELIMIT_PARAMS"]["retry_times"]):
+            retried = mw.process_response(request, response, self.spider)
+            self.assertIsInstance(retried, Request)
+            self.assertEqual(retried.meta["retry_times"], i + 1)
+            request = retried
+        # the proxy is backed off
+        self.assertEqual(util.PROXY_POOL._available_proxies(), [])
+
+        # given up after 'retry_times' retries
+        self.assertIs(mw.process_response(request, response, self.spider), response)
+
+        ok = Response("https://example.com", status=200, request=request)
+        self.assertIs(mw.process_response(request, ok, self.spider), ok)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,3 @@
-from google.protobuf.message import DecodeError
-from playstoreapi.googleplay_pb2 import ResponseWrapper
 from scrapy.exceptions import CloseSpider
 from sentry_sdk import capture_message, configure_scope, capture_exception
 from twisted.internet.error import DNSLookupError
@@ -14,6 +12,8 @@ class SentryMiddleware:
 
             # handle protobuf responses specifically, as they return an error message in the body of a 500 response
             if response.status == 500:
+                from google.protobuf.message import DecodeError
+                from playstoreapi.googleplay_pb2 import ResponseWrapper
                 try:
                     err_msg = ResponseWrapper.FromString(response.body).commands.displayErrorMessage
                     e = Exception(err_msg)
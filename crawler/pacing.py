@@ -0,0 +1,45 @@
+PACER = None
+
+
+def init_pacer(clock=None):
+    global PACER
+    if not PACER:
+        PACER = Pacer(clock=clock)
+    return PACER
+
+
+class Pacer:
+    """
+    Keeps, per key (e.g. a market or domain), the time before which no new requests should be sent.
+    Used by the PacingMiddleware to delay new requests with reactor timers, without blocking requests that are in flight.
+    """
+
+    def __init__(self, clock=None):
+        if clock is None:
+            from twisted.internet import reactor
+            clock = reactor
+        self.clock = clock
+        self.not_before = {}  # key -> time
+
+    def delay(self, key, seconds):
+        """
+        Delays new requests of the key until 'seconds' from now, unless they are already delayed for longer
+        """
+        if not seconds:
+            return
+        until = self.clock.seconds() + seconds
+        if until > self.not_before.get(key, 0):
+            self.not_before[key] = until
+
+    def wait_time(self, key):
+        """
+        Returns the number of seconds that new requests of the key should wait
+        """
+        until = self.not_before.get(key, None)
+        if until is None:
+            return 0
+        res = until - self.clock.seconds()
+        if res <= 0:
+            del self.not_before[key]
+            return 0
+        return res
@@ -0,0 +1,57 @@
+import unittest
+
+from scrapy import Request
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from crawler import pacing
+from crawler.middlewares.pacing import PacingMiddleware
+from crawler.pacing import Pacer
+from crawler.util import TestSpider
+
+
+class TestPacer(unittest.TestCase):
+    def test_wait_time(self):
+        clock = Clock()
+        pacer = Pacer(clock=clock)
+        self.assertEqual(pacer.wait_time("market"), 0)
+
+        pacer.delay("market", 3)
+        pacer.delay("market", 1)  # does not shorten the delay
+        self.assertEqual(pacer.wait_time("market"), 3)
+        self.assertEqual(pacer.wait_time("other"), 0)
+
+        clock.advance(3)
+        self.assertEqual(pacer.wait_time("market"), 0)
+        self.assertEqual(pacer.not_before, {})
+
+
+class TestPacingMiddleware(SynchronousTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        pacing.PACER = Pacer(clock=self.clock)
+        self.mw = PacingMiddleware()
+        self.spider = TestSpider()
+
+    def tearDown(self):
+        pacing.PACER = None
+
+    def test_process_request(self):
+        self.assertIsNone(self.mw.process_request(Request("https://example.com"), self.spider))
+
+        pacing.PACER.delay("test", 3)
+        d = self.mw.process_request(Request("https://example.com"), self.spider)
+        self.assertNoResult(d)
+
+        # paced again while waiting
+        self.clock.advance(2)
+        pacing.PACER.delay("test", 3)
+        self.clock.advance(1)
+        self.assertNoResult(d)
+
+        self.clock.advance(2)
+        self.assertIsNone(self.successResultOf(d))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import gzip
+import io
+import logging
+import os
+import pickle
+import time
+
+from crawler.bloom import BloomFilter
+
+logger = logging.getLogger(__name__)
+
+
+def open_package_file(path):
+    """
+    Opens a package file for reading in binary mode, decompressing '.gz' and '.zst' files on the fly
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(f"reading '{path}' requires the 'zstandard' package")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True))
+    return open(path, "rb")
+
+
+def _skip(f, offset, chunk_size=1024 * 1024):
+    """
+    Moves the file forward to the given offset of its (uncompressed) content
+    """
+    if isinstance(f, io.BufferedReader) and f.seekable():
+        f.seek(offset)
+        return
+    # compressed streams can only be skipped by decompressing them
+    while offset > 0:
+        chunk = f.read(min(offset, chunk_size))
+        if not chunk:
+            break
+        offset -= len(chunk)
+
+
+class PackageSources:
+    """
+    Streams the package names of package files and other sources (e.g. the database), and skips the packages that were seen before in any source.
+    Packages are deduplicated by a Bloom filter of bounded memory, so a fraction 'error_rate' of the unique packages is skipped as well.
+
+    The number of bytes consumed of every file is recorded, and saved with the Bloom filter to 'state_path' (e.g. in the JOBDIR)
+    every 'checkpoint_interval' seconds, such that a resumed crawl continues where it left off, instead of reading all files again.
+    A package counts as consumed once the next package is requested, i.e. after the requests of the package have been scheduled.
+    """
+
+    def __init__(self, capacity=10000000, error_rate=0.001, state_path=None, checkpoint_interval=60):
+        self.seen = BloomFilter(capacity, error_rate=error_rate)
+        self.offsets = {}  # path -> (number of bytes consumed, whether the file is finished)
+        self.state_path = state_path
+        self.checkpoint_interval = checkpoint_interval
+        self.duplicates = 0
+        self._last_checkpoint = time.monotonic()
+        if state_path:
+            self.load()
+
+    def _is_new(self, pkg):
+        if pkg in self.seen:
+            self.duplicates += 1
+            return False
+        return True
+
+    def packages(self, pkgs):
+        """
+        Generator of the packages of a source that were not seen before
+        Args:
+            pkgs: iterable of str
+        """
+        for pkg in pkgs:
+            if self._is_new(pkg):
+                yield pkg
+                self.seen.add(pkg)
+
+    def read_file(self, path):
+        """
+        Generator of the packages in the package file (one per line) that were not seen before, starting where a previous run left off
+        Args:
+            path: str
+                plain, '.gz' or '.zst' file
+        """
+        offset, finished = self.offsets.get(path, (0, False))
+        if finished:
+            logger.info(f"skipping package file '{path}', as it was read completely before")
+            return
+        if offset:
+            logger.info(f"resuming package file '{path}' at byte {offset}")
+
+        with open_package_file(path) as f:
+            _skip(f, offset)
+            for line in f:
+                pkg = line.decode("utf-8", errors="replace").strip()
+                if pkg and self._is_new(pkg):
+                    yield pkg
+                    self.seen.add(pkg)
+                offset += len(line)
+                self.offsets[path] = (offset, False)
+                self._checkpoint()
+        self.offsets[path] = (offset, True)
+        self.save()
+
+    def _checkpoint(self):
+        if self.state_path and time.monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+            self.save()
+
+    def save(self):
+        if not self.state_path:
+            return
+        if len(self.seen) > self.seen.capacity:
+            logger.warning(f"{len(self.seen)} unique packages exceed the capacity of the deduplication filter ({self.seen.capacity}), "
+                           f"such that more than {self.seen.error_rate:.2%} of the packages is skipped")
+        state = dict(offsets=self.offsets, seen=self.seen.get_state())
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=4)
+        os.replace(tmp_path, self.state_path)
+        self._last_checkpoint = time.monotonic()
+
+    def load(self):
+        if not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, "rb") as f:
+                state = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"failed to load package source state from '{self.state_path}': {e}")
+            return
+        self.offsets = state["offsets"]
+        self.seen = BloomFilter.from_state(state["seen"])
@@ -0,0 +1,55 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from crawler.package_sources import PackageSources
+
+
+class TestPackageSources(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def test_dedup(self):
+        with open(self._path("a.txt"), "w") as f:
+            f.write("com.a\n\ncom.b\ncom.a\n")
+        with gzip.open(self._path("b.txt.gz"), "wt") as f:
+            f.write("com.b\ncom.c\ncom.db\n")
+
+        sources = PackageSources(capacity=100)
+        self.assertEqual(list(sources.packages(["com.db"])), ["com.db"])
+        self.assertEqual(list(sources.read_file(self._path("a.txt"))), ["com.a", "com.b"])
+        self.assertEqual(list(sources.read_file(self._path("b.txt.gz"))), ["com.c"])
+        self.assertEqual(sources.duplicates, 3)
+
+    def test_resume(self):
+        for name, opener in [("pkgs.txt", open), ("pkgs.txt.gz", gzip.open)]:
+            path = self._path(name)
+            with opener(path, "wt") as f:
+                f.write("".join(f"com.app{i}\n" for i in range(10)))
+            state_path = self._path(f"{name}.state")
+
+            # stop after consuming 4 packages, i.e. while the 5th package is being scheduled
+            sources = PackageSources(capacity=100, state_path=state_path)
+            gen = sources.read_file(path)
+            consumed = [next(gen) for i in range(5)]
+            gen.close()
+            sources.save()
+
+            resumed = PackageSources(capacity=100, state_path=state_path)
+            rest = list(resumed.read_file(path))
+            self.assertEqual(rest, [f"com.app{i}" for i in range(4, 10)])
+            self.assertEqual(consumed[:4] + rest, [f"com.app{i}" for i in range(10)])
+
+            # a finished file is not read again
+            self.assertEqual(list(PackageSources(capacity=100, state_path=state_path).read_file(path)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
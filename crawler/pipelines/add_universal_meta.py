@@ -1,4 +1,5 @@
 import time
+from crawler.item import Result
 from crawler.util import market_from_spider
 
 
@@ -6,9 +7,10 @@ class AddUniversalMetaPipeline:
     def process_item(self, item, spider):
         """
         Adds a timestamp/market name to the meta data in the item
+        As the first pipeline, converts the item of the spider to a typed Result, which the other pipelines receive
         """
 
-        res = item
+        res = Result(item)
         res['meta']['timestamp'] = int(time.time())
         market = market_from_spider(spider)
         res['meta']['market'] = market
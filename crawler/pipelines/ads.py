@@ -8,7 +8,7 @@ from publicsuffixlist import PublicSuffixList
 from scrapy.pipelines.files import FilesPipeline
 
 from crawler.middlewares.sentry import capture
-from crawler.util import get_directory, sha256
+from crawler.util import get_directory, sha256, media_request_meta
 
 CONTENT_TYPE = "text/plain;charset=utf-8"
 
@@ -41,9 +41,8 @@ class AdsPipeline(FilesPipeline):
         paths = ["/app-ads.txt", "/ads.txt"]
         for path in paths:
             url = parsed_url._replace(netloc=root_domain, path=path).geturl()
-            item['download_timeout'] = 3
             info.spider.logger.debug(f"scheduling (app-)ads.txt from '{url}'")
-            yield scrapy.Request(url, meta=item)
+            yield scrapy.Request(url, meta=media_request_meta(item, download_timeout=3))
 
     def media_failed(self, failure, request, info):
         pass
@@ -1,13 +1,19 @@
-from asn1crypto import cms, x509
-
-import numpy as np
-from androguard.core.bytecodes.apk import APK
+import treq
 from sentry_sdk import capture_exception
+from twisted.internet import defer
+
+from crawler.item import as_dict
 
 _namespaces = {
     'android': 'http://schemas.android.com/apk/res/android'
 }
 
+# version assumed for fields of analyses that were stored before components were versioned
+_LEGACY_COMPONENT_VERSION = 1
+
+# registry of analysis components: field name -> (version, function of androguard APK)
+_COMPONENTS = {}
+
 
 def except_default(default_val):
     """
@@ -25,34 +31,120 @@ def except_default(default_val):
     return wrapped
 
 
+def component(name, version):
+    """
+    Decorator that registers a function as the analysis component that computes the field 'name' of an analysis.
+    Bump the version whenever the output of the component changes, so that existing analyses get the field recomputed.
+    """
+
+    def wrapped(f):
+        _COMPONENTS[name] = (version, f)
+        return f
+    return wrapped
+
+
+class AnalysisServerError(Exception):
+    def __init__(self, status, msg):
+        self.status = status
+        self.msg = msg
+
+    def __str__(self):
+        return f"analysis server responded with status {self.status}: {self.msg}"
+
+
 class AnalyzeApkPipeline:
+    def __init__(self, server_url=None, priority=0, timeout=600):
+        self.server_url = server_url
+        self.priority = priority
+        self.timeout = timeout
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            server_url=crawler.settings.get("ANALYSIS_SERVER_URL", None),
+            priority=crawler.settings.getint("ANALYSIS_PRIORITY", 0),
+            timeout=crawler.settings.getfloat("ANALYSIS_SERVER_TIMEOUT", 600)
+        )
+
     def process_item(self, item, spider):
         """
         Will perform an analysis on the APK defined in the filepath
+        Only the components of an existing analysis (e.g. found by PreDownloadVersionPipeline) that are missing or outdated are computed,
+        if the analysis is of the same APK (see _reusable_analysis)
+        If an analysis server is configured, the analyses are performed by the server instead of in-process
         """
-        meta = item['meta']
-
+        dl = []
         for version, dat in item['versions'].items():
             filepath = dat.get('file_path', None)
-            if filepath:
-                try:
-                    analysis = analyse(filepath)
-                    dat['analysis'] = analysis
-
-                    # obtain pkg_name
-                    pkg_name = analysis.get("pkg_name", None)
-                    existing_pkg_name = meta.get("pkg_name", None)
-                    if pkg_name and not existing_pkg_name:
-                        meta['pkg_name'] = pkg_name
-                    elif pkg_name and existing_pkg_name and pkg_name != existing_pkg_name:
-                        spider.logger.warning(f"pkg name in APK ({pkg_name}) does not match pkg name declared on market ({existing_pkg_name})")
-
-                    item['versions'][version] = dat
-                    item['meta'] = meta
-                except:
-                    pass
+            if not filepath:
+                continue
+            existing_analysis = _reusable_analysis(dat)
+            if not existing_analysis:
+                dat.pop('analysis', None)
+            sha = dat.get('file_sha256', None)
+            if self.server_url and sha and outdated_components(existing_analysis):
+                d = self._request_analysis(sha, filepath, existing_analysis)
+                d.addCallback(self._set_analysis, item, version, spider)
+                d.addErrback(self._analyse_locally, item, version, spider)
+                dl.append(d)
+            else:
+                self._analyse_locally(None, item, version, spider)
+
+        if dl:
+            return defer.DeferredList(dl).addCallback(lambda _: item)
         return item
 
+    def _request_analysis(self, sha, filepath, analysis):
+        body = dict(
+            sha256=sha,
+            path=filepath,
+            analysis=as_dict(analysis),
+            priority=self.priority
+        )
+        # a server that does not respond in time fails the request, such that the APK is analysed locally instead
+        d = treq.post(f"{self.server_url}/analyse", json=body, timeout=self.timeout)
+        d.addCallback(_analysis_content)
+        return d
+
+    def _analyse_locally(self, failure, item, version, spider):
+        if failure:
+            spider.logger.warning(f"failed to obtain analysis from server, analysing locally: {failure.getErrorMessage()}")
+        dat = item['versions'][version]
+        try:
+            analysis = analyse(dat['file_path'], analysis=dat.get('analysis', None))
+            self._set_analysis(analysis, item, version, spider)
+        except Exception as e:
+            spider.logger.warning(f"failed to analyse '{dat.get('file_path', None)}': {e}")
+
+    def _set_analysis(self, analysis, item, version, spider):
+        meta = item['meta']
+        dat = item['versions'][version]
+        dat['analysis'] = analysis
+
+        # obtain pkg_name
+        pkg_name = analysis.get("pkg_name", None)
+        existing_pkg_name = meta.get("pkg_name", None)
+        if pkg_name and not existing_pkg_name:
+            meta['pkg_name'] = pkg_name
+        elif pkg_name and existing_pkg_name and pkg_name != existing_pkg_name:
+            spider.logger.warning(f"pkg name in APK ({pkg_name}) does not match pkg name declared on market ({existing_pkg_name})")
+
+        item['versions'][version] = dat
+        item['meta'] = meta
+
+
+def _analysis_content(response):
+    """
+    Returns the analysis in the JSON body of a response of the analysis server
+    Raises: AnalysisServerError
+        if the server failed to analyse the APK
+    """
+    if response.code != 200:
+        d = treq.text_content(response)
+        d.addCallback(lambda text: defer.fail(AnalysisServerError(response.code, text.strip())))
+        return d
+    return treq.json_content(response)
+
 
 def _assetlinks_domain(host):
     """
@@ -84,7 +176,7 @@ def parse_app_links(man):
     """
     # find all domain names to be verified for app linking purposes
     man_hosts = man.xpath("//intent-filter[@android:autoVerify='true']/data/@android:host", namespaces=_namespaces)
-    unique_man_hosts = np.unique(man_hosts)
+    unique_man_hosts = sorted(set(man_hosts))
 
     assetlink_domains = {}
     for uh in unique_man_hosts:
@@ -121,6 +213,7 @@ def parse_cert(cert):
     )
 
 
+@component("certs", 1)
 def get_certs(apk):
     res = dict(
         v1=[],
@@ -161,7 +254,10 @@ def _uses_permissions_sdk_m(apk):
     return res
 
 
+@component("signers", 1)
 def get_signers(apk):
+    from asn1crypto import cms, x509
+
     res = dict(
         v1=[],
         v2=[],
@@ -239,46 +335,132 @@ def _get_effective_sdk_version(apk):
     return apk.get_effective_target_sdk_version()
 
 
-def analyse(path):
+@component("pkg_name", 1)
+def _get_pkg_name(apk):
+    return apk.package
+
+
+@component("permissions", 1)
+def _get_permissions(apk):
+    return dict(
+        uses=apk.uses_permissions,
+        uses_23=_uses_permissions_sdk_23(apk),
+        uses_m=_uses_permissions_sdk_m(apk),
+        declared=apk.declared_permissions
+    )
+
+
+@component("sdk_version", 1)
+def _get_sdk_version(apk):
+    return dict(
+        min=_get_min_sdk_version(apk),
+        max=_get_max_sdk_version(apk),
+        target=_get_target_sdk_version(apk),
+        effective=_get_effective_sdk_version(apk)
+    )
+
+
+@component("android_version", 1)
+def _get_android_version(apk):
+    return dict(
+        name=_get_android_version_name(apk),
+        code=_get_android_version_code(apk)
+    )
+
+
+@component("assetlink_domains", 1)
+def _get_assetlink_domains(apk):
+    return parse_app_links(apk.get_android_manifest_xml())
+
+
+def component_versions(analysis):
+    """
+    Returns the versions of the components that produced the given analysis
+    Analyses stored before components were versioned are assumed to be produced by the first version of each component
+    Args:
+        analysis: dict
+
+    Returns: dict of str -> int
+    """
+    if not analysis:
+        return {}
+    versions = analysis.get("component_versions", None)
+    if versions is not None:
+        return versions
+    return {name: _LEGACY_COMPONENT_VERSION for name in _COMPONENTS if name in analysis}
+
+
+def _reusable_analysis(dat):
+    """
+    Returns the existing analysis of a version if it is of the APK that is analysed now,
+    i.e. the download was skipped in favour of the stored APK, or the downloaded APK is the one that was analysed before
+    Args:
+        dat: dict
+            version of an item
+
+    Returns: dict
+    """
+    analysis = dat.get('analysis', None)
+    if not analysis:
+        return None
+    if dat.get('skip', False):
+        return analysis
+    sha = dat.get('file_sha256', None)
+    if sha and sha == dat.get('analysis_sha256', None):
+        return analysis
+    return None
+
+
+def outdated_components(analysis):
+    """
+    Returns the names of the components that are missing from, or outdated in, the given analysis
+    Args:
+        analysis: dict
+
+    Returns: list of str
+    """
+    versions = component_versions(analysis)
+    return [name for name, (version, _) in _COMPONENTS.items() if versions.get(name, None) != version]
+
+
+def analyse(path, analysis=None):
     """
     Analyses the APK at the given path
+    If an existing analysis is given, only its missing or outdated components are computed,
+    and the APK is not parsed at all if every component is up-to-date
     Args:
         path: str
+        analysis: dict
 
     Returns: dict
 
     """
+    res = dict(analysis) if analysis else {}
+    versions = dict(component_versions(analysis))
+    res['path'] = path
+    res.setdefault('assetlink_status', {})
+
+    outdated = outdated_components(analysis)
+    if not outdated:
+        res['component_versions'] = versions
+        return res
+
+    # androguard is only imported once an APK is actually analysed, as it is slow to import
+    from androguard.core.bytecodes.apk import APK
     try:
         apk = APK(path, testzip=False)
     except Exception as e:
         capture_exception(e)
+        if analysis:
+            return res
         return dict(
             path=path
         )
 
-    res = dict(
-        path=path,
-        certs=get_certs(apk),
-        signers=get_signers(apk),
-        pkg_name=apk.package,
-        permissions=dict(
-            uses=apk.uses_permissions,
-            uses_23=_uses_permissions_sdk_23(apk),
-            uses_m=_uses_permissions_sdk_m(apk),
-            declared=apk.declared_permissions
-        ),
-        sdk_version=dict(
-            min=_get_min_sdk_version(apk),
-            max=_get_max_sdk_version(apk),
-            target=_get_target_sdk_version(apk),
-            effective=_get_effective_sdk_version(apk)
-        ),
-        android_version=dict(
-            name=_get_android_version_name(apk),
-            code=_get_android_version_code(apk)
-        ),
-        assetlink_domains=parse_app_links(apk.get_android_manifest_xml()),
-        assetlink_status={}
-    )
+    for name in outdated:
+        version, f = _COMPONENTS[name]
+        res[name] = f(apk)
+        versions[name] = version
+    res['component_versions'] = versions
 
     return res
@@ -1,9 +1,14 @@
+import threading
+import time
 import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 from lxml import etree
+from scrapy import Spider
+from twisted.trial.unittest import TestCase as TrialTestCase
 
 from crawler.pipelines.analyze_apks import AnalyzeApkPipeline, parse_app_links, _assetlinks_domain, \
-    _get_android_version_name
+    _get_android_version_name, analyse, outdated_components, _COMPONENTS
 
 
 # TODO: remote test
@@ -65,5 +70,96 @@ class TestAnalysis(unittest.TestCase):
             self.assertEqual(expected, actual)
 
 
+class TestComponentVersions(unittest.TestCase):
+    def test_outdated_components(self):
+        current = {name: version for name, (version, _) in _COMPONENTS.items()}
+
+        # nothing analysed before
+        self.assertEqual(outdated_components(None), list(_COMPONENTS))
+
+        # up-to-date analysis
+        analysis = {name: None for name in current}
+        analysis['component_versions'] = current
+        self.assertEqual(outdated_components(analysis), [])
+
+        # outdated component
+        analysis['component_versions'] = dict(current, signers=0)
+        self.assertEqual(outdated_components(analysis), ["signers"])
+
+        # legacy analysis, from before 'signers' was added
+        analysis = {name: None for name in current if name != "signers"}
+        self.assertEqual(outdated_components(analysis), ["signers"])
+
+    def test_analyse_up_to_date(self):
+        current = {name: version for name, (version, _) in _COMPONENTS.items()}
+        analysis = {name: "existing" for name in current}
+        analysis['component_versions'] = current
+
+        # the APK does not exist, so it must not be parsed
+        res = analyse("/does/not/exist.apk", analysis=analysis)
+        for name in current:
+            self.assertEqual(res[name], "existing")
+        self.assertEqual(res['path'], "/does/not/exist.apk")
+        self.assertEqual(res['component_versions'], current)
+
+    def test_reuse_analysis_of_same_apk(self):
+        current = {name: version for name, (version, _) in _COMPONENTS.items()}
+        analysis = {name: "existing" for name in current}
+        analysis['component_versions'] = current
+
+        def process(**dat):
+            item = dict(meta={"pkg_name": "com.example"}, versions={"1.0": dict(file_path="/does/not/exist.apk", analysis=dict(analysis), **dat)})
+            return AnalyzeApkPipeline().process_item(item, Spider("test"))['versions']['1.0']['analysis']
+
+        # the stored APK, or the same APK downloaded again
+        self.assertEqual(process(skip=True, file_sha256="old")['pkg_name'], "existing")
+        self.assertEqual(process(file_sha256="old", analysis_sha256="old")['pkg_name'], "existing")
+
+        # a newly downloaded APK is analysed from scratch, for which it does not exist
+        self.assertEqual(process(file_sha256="new", analysis_sha256="old"), {"path": "/does/not/exist.apk"})
+        self.assertEqual(process(file_sha256="new"), {"path": "/does/not/exist.apk"})
+
+
+class _FailingHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path.startswith("/hang/"):
+            time.sleep(2)
+        self.send_error(500)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestAnalysisServerFailure(TrialTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _FailingHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _process(self, server_path):
+        url = f"http://127.0.0.1:{self.server.server_address[1]}{server_path}"
+        pipeline = AnalyzeApkPipeline(server_url=url, timeout=0.5)
+        item = dict(
+            meta={"pkg_name": "com.example"},
+            versions={"1.0": {"file_path": "/does/not/exist.apk", "file_sha256": "sha"}}
+        )
+        d = pipeline.process_item(item, Spider("test"))
+
+        def check(item):
+            # the APK is analysed locally instead, for which it does not exist
+            self.assertEqual(item['versions']['1.0']['analysis'], {"path": "/does/not/exist.apk"})
+        return d.addCallback(check)
+
+    def test_error_status(self):
+        return self._process("")
+
+    def test_timeout(self):
+        return self._process("/hang")
+
+
 if __name__ == '__main__':
     unittest.main()
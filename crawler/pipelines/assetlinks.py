@@ -7,6 +7,8 @@ from urllib.parse import urlparse
 import scrapy
 from scrapy.pipelines.files import FilesPipeline
 
+from crawler.util import media_request_meta
+
 
 class AssetLinksPipeline(FilesPipeline):
     """
@@ -35,9 +37,8 @@ class AssetLinksPipeline(FilesPipeline):
                 if domain not in self.seen:
                     if len(domain.split(".")) > 1:
                         url = f"https://{domain}/.well-known/assetlinks.json"
-                        item['download_timeout'] = 3
                         info.spider.logger.debug(f"scheduling asset links from '{url}'")
-                        yield scrapy.Request(url, meta=item)
+                        yield scrapy.Request(url, meta=media_request_meta(item, download_timeout=3))
                     else:
                         info.spider.logger.debug(f"ignoring assetlink domain '{domain}' because it appears to be invalid")
 
@@ -1,9 +1,12 @@
 import json
 import os
 from datetime import datetime
+from scrapy import signals
 from sqlalchemy import create_engine
 from sqlalchemy.sql import text
 
+from crawler.item import as_dict
+
 _version_table = "versions"
 
 _sqlite_tables = [
@@ -24,6 +27,12 @@ _tables_from_dbtype = {
 }
 
 
+# engines by DSN, such that all pipelines and spiders in a process share one connection pool per database
+_ENGINES = {}
+# crawlers that use the engines, which are disposed once the spiders of all of them are closed
+_ENGINE_CRAWLERS = set()
+
+
 class InvalidParametersError(Exception):
     pass
 
@@ -41,6 +50,7 @@ def _postgres_dsn_from_params(params):
 def _engine_from_params(params):
     """
     Return the database connection given the database settings of the crawler
+    The engine is created once per database, and shared by all callers in the process
     Args:
         params: dict
 
@@ -51,17 +61,50 @@ def _engine_from_params(params):
     if dbtype == "sqlite":
         filename = db_specific_params.get("dbfile", None)
         dsn = f"sqlite:///{filename}"
-        engine = create_engine(dsn)
+        if dsn not in _ENGINES:
+            _ENGINES[dsn] = create_engine(dsn)
     elif dbtype == "postgres":
         dsn = _postgres_dsn_from_params(db_specific_params)
-        connect_args = {
-            "timeout": 300  # 5 minutes
-        }
-        engine = create_engine(dsn, pool_size=1, max_overflow=0, connect_args=connect_args)
+        if dsn not in _ENGINES:
+            connect_args = {
+                "timeout": 300  # 5 minutes
+            }
+            _ENGINES[dsn] = create_engine(dsn, pool_size=1, max_overflow=0, connect_args=connect_args)
     else:
         raise InvalidParametersError
 
-    return engine, dbtype
+    return _ENGINES[dsn], dbtype
+
+
+def engine_from_crawler(crawler):
+    """
+    Return the database connection given the settings of the crawler, see _engine_from_params
+    The connections of the engines are closed when the spiders of all crawlers that use them are closed
+    Args:
+        crawler: scrapy.crawler.Crawler
+
+    Returns: database connection
+    """
+    res = _engine_from_params(crawler.settings.get("DATABASE_PARAMS"))
+    if crawler not in _ENGINE_CRAWLERS:
+        _ENGINE_CRAWLERS.add(crawler)
+        crawler.signals.connect(_engines_closed, signal=signals.spider_closed)
+    return res
+
+
+def _engines_closed(sender, **kwargs):
+    _ENGINE_CRAWLERS.discard(sender)
+    if not _ENGINE_CRAWLERS:
+        dispose_engines()
+
+
+def dispose_engines():
+    """
+    Closes the connections in the pools of all engines
+    An engine opens new connections when it is used again afterwards
+    """
+    for engine in _ENGINES.values():
+        engine.dispose()
 
 
 class _DatabaseConnection:
@@ -82,8 +125,7 @@ class _DatabaseConnection:
 class DatabasePipeline:
     def __init__(self, crawler):
         rootdir = crawler.settings.get('CRAWL_ROOTDIR', "/tmp/crawl")
-        params = crawler.settings.get("DATABASE_PARAMS")
-        engine, dbtype = _engine_from_params(params)
+        engine, dbtype = engine_from_crawler(crawler)
 
         self.engine = engine
         self.dbtype = dbtype
@@ -106,13 +148,11 @@ class DatabasePipeline:
     def execute(self, qry, vals={}):
         """
         Executes a database query
-        Afterwards, cleans up the connection to the db
+        The connection is returned to the pool of the engine afterwards, so the rows of the result are fetched beforehand
         """
-        try:
-            with self.engine.connect() as con:
-                return con.execute(qry, **vals)
-        finally:
-            self.engine.dispose()
+        with self.engine.connect() as con:
+            res = con.execute(qry, **vals)
+            return res.freeze()() if res.returns_rows else res
 
 
 class PostDownloadPackagePipeline(DatabasePipeline):
@@ -192,9 +232,12 @@ class PreDownloadVersionPipeline(DatabasePipeline):
                 spider.logger.debug(f"unseen APK of version '{version}' of '{pkg_name if pkg_name else identifier}' before")
             if existing_meta:
                 spider.logger.info(f"seen analysis of version '{version}' of '{pkg_name if pkg_name else identifier}' before")
-                existing_analysis = existing_meta['versions'].get(version, {}).get('analysis', None)
+                existing_version = existing_meta['versions'].get(version, {})
+                existing_analysis = existing_version.get('analysis', None)
                 if existing_analysis:
                     dat['analysis'] = existing_analysis
+                    # the APK of the analysis, as a newer download of the version may differ (see AnalyzeApkPipeline)
+                    dat['analysis_sha256'] = existing_sha or existing_version.get('file_sha256', None)
                 meta['pkg_name'] = existing_meta['meta'].get('pkg_name', None)
             else:
                 spider.logger.debug(f"unseen analysis of version '{version}' of '{pkg_name if pkg_name else identifier}' before")
@@ -264,6 +307,7 @@ class PostDownloadPipeline(DatabasePipeline):
             versions[version] = dat
 
         # create row for every version, and write ALL versions data to the database
+        jsonstr = json.dumps(as_dict(store_item))
         for version, dat in versions.items():
             sha = dat.get("file_sha256", None)
             if not dat.get("skip", False):
@@ -275,7 +319,6 @@ class PostDownloadPipeline(DatabasePipeline):
                     self.create_sha(sha, path)
 
             # create version in database
-            jsonstr = json.dumps(store_item)
             self.create_version(pkg_name, identifier, version, market, sha, ts, jsonstr)
         return item
 
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from scrapy import Spider, signals
+from scrapy.utils.test import get_crawler
+from sqlalchemy.sql import text
+
+from crawler.pipelines import database
+from crawler.pipelines.database import DatabasePipeline, _engine_from_params, engine_from_crawler
+
+
+class TestEngine(unittest.TestCase):
+    def test_shared_engine(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            params = dict(type="sqlite", sqlite=dict(dbfile=os.path.join(tmpdir, "test.db")))
+            engine, dbtype = _engine_from_params(params)
+            self.assertEqual(dbtype, "sqlite")
+
+            # the spiders of a process share the engine of a database
+            self.assertIs(_engine_from_params(dict(params))[0], engine)
+
+            other = dict(type="sqlite", sqlite=dict(dbfile=os.path.join(tmpdir, "other.db")))
+            self.assertIsNot(_engine_from_params(other)[0], engine)
+
+    def test_dispose_on_close(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            params = dict(type="sqlite", sqlite=dict(dbfile=os.path.join(tmpdir, "test.db")))
+            crawlers = [get_crawler(Spider, {"DATABASE_PARAMS": params, "CRAWL_ROOTDIR": tmpdir}) for _ in range(2)]
+            pipeline = DatabasePipeline(crawlers[0])
+            engine, _ = engine_from_crawler(crawlers[1])
+
+            with mock.patch.object(engine, "dispose", wraps=engine.dispose) as dispose:
+                # queries keep the connections of the engine
+                pipeline.execute(text("INSERT INTO apks (sha256, path) VALUES ('abc', 'a.apk')"))
+                self.assertEqual(pipeline.path_by_sha("abc"), "a.apk")
+                dispose.assert_not_called()
+
+                # the engine is disposed once the spiders of all crawlers that use it are closed
+                crawlers[0].signals.send_catch_log(signals.spider_closed, spider=None, reason="finished")
+                dispose.assert_not_called()
+                crawlers[1].signals.send_catch_log(signals.spider_closed, spider=None, reason="finished")
+                dispose.assert_called_once()
+            self.assertEqual(database._ENGINE_CRAWLERS, set())
+
+
+if __name__ == '__main__':
+    unittest.main()
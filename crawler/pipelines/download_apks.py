@@ -9,7 +9,7 @@ try:
 except ImportError:
     from io import BytesIO
 
-from crawler.util import get_directory, sha256, get_identifier
+from crawler.util import get_directory, sha256, get_identifier, media_request_meta
 
 
 class DownloadApksPipeline(FilesPipeline):
@@ -53,7 +53,7 @@ class DownloadApksPipeline(FilesPipeline):
             cookies = values.get("cookies", None)
             if download_url:
                 info.spider.logger.debug(f"scheduling download for '{identifier}' from '{download_url}'")
-                yield scrapy.Request(download_url, headers=headers, cookies=cookies, meta={'meta': item['meta'], 'version': version}, priority=100)
+                yield scrapy.Request(download_url, headers=headers, cookies=cookies, meta=media_request_meta(item, version=version), priority=100)
 
     def media_failed(self, failure, request, info):
         """Handler for failed downloads"""
@@ -4,7 +4,7 @@ from datetime import datetime
 import scrapy
 from scrapy.pipelines.files import FilesPipeline
 
-from crawler.util import get_directory, sha256
+from crawler.util import get_directory, sha256, media_request_meta
 
 
 class DownloadIconPipeline(FilesPipeline):
@@ -31,7 +31,7 @@ class DownloadIconPipeline(FilesPipeline):
     def get_media_requests(self, item, info):
         icon_url = item['meta'].get('icon_url', None)
         if icon_url:
-            yield scrapy.Request(icon_url, meta={'meta': item['meta']}, priority=100)
+            yield scrapy.Request(icon_url, meta=media_request_meta(item), priority=100)
 
     def media_failed(self, failure, request, info):
         pass
@@ -1,5 +1,6 @@
 from scrapy import signals
 from twisted.internet import task
+from crawler.pipelines.util import init_influxdb_client
 from crawler.util import market_from_spider
 
 
@@ -10,7 +11,7 @@ class InfluxdbPipeline:
 
     @classmethod
     def from_crawler(cls, crawler):
-        o = cls(crawler.settings.get("INFLUXDB_CLIENT"))
+        o = cls(init_influxdb_client(crawler.settings.get("INFLUXDB_PARAMS", {})))
 
         crawler.signals.connect(o.spider_opened, signal=signals.spider_opened)
         crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
@@ -18,6 +19,7 @@ class InfluxdbPipeline:
         return o
 
     def spider_opened(self, spider):
+        self.influxdb_client.acquire()
         tasks = []
         t = task.LoopingCall(self.influxdb_client.send, spider)  # send to influxdb every 5 secs
         t.start(5, now=False)
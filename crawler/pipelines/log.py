@@ -1,11 +1,17 @@
 from datetime import datetime
-import time
-from crawler.util import get_identifier
+
+from crawler import pacing
+from crawler.util import get_identifier, market_from_spider
 
 
 class LogPipeline:
+    """
+    Logs processed items, and paces the market by delaying its new requests for 'pause_interval' seconds after every item
+    """
+
     def __init__(self, pause_interval):
         self.pause_interval = pause_interval
+        self.pacer = pacing.init_pacer()
 
     @classmethod
     def from_settings(cls, settings):
@@ -21,18 +27,5 @@ class LogPipeline:
             del item['__pkg_start_time']
         else:
             spider.logger.info(f"processed '{identifier}'")
-        pause(self.pause_interval, spider.crawler)
+        self.pacer.delay(market_from_spider(spider), self.pause_interval)
         return item
-
-
-def pause(t, crawler):
-    """
-    Pause the crawler 't' seconds
-    """
-    if not t:
-        return
-    try:
-        crawler.engine.pause()
-        time.sleep(t)
-    finally:
-        crawler.engine.unpause()
@@ -1,6 +1,7 @@
 import json
 import os
 
+from crawler.item import as_dict
 from crawler.util import get_directory
 
 FNAME = "meta.json"
@@ -35,7 +36,7 @@ class WriteMetaFilePipeline:
         os.makedirs(os.path.dirname(fpath), exist_ok=True) # ensure directories exist
 
         with open(fpath, "a+") as f:
-            jsonstr = json.dumps(dict(item))
+            jsonstr = json.dumps(as_dict(item))
             f.write(jsonstr + "\n")
 
         return item
@@ -4,7 +4,7 @@ import scrapy
 from scrapy.pipelines.files import FilesPipeline
 
 from crawler.middlewares.sentry import _response_tags, capture
-from crawler.util import get_directory
+from crawler.util import get_directory, media_request_meta
 
 
 class PrivacyPolicyPipeline(FilesPipeline):
@@ -32,8 +32,7 @@ class PrivacyPolicyPipeline(FilesPipeline):
         privacy_policy_url = item['meta'].get('privacy_policy_url')
         if privacy_policy_url:
             info.spider.logger.debug(f"scheduling download privacy policy from '{privacy_policy_url}'")
-            item['download_timeout'] = 3
-            yield scrapy.Request(privacy_policy_url, meta=item)
+            yield scrapy.Request(privacy_policy_url, meta=media_request_meta(item, download_timeout=3))
 
     def item_completed(self, results, item, info):
         if len(results) > 1:
@@ -1,18 +1,30 @@
 from datetime import datetime, timezone
 
 import scrapy
-from influxdb_client import InfluxDBClient as InfluxClient, Point
-from influxdb_client.client.write_api import SYNCHRONOUS
-
-from influxdb.exceptions import InfluxDBClientError, InfluxDBServerError
 from sentry_sdk import capture_exception
 
+INFLUXDB_CLIENT = None
+
+
+def init_influxdb_client(params={}):
+    global INFLUXDB_CLIENT
+    if not INFLUXDB_CLIENT:
+        INFLUXDB_CLIENT = InfluxDBClient(params)
+    return INFLUXDB_CLIENT
+
 
 class InfluxDBClient:
+    """
+    Buffers points and writes them to InfluxDB when enabled, and is a no-op otherwise
+    The InfluxDB client libraries are only imported when enabled, as they take a significant part of the startup time of a spider
+    A client can be shared by the spiders of a process: every user calls 'acquire', and the client is closed when the last user closes it
+    """
+
     def __init__(self, params={}):
         self.points = []
         self.api = None
         self.c = None
+        self.users = 0
 
         enabled = params.get("enabled", False)
         if enabled:
@@ -21,10 +33,13 @@ class InfluxDBClient:
             org = params.get("organisation", None)
             bucket = params.get("bucket", None)
             self.bucket = bucket
+            from influxdb_client import InfluxDBClient as InfluxClient
+            from influxdb_client.client.write_api import SYNCHRONOUS
             self.c = InfluxClient(url=url, token=token, org=org)
             self.api = self.c.write_api(write_options=SYNCHRONOUS)
 
     def _add_point(self, point, t):
+        from influxdb_client import Point
         point['time'] = t
         point = Point.from_dict(point)
         self.points.append(point)
@@ -42,6 +57,7 @@ class InfluxDBClient:
 
     def send(self, spider):
         if self.api:
+            from influxdb.exceptions import InfluxDBClientError, InfluxDBServerError
             try:
                 self.api.write(bucket=self.bucket, record=self.points)
             except (InfluxDBClientError, InfluxDBServerError) as e:
@@ -50,8 +66,12 @@ class InfluxDBClient:
             finally:
                 self.points = []
 
+    def acquire(self):
+        self.users += 1
+
     def close(self):
-        if self.api:
+        self.users = max(self.users - 1, 0)
+        if self.api and self.users == 0:
             self.c.close()
 
 
@@ -0,0 +1,106 @@
+class ProxyHealth:
+    """
+    Exponentially weighted moving averages (EWMA) of the behaviour of a single proxy
+    """
+
+    def __init__(self, latency):
+        self.latency = latency  # seconds per request, excluding large transfers
+        self.error_rate = 0  # fraction of requests that failed
+        self.throughput = None  # bytes per second of large transfers (e.g. APKs), None if not observed yet
+        self.samples = 0  # number of requests since the proxy was (re)admitted
+        self.strikes = 0  # number of consecutive quarantines
+
+
+class HealthTracker:
+    """
+    Scores proxies by their health, based on the latency, error rate and throughput observed by the DurationMiddleware.
+    The score estimates the number of successful requests per second a proxy handles:
+        (1 - error_rate) / (latency + reference_bytes / throughput)
+    New proxies start with an optimistic prior, such that they are tried before being judged.
+
+    Proxies that are persistently bad (i.e. of which the error rate or latency exceed the limits after at least 'min_samples' requests)
+    are quarantined, for a time that doubles with every consecutive quarantine.
+    """
+
+    def __init__(self, alpha=0.2, prior_latency=1, large_transfer_bytes=1024 * 1024, reference_bytes=10 * 1024 * 1024,
+                 min_samples=10, max_error_rate=0.5, max_latency=30, quarantine_time=300, max_quarantine_time=3600):
+        self.alpha = alpha
+        self.prior_latency = prior_latency
+        self.large_transfer_bytes = large_transfer_bytes
+        self.reference_bytes = reference_bytes
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.max_latency = max_latency
+        self.quarantine_time = quarantine_time
+        self.max_quarantine_time = max_quarantine_time
+        self.proxies = {}  # proxy -> ProxyHealth
+
+    def _health(self, proxy):
+        health = self.proxies.get(proxy, None)
+        if not health:
+            health = ProxyHealth(self.prior_latency)
+            self.proxies[proxy] = health
+        return health
+
+    def _ewma(self, avg, value):
+        return avg + self.alpha * (value - avg)
+
+    def score(self, proxy):
+        """
+        Returns the score of the proxy, higher is better
+        """
+        health = self.proxies.get(proxy, None)
+        if not health:
+            return 1 / self.prior_latency
+        cost = health.latency
+        if health.throughput:
+            cost += self.reference_bytes / health.throughput
+        return (1 - health.error_rate) / max(cost, 1e-6)
+
+    def get_state(self):
+        return {proxy: vars(health).copy() for proxy, health in self.proxies.items()}
+
+    def set_state(self, state):
+        for proxy, fields in state.items():
+            health = ProxyHealth(self.prior_latency)
+            health.__dict__.update(fields)
+            self.proxies[proxy] = health
+
+    def record(self, proxy, latency, size=0, error=False):
+        """
+        Records a finished request of the proxy
+        Args:
+            proxy: str
+            latency: float
+                number of seconds the request took
+            size: int
+                number of bytes in the response body
+            error: bool
+                whether the request failed (e.g. timeout, connection error or error of the proxy)
+
+        Returns: float
+            number of seconds to quarantine the proxy for, or 0
+        """
+        health = self._health(proxy)
+        health.samples += 1
+        health.error_rate = self._ewma(health.error_rate, 1 if error else 0)
+        if not error and size >= self.large_transfer_bytes:
+            # the duration of large transfers depends on their size, so they are tracked as throughput instead of latency
+            throughput = size / max(latency, 1e-6)
+            health.throughput = throughput if health.throughput is None else self._ewma(health.throughput, throughput)
+        else:
+            health.latency = self._ewma(health.latency, latency)
+
+        if health.samples < self.min_samples:
+            return 0
+        if health.error_rate < self.max_error_rate and health.latency < self.max_latency:
+            health.strikes = 0
+            return 0
+
+        # quarantine the proxy, and give it a fresh start afterwards
+        quarantine_time = min(self.quarantine_time * 2 ** health.strikes, self.max_quarantine_time)
+        strikes = health.strikes + 1
+        health = ProxyHealth(self.prior_latency)
+        health.strikes = strikes
+        self.proxies[proxy] = health
+        return quarantine_time
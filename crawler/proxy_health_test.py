@@ -0,0 +1,64 @@
+import unittest
+
+from crawler.proxy_health import HealthTracker
+
+
+class TestHealthTracker(unittest.TestCase):
+    def setUp(self):
+        self.tracker = HealthTracker(min_samples=5, max_error_rate=0.5, max_latency=10, quarantine_time=60, max_quarantine_time=200)
+
+    def test_score(self):
+        for i in range(5):
+            self.tracker.record("fast", 0.1)
+            self.tracker.record("slow", 2)
+            self.tracker.record("flaky", 0.1, error=i % 2 == 0)
+
+        self.assertGreater(self.tracker.score("fast"), self.tracker.score("slow"))
+        self.assertGreater(self.tracker.score("fast"), self.tracker.score("flaky"))
+
+        # unknown proxies are scored optimistically
+        self.assertGreater(self.tracker.score("new"), self.tracker.score("slow"))
+
+    def test_throughput(self):
+        mb = 1024 * 1024
+        for i in range(5):
+            self.tracker.record("fast", 0.1)
+            self.tracker.record("fast", 1, size=10 * mb)
+            self.tracker.record("slow", 0.1)
+            self.tracker.record("slow", 10, size=10 * mb)
+
+        # large transfers do not count towards the latency
+        self.assertAlmostEqual(self.tracker.proxies["slow"].latency, self.tracker.proxies["fast"].latency)
+        self.assertAlmostEqual(self.tracker.proxies["fast"].throughput, mb * 10)
+        self.assertGreater(self.tracker.score("fast"), self.tracker.score("slow"))
+
+    def test_quarantine(self):
+        for i in range(4):
+            self.assertEqual(self.tracker.record("proxy", 1, error=True), 0)
+        self.assertEqual(self.tracker.record("proxy", 1, error=True), 60)
+
+        # the quarantine time doubles for consecutive quarantines
+        for i in range(4):
+            self.assertEqual(self.tracker.record("proxy", 1, error=True), 0)
+        self.assertEqual(self.tracker.record("proxy", 1, error=True), 120)
+        for i in range(5):
+            self.tracker.record("proxy", 1, error=True)
+        self.assertEqual(self.tracker.proxies["proxy"].strikes, 3)
+
+        # capped by the maximum quarantine time
+        for i in range(4):
+            self.tracker.record("proxy", 1, error=True)
+        self.assertEqual(self.tracker.record("proxy", 1, error=True), 200)
+
+    def test_recovery(self):
+        for i in range(5):
+            self.tracker.record("proxy", 20)
+        self.assertEqual(self.tracker.proxies["proxy"].strikes, 1)
+
+        for i in range(5):
+            self.assertEqual(self.tracker.record("proxy", 0.5), 0)
+        self.assertEqual(self.tracker.proxies["proxy"].strikes, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,261 @@
+from collections import deque
+
+LIMITER = None
+CONTROLLER = None
+
+
+def init_limiter(clock=None, shared_state=None):
+    global LIMITER
+    if not LIMITER:
+        LIMITER = TokenBucketLimiter(clock=clock, shared_state=shared_state)
+    return LIMITER
+
+
+def init_controller(clock=None):
+    global CONTROLLER
+    if not CONTROLLER:
+        CONTROLLER = AimdController(clock=clock)
+    return CONTROLLER
+
+
+class TokenBucket:
+    """
+    Token bucket that allows 'rate' requests per second on average, with bursts of up to 'burst' requests.
+    Tokens can be reserved ahead of time, in which case the bucket goes into debt and subsequent reservations are spaced at the rate.
+    """
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = now
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def reserve(self, now):
+        """
+        Takes a token from the bucket
+        Returns: float
+            number of seconds to wait before the token may be used
+        """
+        self._refill(now)
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+    def wait_time(self, now):
+        """
+        Returns the number of seconds until a token is available, without taking it
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class TokenBucketLimiter:
+    """
+    Limits the request rate per (proxy, domain) with token buckets, of which the rate and burst are configured per market
+    When given a crawler.shared_state.SharedState, the buckets are shared with the limiters of other processes on the host.
+    """
+
+    # number of reservations after which idle buckets are removed
+    _gc_interval = 10000
+
+    def __init__(self, clock=None, shared_state=None):
+        if clock is None:
+            from twisted.internet import reactor
+            clock = reactor
+        self.clock = clock
+        self.shared_state = shared_state
+        self.params = {}  # market -> (rate, burst)
+        self.buckets = {}  # (proxy, domain) -> TokenBucket
+        self._reservations = 0
+
+    def configure(self, market, rate=0, burst=1):
+        """
+        Configures the rate (requests per second) and burst for the requests of a market; a rate of 0 disables limiting
+        """
+        self.params[market] = (rate, max(burst, 1))
+
+    def reserve(self, market, proxy, domain, rate=None):
+        """
+        Reserves a request to the domain through the proxy
+        Args:
+            market: str
+            proxy: str
+            domain: str
+            rate: float
+                overrides the configured rate of the market
+
+        Returns: float
+            number of seconds to wait before sending the request
+        """
+        configured_rate, burst = self.params.get(market, (0, 1))
+        if rate is None:
+            rate = configured_rate
+        if not rate or rate <= 0:
+            return 0
+
+        now = self.clock.seconds()
+        self._reservations += 1
+        if self._reservations % self._gc_interval == 0:
+            self._gc(now)
+
+        if self.shared_state:
+            wait = self.shared_state.reserve(f"{proxy}|{domain}", rate, burst, now)
+            if wait is not None:
+                return wait
+            # the database is locked by another process, so the bucket of this process is used instead
+
+        key = (proxy, domain)
+        bucket = self.buckets.get(key, None)
+        if not bucket:
+            bucket = TokenBucket(rate, burst, now)
+            self.buckets[key] = bucket
+        else:
+            bucket._refill(now)
+            bucket.rate = rate
+            bucket.burst = burst
+
+        return bucket.reserve(now)
+
+    def get_state(self):
+        return {key: (bucket.rate, bucket.burst, bucket.tokens, bucket.last) for key, bucket in self.buckets.items()}
+
+    def set_state(self, state):
+        for key, (rate, burst, tokens, last) in state.items():
+            bucket = TokenBucket(rate, burst, last)
+            bucket.tokens = tokens
+            self.buckets[key] = bucket
+
+    def _gc(self, now):
+        if self.shared_state:
+            self.shared_state.gc(now)
+        for key in [key for key, bucket in self.buckets.items() if bucket.is_full(now)]:
+            del self.buckets[key]
+
+
+class AimdState:
+    def __init__(self, rate, now):
+        self.rate = rate
+        self.events = deque()  # (time, limited)-tuples in the current window
+        self.limited = 0
+        self.window_start = now
+
+    def ratio(self):
+        """
+        Returns the percentage of rate limited responses in the current window
+        """
+        if not self.events:
+            return 0
+        return self.limited / len(self.events) * 100
+
+    def reset_window(self, now):
+        self.events.clear()
+        self.limited = 0
+        self.window_start = now
+
+
+class AimdController:
+    """
+    Adapts the request rate per (market, proxy) with additive-increase/multiplicative-decrease (AIMD), based on the ratio of rate limited responses.
+    The ratio is tracked over a sliding time window:
+    - the rate is increased by 'inc_start' requests per second for every full window in which the ratio stays below 'epsilon' percent
+    - the rate is multiplied by 'decrease_factor' as soon as the ratio reaches 'epsilon' percent (after at least 'min_samples' responses),
+      after which the window starts over
+    """
+
+    def __init__(self, clock=None):
+        if clock is None:
+            from twisted.internet import reactor
+            clock = reactor
+        self.clock = clock
+        self.params = {}  # market -> dict
+        self.states = {}  # (market, proxy) -> AimdState
+
+    def configure(self, market, time_window_size=30, inc_start=0.1, epsilon=5, start_rate=1, min_rate=0.01, max_rate=None, decrease_factor=0.5, min_samples=5):
+        self.params[market] = dict(
+            time_window_size=time_window_size,
+            inc_start=inc_start,
+            epsilon=epsilon,
+            start_rate=start_rate,
+            min_rate=min_rate,
+            max_rate=max_rate,
+            decrease_factor=decrease_factor,
+            min_samples=min_samples
+        )
+
+    def _state(self, market, proxy, now):
+        key = (market, proxy)
+        state = self.states.get(key, None)
+        if not state:
+            state = AimdState(self.params[market]['start_rate'], now)
+            self.states[key] = state
+        return state
+
+    def get_state(self):
+        """
+        Returns the adapted rates, the windows are not persisted
+        """
+        return {key: state.rate for key, state in self.states.items()}
+
+    def set_state(self, state):
+        now = self.clock.seconds()
+        for key, rate in state.items():
+            self.states[key] = AimdState(rate, now)
+
+    def rate(self, market, proxy):
+        """
+        Returns the current rate (requests per second) for the market and proxy, or None if the market is not controlled
+        """
+        if market not in self.params:
+            return None
+        return self._state(market, proxy, self.clock.seconds()).rate
+
+    def record(self, market, proxy, limited):
+        """
+        Records a response for the market and proxy, and adapts the rate if needed
+        Args:
+            market: str
+            proxy: str
+            limited: bool
+                whether the response indicates rate limiting (e.g. a 429)
+
+        Returns: AimdState
+            the state if its rate was adapted, otherwise None
+        """
+        params = self.params.get(market, None)
+        if not params:
+            return None
+
+        now = self.clock.seconds()
+        state = self._state(market, proxy, now)
+
+        state.events.append((now, limited))
+        if limited:
+            state.limited += 1
+        while state.events and state.events[0][0] < now - params['time_window_size']:
+            _, was_limited = state.events.popleft()
+            if was_limited:
+                state.limited -= 1
+
+        ratio = state.ratio()
+        if limited and ratio >= params['epsilon'] and len(state.events) >= params['min_samples']:
+            state.rate = max(state.rate * params['decrease_factor'], params['min_rate'])
+            state.reset_window(now)
+            return state
+        if now - state.window_start >= params['time_window_size'] and ratio < params['epsilon']:
+            state.rate += params['inc_start']
+            if params['max_rate']:
+                state.rate = min(state.rate, params['max_rate'])
+            state.window_start = now
+            return state
+        return None
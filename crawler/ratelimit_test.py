@@ -0,0 +1,111 @@
+import unittest
+
+from twisted.internet.task import Clock
+
+from crawler.ratelimit import TokenBucket, TokenBucketLimiter, AimdController
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_reserve(self):
+        bucket = TokenBucket(rate=2, burst=3, now=0)
+
+        # burst
+        for i in range(3):
+            self.assertEqual(bucket.reserve(0), 0)
+
+        # subsequent reservations are spaced at the rate
+        self.assertEqual(bucket.reserve(0), 0.5)
+        self.assertEqual(bucket.reserve(0), 1)
+
+        # refills over time, but not beyond the burst
+        self.assertEqual(bucket.reserve(1), 0.5)
+        self.assertFalse(bucket.is_full(2))
+        self.assertTrue(bucket.is_full(100))
+        self.assertEqual(bucket.tokens, 3)
+
+
+class TestTokenBucketLimiter(unittest.TestCase):
+    def test_reserve(self):
+        clock = Clock()
+        limiter = TokenBucketLimiter(clock=clock)
+        limiter.configure("market", rate=1, burst=1)
+
+        self.assertEqual(limiter.reserve("market", "proxy1", "example.com"), 0)
+        self.assertEqual(limiter.reserve("market", "proxy1", "example.com"), 1)
+
+        # independent buckets per (proxy, domain)
+        self.assertEqual(limiter.reserve("market", "proxy2", "example.com"), 0)
+        self.assertEqual(limiter.reserve("market", "proxy1", "example.org"), 0)
+
+        # unconfigured markets are not limited
+        self.assertEqual(limiter.reserve("other", "proxy1", "example.com"), 0)
+        self.assertEqual(limiter.reserve("other", "proxy1", "example.com"), 0)
+
+        clock.advance(2)
+        self.assertEqual(limiter.reserve("market", "proxy1", "example.com"), 0)
+
+    def test_gc(self):
+        clock = Clock()
+        limiter = TokenBucketLimiter(clock=clock)
+        limiter.configure("market", rate=1, burst=1)
+        limiter._gc_interval = 2
+
+        limiter.reserve("market", "proxy1", "example.com")
+        clock.advance(10)
+        limiter.reserve("market", "proxy2", "example.com")
+        self.assertEqual(list(limiter.buckets), [("proxy2", "example.com")])
+
+
+class TestAimdController(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.controller = AimdController(clock=self.clock)
+        self.controller.configure("market", time_window_size=10, inc_start=0.5, epsilon=20, start_rate=2, min_samples=5)
+
+    def test_additive_increase(self):
+        self.assertEqual(self.controller.rate("market", "proxy"), 2)
+
+        for i in range(10):
+            self.assertIsNone(self.controller.record("market", "proxy", False))
+            self.clock.advance(0.5)
+        self.assertEqual(self.controller.rate("market", "proxy"), 2)
+
+        # a full window has passed without rate limiting
+        self.clock.advance(5)
+        state = self.controller.record("market", "proxy", False)
+        self.assertEqual(state.rate, 2.5)
+        self.assertEqual(self.controller.rate("market", "proxy"), 2.5)
+
+        # other proxies are unaffected
+        self.assertEqual(self.controller.rate("market", "other"), 2)
+
+    def test_multiplicative_decrease(self):
+        for i in range(4):
+            self.controller.record("market", "proxy", False)
+
+        # 1 out of 5 (20%) responses is rate limited
+        state = self.controller.record("market", "proxy", True)
+        self.assertEqual(state.rate, 1)
+
+        # the window starts over after a decrease
+        self.assertIsNone(self.controller.record("market", "proxy", True))
+        self.assertEqual(self.controller.rate("market", "proxy"), 1)
+
+    def test_sliding_window(self):
+        for i in range(4):
+            self.controller.record("market", "proxy", True)
+        self.clock.advance(11)
+
+        # rate limited responses outside of the window are not counted
+        for i in range(9):
+            self.controller.record("market", "proxy", False)
+        self.assertIsNone(self.controller.record("market", "proxy", True))
+        self.assertEqual(self.controller.rate("market", "proxy"), 2.5)
+
+    def test_unconfigured_market(self):
+        self.assertIsNone(self.controller.rate("other", "proxy"))
+        self.assertIsNone(self.controller.record("other", "proxy", True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import bisect
+import hashlib
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring that assigns keys (e.g. package names) to shards (e.g. crawler workers or nodes).
+    Every shard is placed at 'vnodes' points on the ring, and a key belongs to the shard of the first point at or after the hash of the key.
+    When a shard is added or removed, only the keys of about 1/N of the ring move, instead of almost all keys as with 'hash(key) % N'.
+    """
+
+    def __init__(self, shards, vnodes=100):
+        if not shards:
+            raise ValueError("a hash ring needs at least one shard")
+        self.shards = list(shards)
+        points = sorted((_hash(f"{shard}#{i}"), shard) for shard in self.shards for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard(self, key):
+        """
+        Returns the shard that the key belongs to
+        """
+        idx = bisect.bisect_left(self._hashes, _hash(key))
+        if idx == len(self._hashes):
+            idx = 0
+        return self._shards[idx]
+
+
+class Shard:
+    """
+    The slice of a ring that belongs to a single worker
+    """
+
+    def __init__(self, ring, node):
+        if node not in ring.shards:
+            raise ValueError(f"node '{node}' is not one of the shards: {ring.shards}")
+        self.ring = ring
+        self.node = node
+
+    def owns(self, key):
+        return self.ring.shard(key) == self.node
+
+
+def parse_shard(s):
+    """
+    Parses a shard of the form 'i/N' (the i-th of N workers, zero-based) into sharding parameters
+    Args:
+        s: str
+
+    Returns: dict
+    """
+    try:
+        i, n = [int(v) for v in s.split("/")]
+    except ValueError:
+        raise ValueError(f"invalid shard '{s}', expected 'i/N'")
+    if not 0 <= i < n:
+        raise ValueError(f"invalid shard '{s}', expected 0 <= i < N")
+    return dict(
+        enabled=True,
+        nodes=[str(j) for j in range(n)],
+        node=str(i)
+    )
+
+
+def shard_from_params(params):
+    """
+    Returns the Shard of this worker given the sharding settings, or None if sharding is disabled
+    Args:
+        params: dict
+            with the list of 'nodes', the 'node' of this worker, and optionally the number of 'vnodes' per node
+
+    Returns: Shard
+    """
+    if not params.get("enabled", False):
+        return None
+    nodes = [str(node) for node in params.get("nodes", [])]
+    ring = HashRing(nodes, vnodes=params.get("vnodes", 100))
+    return Shard(ring, str(params.get("node")))
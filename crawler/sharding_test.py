@@ -0,0 +1,55 @@
+import unittest
+
+from crawler.sharding import HashRing, Shard, parse_shard, shard_from_params
+
+_PACKAGES = [f"com.example.app{i}" for i in range(10000)]
+
+
+class TestHashRing(unittest.TestCase):
+    def test_balanced(self):
+        ring = HashRing(["0", "1", "2", "3"])
+        counts = {}
+        for pkg in _PACKAGES:
+            shard = ring.shard(pkg)
+            counts[shard] = counts.get(shard, 0) + 1
+        self.assertEqual(sorted(counts), ["0", "1", "2", "3"])
+        for count in counts.values():
+            self.assertLess(abs(count - 2500), 500)
+
+    def test_rebalance(self):
+        before = HashRing(["0", "1", "2", "3"])
+        after = HashRing(["0", "1", "2", "3", "4"])
+
+        moved = [pkg for pkg in _PACKAGES if before.shard(pkg) != after.shard(pkg)]
+
+        # only the packages of the new shard move, i.e. about 1/5 of them
+        self.assertTrue(all(after.shard(pkg) == "4" for pkg in moved))
+        self.assertLess(len(moved), 0.3 * len(_PACKAGES))
+
+    def test_shards_partition(self):
+        ring = HashRing(["a", "b", "c"])
+        shards = [Shard(ring, node) for node in ["a", "b", "c"]]
+        for pkg in _PACKAGES[:1000]:
+            self.assertEqual(sum(shard.owns(pkg) for shard in shards), 1)
+
+
+class TestParams(unittest.TestCase):
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("1/3"), dict(enabled=True, nodes=["0", "1", "2"], node="1"))
+        for s in ["3/3", "-1/3", "1", "a/b"]:
+            with self.assertRaises(ValueError):
+                parse_shard(s)
+
+    def test_shard_from_params(self):
+        self.assertIsNone(shard_from_params({}))
+        self.assertIsNone(shard_from_params(dict(enabled=False, nodes=["a"], node="a")))
+
+        shard = shard_from_params(parse_shard("0/2"))
+        self.assertEqual(shard.node, "0")
+
+        with self.assertRaises(ValueError):
+            shard_from_params(dict(enabled=True, nodes=["a", "b"], node="c"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import sqlite3
+
+SHARED_STATE = None
+
+
+def init_shared_state(path, sync_interval=1, timeout=0.05):
+    global SHARED_STATE
+    if not SHARED_STATE:
+        SHARED_STATE = SharedState(path, sync_interval=sync_interval, timeout=timeout)
+    return SHARED_STATE
+
+
+def _is_locked(e):
+    """
+    Returns whether the SQLite error is caused by another process holding the lock of the database for longer than the busy timeout
+    """
+    return isinstance(e, sqlite3.OperationalError) and "locked" in str(e)
+
+
+class SharedState:
+    """
+    Rate limiting and proxy backoff state that is shared between the spider processes on a host, stored in SQLite in WAL mode.
+    In WAL mode, readers do not block the writer and vice versa, so every process can write its updates
+    and cheaply poll for the updates of the others.
+
+    - Proxy backoffs are written immediately, and read by polling for backoffs updated since the last poll,
+      such that the pool of every process blocks proxies that were rate limited in another process.
+    - Token buckets are updated in a single transaction per reservation, such that the rate of a (proxy, domain)-pair holds across processes.
+
+    All times are in seconds since the epoch, which is what the reactor uses as well.
+
+    As the state is accessed on the reactor thread, it waits for a lock of another process for at most 'timeout' seconds.
+    If the lock is still taken, a sync is skipped: backoffs are written at the next poll instead,
+    and a reservation is taken from a token bucket of the process itself (see crawler.ratelimit.TokenBucketLimiter).
+    """
+
+    def __init__(self, path, sync_interval=1, timeout=0.05):
+        self.path = path
+        self.sync_interval = sync_interval
+        # autocommit mode, transactions are started explicitly
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # the state is not worth an fsync per write
+        self.conn.execute("CREATE TABLE IF NOT EXISTS proxy_backoffs (proxy TEXT PRIMARY KEY, until REAL, updated REAL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS proxy_backoffs_updated ON proxy_backoffs (updated)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS token_buckets (key TEXT PRIMARY KEY, tokens REAL, last REAL)")
+        self._last_poll = 0
+        self._pending_backoffs = {}  # proxy -> (until, updated) of the backoffs that could not be written yet
+
+    def backoff(self, proxy, until, now):
+        """
+        Blocks the proxy for all processes until the given time, unless it is already blocked for longer
+        """
+        pending_until, _ = self._pending_backoffs.get(proxy, (0, 0))
+        if until > pending_until:
+            self._pending_backoffs[proxy] = (until, now)
+        self._write_backoffs()
+
+    def _write_backoffs(self):
+        """
+        Writes the pending backoffs, unless the database is locked by another process
+        """
+        if not self._pending_backoffs:
+            return
+        try:
+            self.conn.executemany(
+                "INSERT INTO proxy_backoffs VALUES (:proxy, :until, :updated) "
+                "ON CONFLICT (proxy) DO UPDATE SET until = excluded.until, updated = excluded.updated WHERE excluded.until > until",
+                [{"proxy": proxy, "until": until, "updated": updated} for proxy, (until, updated) in self._pending_backoffs.items()]
+            )
+        except sqlite3.OperationalError as e:
+            if not _is_locked(e):
+                raise
+            return
+        self._pending_backoffs.clear()
+
+    def poll_backoffs(self, now):
+        """
+        Returns the (proxy, until)-tuples of the backoffs that were updated since the last poll and are still active
+        Returns an empty list if the last poll was less than 'sync_interval' seconds ago
+        Backoffs may be returned by multiple polls, as the polled periods overlap to account for concurrent writes
+        """
+        if now - self._last_poll < self.sync_interval:
+            return []
+        self._write_backoffs()
+        # updates that are committed while polling are seen again at the next poll
+        since = self._last_poll - self.sync_interval
+        try:
+            res = self.conn.execute(
+                "SELECT proxy, until FROM proxy_backoffs WHERE updated >= :since AND until > :now",
+                {"since": since, "now": now}
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            if not _is_locked(e):
+                raise
+            return []
+        self._last_poll = now
+        return res
+
+    def reserve(self, key, rate, burst, now):
+        """
+        Takes a token from the shared token bucket of the key, see crawler.ratelimit.TokenBucket
+        Returns: float
+            number of seconds to wait before the token may be used, or None if the database is locked by another process
+        """
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as e:
+            if not _is_locked(e):
+                raise
+            return None
+        try:
+            row = self.conn.execute("SELECT tokens, last FROM token_buckets WHERE key = ?", (key,)).fetchone()
+            if row:
+                tokens, last = row
+                tokens = min(burst, tokens + max(now - last, 0) * rate)
+                last = max(now, last)
+            else:
+                tokens, last = burst, now
+            tokens -= 1
+            self.conn.execute("INSERT OR REPLACE INTO token_buckets VALUES (?, ?, ?)", (key, tokens, last))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        if tokens >= 0:
+            return 0
+        return -tokens / rate
+
+    def gc(self, now):
+        """
+        Removes expired backoffs and token buckets that have been full for a while, unless the database is locked by another process
+        """
+        try:
+            self.conn.execute("DELETE FROM proxy_backoffs WHERE until < ?", (now - self.sync_interval * 2,))
+            self.conn.execute("DELETE FROM token_buckets WHERE last < ?", (now - 3600,))
+        except sqlite3.OperationalError as e:
+            if not _is_locked(e):
+                raise
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from crawler.ratelimit import TokenBucketLimiter
+from crawler.shared_state import SharedState
+from crawler.util import BackoffProxyPool, TestCrawler
+
+
+class TestSharedState(SynchronousTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmpdir.name, "shared_state.db")
+        # two processes sharing the same database
+        self.state1 = SharedState(path, sync_interval=1)
+        self.state2 = SharedState(path, sync_interval=1)
+        self.path = path
+
+        self.clock = Clock()
+        self.clock.advance(1000)
+
+    def tearDown(self):
+        self.state1.close()
+        self.state2.close()
+        self.tmpdir.cleanup()
+
+    def test_backoff(self):
+        self.state1.backoff("1.1.1.1:80", 1010, 1000)
+        self.assertEqual(self.state2.poll_backoffs(1000), [("1.1.1.1:80", 1010)])
+
+        # no polling within the sync interval
+        self.state1.backoff("2.2.2.2:80", 1010, 1000.5)
+        self.assertEqual(self.state2.poll_backoffs(1000.5), [])
+
+        # shorter backoffs do not override longer ones
+        self.state1.backoff("2.2.2.2:80", 1005, 1000.5)
+        self.assertEqual(sorted(self.state2.poll_backoffs(1001)), [("1.1.1.1:80", 1010), ("2.2.2.2:80", 1010)])
+
+        # old updates are not polled again, once outside of the overlap with the previous poll
+        self.assertEqual(len(self.state2.poll_backoffs(1003)), 2)
+        self.assertEqual(self.state2.poll_backoffs(1005), [])
+
+    def test_proxy_pool(self):
+        proxies = ["1.1.1.1:80", "2.2.2.2:80"]
+        pp1 = BackoffProxyPool(TestCrawler(), proxies, clock=self.clock, shared_state=self.state1)
+        pp2 = BackoffProxyPool(TestCrawler(), proxies, clock=self.clock, shared_state=self.state2)
+        self.assertEqual(pp2._available_proxies(), proxies)
+
+        pp1.backoff("http://1.1.1.1:80", seconds=10)
+        self.clock.advance(1)
+        self.assertEqual(pp2._available_proxies(), ["2.2.2.2:80"])
+        for i in range(5):
+            self.assertEqual(self.successResultOf(pp2.get_proxy()), "2.2.2.2:80")
+
+        self.clock.advance(9)
+        self.assertEqual(sorted(pp2._available_proxies()), proxies)
+
+    def test_token_bucket(self):
+        limiter1 = TokenBucketLimiter(clock=self.clock, shared_state=self.state1)
+        limiter2 = TokenBucketLimiter(clock=self.clock, shared_state=self.state2)
+        for limiter in [limiter1, limiter2]:
+            limiter.configure("market", rate=2, burst=1)
+
+        self.assertEqual(limiter1.reserve("market", "proxy", "example.com"), 0)
+        self.assertEqual(limiter2.reserve("market", "proxy", "example.com"), 0.5)
+        self.assertEqual(limiter1.reserve("market", "proxy", "example.com"), 1)
+        self.assertEqual(limiter2.reserve("market", "other", "example.com"), 0)
+
+        self.clock.advance(1.5)
+        self.assertEqual(limiter2.reserve("market", "proxy", "example.com"), 0)
+
+    def test_locked(self):
+        # another process holds the write lock of the database
+        other = sqlite3.connect(self.path, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+
+        limiter = TokenBucketLimiter(clock=self.clock, shared_state=self.state1)
+        limiter.configure("market", rate=2, burst=1)
+        start = time.monotonic()
+        # the reservations are taken from the bucket of the process instead
+        self.assertEqual(limiter.reserve("market", "proxy", "example.com"), 0)
+        self.assertEqual(limiter.reserve("market", "proxy", "example.com"), 0.5)
+        # the backoff is written once the lock is released
+        self.state1.backoff("1.1.1.1:80", 1010, 1000)
+        self.assertLess(time.monotonic() - start, 1)
+
+        other.execute("COMMIT")
+        other.close()
+        self.assertEqual(self.state1.poll_backoffs(1001), [("1.1.1.1:80", 1010)])
+        self.assertEqual(self.state2.poll_backoffs(1001), [("1.1.1.1:80", 1010)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import importlib
+
+# registry of spiders: market name -> (module, class name)
+# spiders are imported only when selected, such that a process does not pay for the (heavy) dependencies of other markets
+SPIDERS = {
+    "apkmirror": ("crawler.spiders.apkmirror", "ApkMirrorSpider"),
+    "apkmonk": ("crawler.spiders.apkmonk", "ApkMonkSpider"),
+    "baidu": ("crawler.spiders.baidu", "BaiduSpider"),
+    "fdroid": ("crawler.spiders.fdroid", "FDroidSpider"),
+    "huawei": ("crawler.spiders.huawei", "HuaweiSpider"),
+    "mi": ("crawler.spiders.mi", "MiSpider"),
+    "slideme": ("crawler.spiders.slideme", "SlideMeSpider"),
+    "tencent": ("crawler.spiders.tencent", "TencentSpider"),
+    "360": ("crawler.spiders.threesixty", "ThreeSixtySpider"),
+    "googleplay": ("crawler.spiders.gplay", "GooglePlaySpider"),
+    "9game": ("crawler.spiders.nine_game", "NineGameSpider"),
+}
+
+
+def spider_by_name(name):
+    """
+    Returns the class of the spider for the given market name, importing only its module
+    Args:
+        name: str
+
+    Returns:
+        scrapy.Spider
+    """
+    if name not in SPIDERS:
+        raise Exception("Unknown spider")
+    module, cls = SPIDERS[name]
+    return getattr(importlib.import_module(module), cls)
@@ -8,7 +8,6 @@ from threading import Thread
 import scrapy
 from scrapy.crawler import CrawlerProcess
 
-from crawler.pipelines.util import InfluxDBClient
 from crawler.spiders.util import PackageListSpider
 
 
@@ -87,7 +86,7 @@ class TestRateLimit(unittest.TestCase):
                 'crawler.middlewares.ratelimit.RatelimitMiddleware': 543
             },
             TEST_BASE_URL=base_url,
-            INFLUXDB_CLIENT=InfluxDBClient({}),
+            INFLUXDB_PARAMS={},
             PACKAGE_FILES_ONLY=True,
             PACKAGE_FILES=[fp.name],
             RETRY_HTTP_CODES=[429],
@@ -1,15 +1,16 @@
 import json
 import re
 import socketserver
+import threading
 import time
 from base64 import b64decode, urlsafe_b64encode
+from collections import deque
+from functools import partial
 from http.server import BaseHTTPRequestHandler
-from random import choice
-from urllib.parse import urlencode, parse_qs
+from urllib.parse import urlencode, parse_qs, quote
 
-import numpy as np
-import requests
 import scrapy
+import scrapy.spidermiddlewares.httperror
 import sqlite3
 
 import twisted
@@ -22,8 +23,9 @@ from cryptography.hazmat.primitives.serialization import load_der_public_key
 import ssl
 
 from playstoreapi.googleplay import GooglePlayAPI
-from playstoreapi.googleplay_pb2 import ResponseWrapper
+from playstoreapi.googleplay_pb2 import BulkDetailsRequest, ResponseWrapper
 from crawler import util
+from crawler.ratelimit import TokenBucket
 from crawler.spiders.util import PackageListSpider, normalize_rating, read_int, to_big_int
 from crawler.util import get_proxy_as_dict
 
@@ -34,6 +36,7 @@ pkg_pattern = "https://play.google.com/store/apps/details\?id=(.*)"
 _APP_LISTING_PAGE = 'https://play.google.com/store/apps'
 _SERVICE = "androidmarket"
 _URL_LOGIN = "https://android.clients.google.com/auth"
+_MAX_ACCOUNT_CREATE_BACKOFF = 300  # seconds
 _URL_DELIVERY = "https://play-fe.googleapis.com/fdfe/delivery"
 _ACCOUNT_TYPE_HOSTED_OR_GOOGLE = "HOSTED_OR_GOOGLE"
 _GOOGLE_LOGIN_APP = 'com.android.vending'
@@ -68,6 +71,28 @@ _locale = "en_GB"
 _timezone = 'Europe/London'
 _USERAGENT_SEARCH = f"Android-Finsky/{_version_string} (api=3,versionCode={_version_code},sdk={_sdk},device={_device},hardware={_hardware},product={_product},platformVersionRelease={_platform_v},model={_model},buildId={_build_id},isWideScreen=0,supportedAbis={_supported_abis.replace(',', ';')})"
 _ALLOWED_ERROR_COUNT = 5
+_IMAGE_TYPE_ICON = 4
+_URL_BULK_DETAILS = "https://android.clients.google.com/fdfe/bulkDetails?au=1"
+_CONTENT_TYPE_PROTO = "application/x-protobuf"
+
+
+def login_anonymous(proxy=None):
+    """
+    Mints a new anonymous account
+    Args:
+        proxy: str
+            proxy through which to log in, if any
+
+    Returns: dict
+        the 'gsf_id', 'ast' and time of creation of the account
+    """
+    api = GooglePlayAPI('en_US', 'Europe/Copenhagen', proxies_config=get_proxy_as_dict(proxy))
+    api.login(anonymous=True)
+    return {
+        "gsf_id": api.gsfId,
+        "ast": api.authSubToken,
+        "created": time.time()
+    }
 
 
 class Handler(BaseHTTPRequestHandler):
@@ -78,21 +103,15 @@ class Handler(BaseHTTPRequestHandler):
             qs = parse_qs(post_body)
 
             proxy = qs.get("proxy")[0]
-            proxy_config = get_proxy_as_dict(proxy)
         except:
-            proxy_config = None
+            proxy = None
 
         try:
-            api = GooglePlayAPI('en_US', 'Europe/Copenhagen', proxies_config=proxy_config)
-            api.login(anonymous=True)
+            body_raw = self.server.auth.get_account(proxy)
         except Exception:
             self.send_error(500)
             return
 
-        body_raw = {
-            "gsf_id": api.gsfId,
-            "ast": api.authSubToken
-        }
         body = bytes(json.dumps(body_raw), "utf-8")
 
         self.send_response(200)
@@ -100,28 +119,115 @@ class Handler(BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(body)
 
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
 
 class AuthRenewServer:
-    def __init__(self):
+    """
+    Service that mints anonymous Google Play accounts for the spider.
+    Background threads keep a warm pool of up to 'pool_size' fresh accounts, such that requests are served immediately,
+    and replace accounts that have been in the pool for longer than 'max_age' seconds.
+    Requests are handled concurrently, and mint an account on demand when the pool is empty.
+    """
+
+    def __init__(self, pool_size=10, workers=2, max_age=1800, login=login_anonymous):
         server = socketserver.TCPServer(("", 0), Handler)
         self.port = server.server_address[1]
         server.server_close()
 
+        self.pool_size = pool_size
+        self.workers = workers
+        self.max_age = max_age
+        self.login = login
+        self.server = None
+
+        self._accounts = deque()  # warm accounts, oldest first
+        self._minting = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def get_account(self, proxy=None):
+        """
+        Returns a warm account, or mints a new one if none is available
+        """
+        with self._lock:
+            self._drop_expired()
+            if self._accounts:
+                return self._accounts.popleft()
+        return self.login(proxy)
+
+    def _drop_expired(self):
+        now = time.time()
+        while self._accounts and now - self._accounts[0]['created'] > self.max_age:
+            self._accounts.popleft()
+
+    def _mint_forever(self):
+        retry_time = 1
+        while not self._stopped.is_set():
+            with self._lock:
+                self._drop_expired()
+                full = len(self._accounts) + self._minting >= self.pool_size
+                if not full:
+                    self._minting += 1
+            if full:
+                self._stopped.wait(1)
+                continue
+
+            account = None
+            try:
+                account = self.login()
+                retry_time = 1
+            except Exception as e:
+                print(f"failed to mint anonymous GooglePlay account: {e}")
+            finally:
+                with self._lock:
+                    self._minting -= 1
+                    if account:
+                        self._accounts.append(account)
+            if not account:
+                self._stopped.wait(retry_time)
+                retry_time = min(retry_time * 2, 300)
+
     def start(self):
-        with socketserver.TCPServer(("", self.port), Handler) as server:
+        with _ThreadingServer(("", self.port), Handler) as server:
+            server.auth = self
+            self.server = server
+            # the server listens before the pool is filled, such that a warm pool implies a reachable server
+            for i in range(self.workers):
+                threading.Thread(target=self._mint_forever, daemon=True).start()
             print(f"serving anonymous GooglePlay credentials at port: {self.port}")
             try:
                 server.serve_forever()
             except KeyboardInterrupt as e:
                 print("Received SIGINT, shutting down gracefully")
 
+    def stop(self):
+        self._stopped.set()
+        if self.server:
+            self.server.shutdown()
+
+
 def parse_details(details):
     """
     Parse the details from the Google Play api
     Args:
-        details: dict
+        details: DetailsResponse
+    """
+    return parse_doc(details.item)
+
+
+def parse_doc(docv2):
+    """
+    Parse a document from the Google Play api, as found in (bulk) details responses
+    Args:
+        docv2: Item
     """
-    docv2 = details.item
     url = docv2.shareUrl
     pkg_name = docv2.id
     app_name = docv2.title
@@ -186,6 +292,13 @@ def parse_details(details):
             }
         }
 
+    for image in docv2.image:
+        if image.imageType == _IMAGE_TYPE_ICON and image.imageUrl:
+            meta["icon_url"] = image.imageUrl
+            break
+    if ad.developerAddress:
+        meta["developer_address"] = ad.developerAddress
+
     return meta, versions
 
 
@@ -225,33 +338,40 @@ class NotLoggedInError(Exception):
 
 
 class Account:
-    def __init__(self, gsf_id, ast):
+    def __init__(self, gsf_id, ast, created=None):
         self.gsf_id = gsf_id
         self.ast = ast
+        self.created = created  # time at which the account was created, None if unknown
 
 
 class AuthDb:
     def __init__(self, path):
         self.conn = sqlite3.connect(path)
         cur = self.conn.cursor()
-        cur.execute("CREATE TABLE IF NOT EXISTS logins (gsfid INT, ast TEXT)")
+        cur.execute("CREATE TABLE IF NOT EXISTS logins (gsfid INT, ast TEXT, created REAL)")
+
+        # databases of earlier versions lack the 'created' column
+        columns = [row[1] for row in cur.execute("PRAGMA table_info(logins)")]
+        if "created" not in columns:
+            cur.execute("ALTER TABLE logins ADD COLUMN created REAL")
+            self.conn.commit()
 
     def get_accounts(self):
         cur = self.conn.cursor()
-        qry = f"SELECT * FROM logins"
+        qry = f"SELECT gsfid, ast, created FROM logins"
         cur.execute(qry)
 
         accounts = []
         for res in cur.fetchall():
-            account = Account(res[0], res[1])
+            account = Account(res[0], res[1], created=res[2])
             accounts.append(account)
 
         return accounts
 
     def create_account(self, account):
         cur = self.conn.cursor()
-        qry = "INSERT INTO logins VALUES (:gsfid, :ast)"
-        cur.execute(qry, {"gsfid": account.gsf_id, "ast": account.ast})
+        qry = "INSERT INTO logins VALUES (:gsfid, :ast, :created)"
+        cur.execute(qry, {"gsfid": account.gsf_id, "ast": account.ast, "created": account.created})
 
         self.conn.commit()
 
@@ -264,6 +384,113 @@ class AuthDb:
         self.conn.commit()
 
 
+class AccountState:
+    def __init__(self, account, bucket):
+        self.account = account
+        self.bucket = bucket
+        self.errors = 0  # number of consecutive errors
+        self.strikes = 0  # number of consecutive cooldowns
+        self.cooldown_until = 0
+        self.disabled = False
+
+
+class AccountPool:
+    """
+    Schedules Google Play API requests over the accounts, without blocking the reactor.
+    Every account has a token bucket of 'rate' requests per second, such that the throughput scales with the number of accounts.
+    Requests are dispatched to the healthy account that can send its next request first (i.e. the least loaded one),
+    and the caller delays the request by the returned number of seconds.
+
+    Accounts are cooled down after 'max_errors' consecutive errors (e.g. rate limiting or incompatible-device responses),
+    for a time that doubles with every consecutive cooldown, and disabled when their authentication fails.
+    """
+
+    def __init__(self, accounts=[], rate=1, burst=1, max_errors=_ALLOWED_ERROR_COUNT, cooldown=60, max_cooldown=3600, clock=None):
+        if clock is None:
+            from twisted.internet import reactor
+            clock = reactor
+        self.clock = clock
+        self.rate = rate
+        self.burst = burst
+        self.max_errors = max_errors
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.states = {}  # gsf_id -> AccountState
+        for account in accounts:
+            self.add(account)
+
+    def add(self, account):
+        self.states[account.gsf_id] = AccountState(account, TokenBucket(self.rate, self.burst, self.clock.seconds()))
+
+    def healthy_accounts(self):
+        return [state.account for state in self.states.values() if not state.disabled]
+
+    def _wait_time(self, state, now):
+        return max(state.bucket.wait_time(now), state.cooldown_until - now)
+
+    def acquire(self):
+        """
+        Selects the least loaded healthy account for a new request
+        Returns: (Account, float)
+            the account and the number of seconds to delay the request, or None if all accounts are disabled
+        """
+        now = self.clock.seconds()
+        states = [state for state in self.states.values() if not state.disabled]
+        if not states:
+            return None
+        state = min(states, key=lambda s: self._wait_time(s, now))
+        return state.account, self.reserve(state.account)
+
+    def reserve(self, account):
+        """
+        Reserves a request of the account, e.g. for the subsequent purchase and delivery requests of a package
+        Returns: float
+            number of seconds to delay the request
+        """
+        now = self.clock.seconds()
+        state = self.states[account.gsf_id]
+        return max(state.bucket.reserve(now), state.cooldown_until - now, 0)
+
+    def disable(self, account):
+        """
+        Stops dispatching requests to the account, e.g. when it is rejected or replaced
+        """
+        state = self.states.get(account.gsf_id, None)
+        if state:
+            state.disabled = True
+
+    def success(self, account):
+        state = self.states.get(account.gsf_id, None)
+        if state:
+            state.errors = 0
+            state.strikes = 0
+
+    def failure(self, account, auth=False):
+        """
+        Records a failed request of the account
+        Args:
+            account: Account
+            auth: bool
+                whether authentication failed, which disables the account
+
+        Returns: bool
+            whether the account was disabled
+        """
+        state = self.states.get(account.gsf_id, None)
+        if not state or state.disabled:
+            return False
+        if auth:
+            self.disable(account)
+            return True
+
+        state.errors += 1
+        if state.errors >= self.max_errors:
+            state.cooldown_until = self.clock.seconds() + min(self.cooldown * 2 ** state.strikes, self.max_cooldown)
+            state.strikes += 1
+            state.errors = 0
+        return False
+
+
 class SSLContext(ssl.SSLContext):
     def set_alpn_protocols(self, protocols):
         """
@@ -272,14 +499,26 @@ class SSLContext(ssl.SSLContext):
         pass
 
 
+class Enrichment:
+    """
+    Information of the page of a package, fetched alongside the API, and the items of the package that are merged with it
+    """
+
+    def __init__(self):
+        self.page = None  # information of the page, once parsed
+        self.pending = 0  # number of items that are yet to be returned
+        self.items = []  # items that wait for the page
+
 
 class GooglePlaySpider(PackageListSpider):
     name = "googleplay_spider"
 
-    def __init__(self, crawler, accounts_db_path, nr_anonymous_accounts, server_port, apk_enabled, lang='en_US', interval=1):
+    def __init__(self, crawler, accounts_db_path, nr_anonymous_accounts, server_port, apk_enabled, lang='en_US', interval=1, account_params={}, max_account_age=None, bulk_size=1, html_enrichment=False):
         super().__init__(crawler=crawler, settings=crawler.settings)
 
         self.interval = interval
+        self.bulk_size = bulk_size
+        self.html_enrichment = html_enrichment
         self.lang = lang
         self.server_port = server_port
         self.apk_enabled = apk_enabled
@@ -287,25 +526,22 @@ class GooglePlaySpider(PackageListSpider):
         self.nr_anonymous_accounts = nr_anonymous_accounts
         self.open_account_renewals = 0
         self.max_open_account_renewals = 10
+        self.account_create_failures = 0  # consecutive failures to create an account, by which new attempts back off
+        self.waiting_for_account = deque()  # functions that craft the requests of packages, held back until an account is available
+        self.enrichments = {}  # pkg_name -> Enrichment of the package, while its page or items are pending
 
         self.auth_db = AuthDb(path=accounts_db_path)
-        self.accounts = self.auth_db.get_accounts()
-
-        accounts_to_create = self.nr_anonymous_accounts - len(self.accounts)
-
-        for i in range(accounts_to_create):
-            url = f"http://localhost:{self.server_port}"
-            try:
-                res = requests.post(url=url)
-
-                account = Account(res.json()['gsf_id'], res.json()['ast'])
-                self.logger.info("created new anonymous account")
-                self.auth_db.create_account(account)
-
-                self.accounts.append(account)
-            except Exception as e:
-                self.logger.info(f"failed to create a new anonymous account: {e}")
-                break
+        accounts = self.auth_db.get_accounts()
+        self.accounts = AccountPool(accounts, rate=1 / interval if interval else 1000, **account_params)
+
+        # accounts are created asynchronously by the AuthRenewServer, such that crawling starts with the existing accounts
+        self.max_account_age = max_account_age
+        self.accounts_to_create = max(self.nr_anonymous_accounts - len(accounts), 0)
+        self.expiring_accounts = deque()  # accounts that are replaced by the next created accounts
+        for account in accounts:
+            if self._is_expired(account):
+                self.expiring_accounts.append(account)
+                self.accounts_to_create += 1
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -315,8 +551,12 @@ class GooglePlaySpider(PackageListSpider):
         accounts_db_path = params.get("accounts_db_path")
         nr_anonymous_accounts = params.get("nr_anonymous_accounts")
         server_port = params.get("server_port")
+        max_account_age = params.get("max_account_age", None)
+        bulk_size = params.get("bulk_size", 1)
+        html_enrichment = params.get("html_enrichment", False)
+        account_params = {k: params[k] for k in ["burst", "max_errors", "cooldown", "max_cooldown"] if k in params}
 
-        spider = cls(crawler, accounts_db_path, nr_anonymous_accounts, server_port, crawler.settings.get("APK_ENABLED", True), lang='en_US', interval=interval)
+        spider = cls(crawler, accounts_db_path, nr_anonymous_accounts, server_port, crawler.settings.get("APK_ENABLED", True), lang='en_US', interval=interval, account_params=account_params, max_account_age=max_account_age, bulk_size=bulk_size, html_enrichment=html_enrichment)
 
         return spider
 
@@ -343,9 +583,82 @@ class GooglePlaySpider(PackageListSpider):
     # Scrapy methods
 
     def start_requests(self):
+        for req in self._account_create_requests():
+            yield req
         for req in super().start_requests():
             yield req
 
+    def _account_create_requests(self):
+        """
+        Returns the requests to the AuthRenewServer for the accounts to create, of which at most 'max_open_account_renewals' are open at once
+        After failed attempts, the requests are delayed exponentially
+        """
+        res = []
+        delay = min(2 ** self.account_create_failures, _MAX_ACCOUNT_CREATE_BACKOFF) if self.account_create_failures else 0
+        while self.accounts_to_create > 0 and self.open_account_renewals < self.max_open_account_renewals:
+            self.accounts_to_create -= 1
+            self.open_account_renewals += 1
+            url = f"http://localhost:{self.server_port}"
+            req = scrapy.Request(url, method='POST', priority=100, dont_filter=True, callback=self.parse_account_create,
+                                 errback=self.account_create_failed, meta={'download_timeout': 60})
+            self._delay(req, delay)
+            res.append(req)
+        return res
+
+    def _is_expired(self, account):
+        """
+        Returns whether the account is older than 'max_account_age', and not yet being replaced
+        """
+        if not self.max_account_age or not account.created or account in self.expiring_accounts:
+            return False
+        return time.time() - account.created >= self.max_account_age
+
+    def _renew_if_expired(self, account):
+        """
+        Schedules the replacement of the account if it expired
+        Returns: list
+            the requests to create accounts
+        """
+        if not self._is_expired(account):
+            return []
+        self.expiring_accounts.append(account)
+        self.accounts_to_create += 1
+        return self._account_create_requests()
+
+    def account_create_failed(self, failure):
+        """
+        Tries to create the account again, after a backoff
+        """
+        self.open_account_renewals -= 1
+        self.accounts_to_create += 1
+        self.account_create_failures += 1
+        self.logger.info(f"failed to create a new anonymous account: {failure.value}")
+        return self._account_create_requests()
+
+    def _requests_with_account(self, craft):
+        """
+        Returns the request crafted for the least loaded account, and the requests to replace the account if it expired
+        Without any healthy account (e.g. before the first account of an empty AuthDb is created),
+        the request is held back until an account is created
+        Args:
+            craft: function of Account -> scrapy.Request
+
+        Returns: list
+        """
+        acquired = self.accounts.acquire()
+        if not acquired:
+            self.waiting_for_account.append(craft)
+            if self.accounts_to_create <= 0 and self.open_account_renewals <= 0:
+                self.accounts_to_create = 1
+                return self._account_create_requests()
+            return []
+        account, delay = acquired
+        res = self._renew_if_expired(account)
+        req = craft(account)
+        self._delay(req, delay)
+        res.append(req)
+        return res
+
     def base_requests(self, meta={}):
         meta['download_timeout'] = 10
         res = [scrapy.Request(_APP_LISTING_PAGE, callback=self.parse, errback=self.surpress_error, meta=meta)]
@@ -353,14 +666,31 @@ class GooglePlaySpider(PackageListSpider):
         return res
 
     def parse_account_create(self, response):
+        self.open_account_renewals -= 1
+        self.account_create_failures = 0
         gsf_id = response.json()['gsf_id']
         ast = response.json()['ast']
-        account = Account(gsf_id, ast)
+        created = response.json().get('created', time.time())
+        account = Account(gsf_id, ast, created=created)
 
         self.logger.info("created new anonymous account")
         self.auth_db.create_account(account)
 
-        self.accounts.append(account)
+        self.accounts.add(account)
+
+        if self.expiring_accounts:
+            expired = self.expiring_accounts.popleft()
+            self.accounts.disable(expired)
+            self.auth_db.delete_account(expired)
+            self.logger.info(f"replaced expired account {expired.gsf_id:x}")
+
+        res = self._account_create_requests()
+        waiting, self.waiting_for_account = self.waiting_for_account, deque()
+        if waiting:
+            self.logger.info(f"scheduling {len(waiting)} packages that waited for an account")
+        for craft in waiting:
+            res.extend(self._requests_with_account(craft))
+        return res
 
     def url_by_package(self, pkg):
         return f"https://play.google.com/store/apps/details?id={pkg}"
@@ -373,13 +703,74 @@ class GooglePlaySpider(PackageListSpider):
 
         Returns: scrapy.Request
         """
-        path = f"details?doc={requests.utils.quote(pkg_name)}"
+        path = f"details?doc={quote(pkg_name)}"
         url = f"https://android.clients.google.com/fdfe/{path}"
         headers = self._get_headers(account)
         meta['_account'] = account
         meta['download_timeout'] = 10
         return scrapy.Request(url, headers=headers, priority=10, callback=self.parse_api_details, errback=self.surpress_error, meta=meta)
 
+    def _craft_page_details_req(self, pkg_name, page_meta, pkg_start_time, account):
+        """
+        Returns a scrapy.Request that fetches the details of a package from the Google Play API, of which the page was visited already
+        """
+        req = self._craft_details_req(pkg_name, account, meta={
+            "meta": page_meta,
+            "__pkg_start_time": pkg_start_time
+        })
+        self.logger.debug(f"scheduling details request: {req.url}")
+        return req
+
+    def _craft_bulk_details_req(self, pkg_names, account, meta={}):
+        """
+        Returns a scrapy.Request that fetches the details of multiple packages from the Google Play API at once
+        Args:
+            pkg_names: list of names of packages to retrieve details from
+
+        Returns: scrapy.Request
+        """
+        req = BulkDetailsRequest()
+        req.DocId.extend(pkg_names)
+        req.includeDetails = True
+        headers = self._get_headers(account, post_content_type=_CONTENT_TYPE_PROTO)
+        meta = dict(meta)
+        meta['_account'] = account
+        meta['pkg_names'] = pkg_names
+        meta['download_timeout'] = 30
+        return scrapy.Request(_URL_BULK_DETAILS, method='POST', body=req.SerializeToString(), headers=headers, priority=10,
+                              callback=self.parse_api_bulk_details, errback=self.surpress_error, meta=meta)
+
+    def package_requests(self, pkgs, meta):
+        """
+        Goes directly to the API for the packages, instead of visiting the page of every package first,
+        batching the packages into bulk details requests of 'bulk_size' packages.
+        When crawling recursively, the pages are visited regardless, as they are needed to discover more packages.
+        """
+        if self.recursive:
+            yield from super().package_requests(pkgs, meta)
+            return
+
+        batch = []
+        for pkg in pkgs:
+            batch.append(pkg)
+            if len(batch) >= self.bulk_size:
+                yield from self._api_details_requests(batch, meta)
+                batch = []
+        if batch:
+            yield from self._api_details_requests(batch, meta)
+
+    def _api_details_requests(self, pkg_names, meta):
+        """
+        Returns the (bulk) details request of the packages, which waits for an account if there is none yet
+        """
+        return self._requests_with_account(partial(self._craft_api_details_req, list(pkg_names), meta['__pkg_start_time']))
+
+    def _craft_api_details_req(self, pkg_names, pkg_start_time, account):
+        api_meta = {'__pkg_start_time': pkg_start_time}
+        if len(pkg_names) == 1:
+            return self._craft_details_req(pkg_names[0], account, meta=api_meta)
+        return self._craft_bulk_details_req(pkg_names, account, meta=api_meta)
+
     def _craft_purchase_req(self, pkg_name, version_code, offer_type, account, meta={}):
         """
         Returns a scrapy.Request for the given pkg that purchases the package
@@ -391,7 +782,7 @@ class GooglePlaySpider(PackageListSpider):
         Returns: scrapy.Request
         """
         url = f"https://android.clients.google.com/fdfe/purchase"
-        body = f"ot={offer_type}&doc={requests.utils.quote(pkg_name)}&vc={version_code}"
+        body = f"ot={offer_type}&doc={quote(pkg_name)}&vc={version_code}"
         headers = self._get_headers(account, post_content_type="application/x-www-form-urlencoded; charset=UTF-8")
         meta['_account'] = account
         meta['download_timeout'] = 10
@@ -424,7 +815,7 @@ class GooglePlaySpider(PackageListSpider):
         meta['download_timeout'] = 10
 
         # find all links to packages
-        packages = np.unique(response.css("a::attr(href)").re("/store/apps/details\?id=(.*)"))
+        packages = sorted(set(response.css("a::attr(href)").re("/store/apps/details\?id=(.*)")))
 
         # visit page of each package
         for pkg in packages:
@@ -451,17 +842,10 @@ class GooglePlaySpider(PackageListSpider):
 
         return res
 
-    def parse_pkg_page(self, response):
+    def _scrape_pkg_page(self, response):
         """
-        Parses the page of a single package
-        Example URL: https://play.google.com/store/apps/details?id=com.mi.android.globalminusscreen
+        Returns the icon URL and developer address from the page of a package, either of which may be None
         """
-
-        res = []
-
-        # find all links to packages
-        packages = np.unique(response.css("a::attr(href)").re("/store/apps/details\?id=(.*)"))
-
         # icon url
         icon_url = response.xpath("//img[contains(@alt, 'Cover art')]/@src").get()
 
@@ -473,25 +857,31 @@ class GooglePlaySpider(PackageListSpider):
         else:
             developer_address = None
 
+        return icon_url, developer_address
+
+    def parse_pkg_page(self, response):
+        """
+        Parses the page of a single package
+        Example URL: https://play.google.com/store/apps/details?id=com.mi.android.globalminusscreen
+        """
+
+        res = []
+
+        # find all links to packages
+        packages = sorted(set(response.css("a::attr(href)").re("/store/apps/details\?id=(.*)")))
+
+        icon_url, developer_address = self._scrape_pkg_page(response)
+
         # package name
         m = re.search(pkg_pattern, response.url)
         if m:
             pkg = m.group(1)
-
-            # select account
-            if len(self.accounts) == 0:
-                raise Exception("no available accounts")
-            account = choice(self.accounts)
-
-            req = self._craft_details_req(pkg, account)
-
-            req.meta['meta'] = {
+            page_meta = {
                 "icon_url": icon_url,
                 "developer_address": developer_address,
             }
-            req.meta["__pkg_start_time"] = response.meta['__pkg_start_time']
-            self.logger.debug(f"scheduling details request: {req.url}")
-            res.append(req)
+            craft = partial(self._craft_page_details_req, pkg, page_meta, response.meta['__pkg_start_time'])
+            res.extend(self._requests_with_account(craft))
 
         meta = response.meta
         meta['download_timeout'] = 10
@@ -529,10 +919,12 @@ class GooglePlaySpider(PackageListSpider):
             if err_msg == _INCOMPATIBLE_DEVICE_MSG:
                 raise IncompatibleDeviceError
             raise RequestFailedError(err_msg)
+        self.accounts.success(account)
 
         details = ResponseWrapper.FromString(response.body).payload.detailsResponse
 
         meta, versions = parse_details(details)
+        # the information of the HTML page of the package takes precedence over the API
         icon_url = response.meta.get('meta', {}).get('icon_url', None)
         if icon_url:
             meta['icon_url'] = icon_url
@@ -540,27 +932,135 @@ class GooglePlaySpider(PackageListSpider):
         developer_address = response.meta.get('meta', {}).get('developer_address', None)
         if developer_address:
             meta['developer_address'] = developer_address
+
+        # the page was visited already, unless going directly to the API
+        enriched = 'meta' in response.meta
+        return self._process_details(meta, versions, account, response.meta['__pkg_start_time'], enriched=enriched)
+
+    def parse_api_bulk_details(self, response):
+        """
+        Parses the retrieved details of multiple packages from the API
+        Example URL: https://android.clients.google.com/fdfe/bulkDetails?au=1
+        """
+        res = []
+
+        account = response.meta['_account']
+        self.accounts.success(account)
+
+        entries = ResponseWrapper.FromString(response.body).payload.bulkDetailsResponse.entry
+        for entry in entries:
+            # unknown packages have an empty entry
+            if not entry.HasField("item"):
+                continue
+            meta, versions = parse_doc(entry.item)
+            res.extend(self._process_details(meta, versions, account, response.meta['__pkg_start_time']))
+        self.logger.debug(f"retrieved details of {len(res)} out of {len(response.meta['pkg_names'])} packages")
+        return res
+
+    def _process_details(self, meta, versions, account, pkg_start_time, enriched=False):
+        """
+        Returns the item of a package, or the requests to purchase its versions if APKs are downloaded
+        If enabled, the page of the package is fetched alongside when the API lacks its icon or developer address,
+        and merged into the meta of the item (see _enriched_items)
+        """
+        res = []
+
         pkg_name = meta.get('pkg_name')
-        offer_type = meta.get('offer_type', 1)
+        if self.html_enrichment and not enriched and not (meta.get('icon_url') and meta.get('developer_address')):
+            if pkg_name not in self.enrichments:
+                self.enrichments[pkg_name] = Enrichment()
+                url = self.url_by_package(pkg_name)
+                res.append(scrapy.Request(url, priority=20, dont_filter=True, callback=self.parse_pkg_enrichment, errback=self.enrichment_failed, meta={
+                    "pkg_name": pkg_name,
+                    "download_timeout": 10
+                }))
+            # an item is returned per version, once its purchase is delivered
+            self._expect_items(pkg_name, len(versions) if self.apk_enabled else 1)
 
         if not self.apk_enabled:
-            return {
+            res.extend(self._enriched_items({
                 "meta": meta,
                 "versions": versions,
                 '_account': account
-            }
+            }))
+            return res
 
+        offer_type = meta.get('offer_type', 1)
         for version, dat in versions.items():
             version_code = dat.get("code")
             req = self._craft_purchase_req(pkg_name, version_code, offer_type, account, meta={
                 'version': version,
                 "meta": meta,
                 "versions": versions,
-                '__pkg_start_time': response.meta['__pkg_start_time']
+                '__pkg_start_time': pkg_start_time
             })
+            self._delay(req, self.accounts.reserve(account))
             res.append(req)
         return res
 
+    def _expect_items(self, pkg_name, n):
+        """
+        Adds to the number of items of the package that are yet to be returned, which are merged with the information of its page
+        """
+        enrichment = self.enrichments.get(pkg_name)
+        if enrichment is not None:
+            enrichment.pending += n
+            self._release_enrichment(pkg_name)
+
+    def _release_enrichment(self, pkg_name):
+        """
+        Forgets the page of the package once it is parsed and all items of the package are returned
+        """
+        enrichment = self.enrichments[pkg_name]
+        if enrichment.page is not None and enrichment.pending <= 0:
+            del self.enrichments[pkg_name]
+
+    def _enriched_items(self, item):
+        """
+        Returns the item with the information of the page of its package merged into its meta,
+        or nothing while the page is still being fetched, in which case the item is returned once the page is parsed
+        """
+        pkg_name = item['meta'].get('pkg_name')
+        enrichment = self.enrichments.get(pkg_name)
+        if enrichment is None:
+            return [item]
+        enrichment.pending -= 1
+        if enrichment.page is None:
+            enrichment.items.append(item)
+            return []
+        self._release_enrichment(pkg_name)
+        return [_enrich(item, enrichment.page)]
+
+    def _enrichment_done(self, pkg_name, page):
+        """
+        Returns the items that waited for the page of the package, merged with its information
+        """
+        enrichment = self.enrichments.get(pkg_name)
+        if enrichment is None:
+            # e.g. the page of a resumed crawl
+            return []
+        enrichment.page = page
+        items, enrichment.items = enrichment.items, []
+        self._release_enrichment(pkg_name)
+        return [_enrich(item, page) for item in items]
+
+    def parse_pkg_enrichment(self, response):
+        """
+        Parses the information of the page of a package, of which the details were retrieved from the API
+        Example URL: https://play.google.com/store/apps/details?id=com.mi.android.globalminusscreen
+        """
+        icon_url, developer_address = self._scrape_pkg_page(response)
+        return self._enrichment_done(response.meta['pkg_name'], {
+            "icon_url": icon_url,
+            "developer_address": developer_address
+        })
+
+    def enrichment_failed(self, failure):
+        """
+        Continues with the details from the API if the page of a package cannot be retrieved
+        """
+        return self._enrichment_done(failure.request.meta['pkg_name'], {})
+
     def parse_api_purchase(self, response):
         """
         Parses the response when purchasing an app
@@ -575,6 +1075,7 @@ class GooglePlaySpider(PackageListSpider):
             if err_msg == _INCOMPATIBLE_DEVICE_MSG:
                 raise IncompatibleDeviceError
             raise RequestFailedError(err_msg)
+        self.accounts.success(account)
         body = ResponseWrapper.FromString(response.body)
         dl_token = body.payload.buyResponse.encodedDeliveryToken
         pkg_name = response.meta['meta']['pkg_name']
@@ -588,8 +1089,11 @@ class GooglePlaySpider(PackageListSpider):
                 "versions": response.meta['versions'],
                 '__pkg_start_time': response.meta['__pkg_start_time']
             })
+            self._delay(req, self.accounts.reserve(account))
             res.append(req)
 
+        # the item of the purchase is returned by each of its deliveries instead
+        self._expect_items(pkg_name, len(res) - 1)
         return res
 
     def parse_delivery(self, response):
@@ -602,6 +1106,7 @@ class GooglePlaySpider(PackageListSpider):
         }
 
         account = response.meta['_account']
+        self.accounts.success(account)
         headers = self._get_headers(account)
 
         version = response.meta['version']
@@ -613,13 +1118,11 @@ class GooglePlaySpider(PackageListSpider):
         version_data['download_url'] = url
         versions[version] = version_data
 
-        self.pause(self.interval)
-
-        return {
+        return self._enriched_items({
             '__pkg_start_time': response.meta['__pkg_start_time'],
             'meta': meta,
             'versions': versions,
-        }
+        })
 
     def parse_similar_apps(self, response):
         """
@@ -630,7 +1133,7 @@ class GooglePlaySpider(PackageListSpider):
             response:
         """
         # find all links to packages
-        packages = np.unique(response.css("a::attr(href)").re("/store/apps/details\?id=(.*)"))
+        packages = sorted(set(response.css("a::attr(href)").re("/store/apps/details\?id=(.*)")))
 
         res = []
 
@@ -646,24 +1149,63 @@ class GooglePlaySpider(PackageListSpider):
 
         return res
 
-    def pause(self, t):
+    def _delay(self, request, delay):
         """
-        Pause the crawler for t seconds
-        Args:
-            t: int
-                number of seconds to pause crawler
+        Delays the request by the given number of seconds, which is enforced by the PacingMiddleware
+        """
+        if delay:
+            request.meta['not_before'] = self.accounts.clock.seconds() + delay
+
+    def _account_failed(self, response):
+        """
+        Records the failed API response for the health of its account
+        Returns: list
+            the requests to create a replacement if the account got disabled
         """
-        if t:
-            self.crawler.engine.pause()
-            time.sleep(t)
-            self.crawler.engine.unpause()
+        account = response.meta.get('_account', None)
+        if not account:
+            return []
+        auth_failed = response.status in [401, 403]
+        if not auth_failed:
+            try:
+                err_msg = ResponseWrapper.FromString(response.body).commands.displayErrorMessage
+                if err_msg == _INCOMPATIBLE_DEVICE_MSG:
+                    self.logger.debug(f"incompatible device for account {account.gsf_id:x}: {response.url}")
+            except Exception:
+                pass
+        if self.accounts.failure(account, auth=auth_failed):
+            self.logger.info(f"disabled account {account.gsf_id:x} after failed authentication")
+            self.auth_db.delete_account(account)
+            if account in self.expiring_accounts:
+                self.expiring_accounts.remove(account)
+            else:
+                self.accounts_to_create += 1
+            return self._account_create_requests()
+        return []
 
     def surpress_error(self, failure):
-        if failure.check(TimeoutError, twisted.internet.error.TimeoutError, scrapy.spidermiddlewares.httperror.HttpError):
+        item_meta = failure.request.meta.get('meta')
+        if item_meta and 'versions' in failure.request.meta:
+            # the purchase or delivery of a version failed, so its item is not returned
+            self._expect_items(item_meta.get('pkg_name'), -1)
+        if failure.check(scrapy.spidermiddlewares.httperror.HttpError):
+            return self._account_failed(failure.value.response)
+        elif failure.check(TimeoutError, twisted.internet.error.TimeoutError):
             pass
         else:
             self.logger.debug(f"error: {failure}")
 
+
+def _enrich(item, page):
+    """
+    Merges the information of the page of a package into the meta of its item, which takes precedence over the API
+    """
+    for key, value in page.items():
+        if value:
+            item['meta'][key] = value
+    return item
+
+
 def encrypt_password(email, passwd):
     """Encrypt credentials using the google publickey, with the
     RSA algorithm"""
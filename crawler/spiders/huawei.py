@@ -1,7 +1,6 @@
 import re
 
 import scrapy
-import numpy as np
 
 from crawler.spiders.util import normalize_rating
 
@@ -33,7 +32,7 @@ class HuaweiSpider(scrapy.Spider):
         """
         res = []
         # find links to packages
-        for pkg_link in np.unique(response.css("a::attr(href)").re("/app/.*")):
+        for pkg_link in sorted(set(response.css("a::attr(href)").re("/app/.*"))):
             req = response.follow(pkg_link, callback=self.parse_pkg_page)
             res.append(req)
         return res
@@ -45,7 +44,7 @@ class HuaweiSpider(scrapy.Spider):
         """
         res = []
 
-        for topic_link in np.unique(response.css("a::attr(href)").re("/topic/.*")):
+        for topic_link in sorted(set(response.css("a::attr(href)").re("/topic/.*"))):
             req = response.follow(topic_link, callback=self.parse)
             res.append(req)
 
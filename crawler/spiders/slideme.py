@@ -1,7 +1,6 @@
 import re
 
 import scrapy
-import numpy as np
 from crawler.spiders.util import normalize_rating
 
 id_pattern = "http://slideme\.org/application/(.*)"
@@ -84,7 +83,7 @@ class SlideMeSpider(scrapy.Spider):
             versions=versions
         )]
 
-        for pkg_url in np.unique(response.css("a::attr(href)").re("/application/.*")):
+        for pkg_url in sorted(set(response.css("a::attr(href)").re("/application/.*"))):
             req = response.follow(pkg_url, callback=self.parse_pkg_page)
             res.append(req)
 
@@ -1,24 +1,409 @@
+import copy
+import json
 import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
 from unittest import TestCase
+from urllib.request import Request, urlopen
 
-from crawler.spiders.gplay import AuthDb
+from playstoreapi.googleplay_pb2 import ResponseWrapper
+import scrapy
+from scrapy.http import HtmlResponse, Response, TextResponse
+from scrapy.utils.test import get_crawler
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+
+from crawler.spiders.gplay import AuthDb, Account, AccountPool, AuthRenewServer, GooglePlaySpider, parse_doc
 
 
 class TestAuthDb(TestCase):
     def test_all(self):
-        email = "test@example.org"
-        ast = "astvalue"
-        path = "test.db"
-        try:
-            auth_db = AuthDb(path)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            auth_db = AuthDb(os.path.join(tmpdir, "test.db"))
+            self.assertEqual(auth_db.get_accounts(), [])
+
+            auth_db.create_account(Account(1, "ast1", created=1000))
+            auth_db.create_account(Account(2, "ast2"))
+            accounts = auth_db.get_accounts()
+            self.assertEqual([(a.gsf_id, a.ast, a.created) for a in accounts], [(1, "ast1", 1000), (2, "ast2", None)])
+
+            auth_db.delete_account(accounts[0])
+            self.assertEqual([a.gsf_id for a in auth_db.get_accounts()], [2])
+
+    def test_migrate(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "test.db")
+            conn = sqlite3.connect(path)
+            conn.execute("CREATE TABLE logins (gsfid INT, ast TEXT)")
+            conn.execute("INSERT INTO logins VALUES (1, 'ast1')")
+            conn.commit()
+            conn.close()
 
-            actual_ast = auth_db.get_ast(email)
-            self.assertIsNone(actual_ast)
+            accounts = AuthDb(path).get_accounts()
+            self.assertEqual([(a.gsf_id, a.ast, a.created) for a in accounts], [(1, "ast1", None)])
 
-            auth_db.create_ast(email, ast)
 
-            actual_ast = auth_db.get_ast(email)
-            self.assertIsNotNone(actual_ast)
+class TestAuthRenewServer(TestCase):
+    def setUp(self):
+        self.minted = 0
+        self.lock = threading.Lock()
 
+    def _login(self, proxy=None):
+        with self.lock:
+            self.minted += 1
+            return {"gsf_id": self.minted, "ast": f"ast{self.minted}", "created": time.time()}
+
+    def test_warm_pool(self):
+        server = AuthRenewServer(pool_size=3, workers=2, login=self._login)
+        thread = threading.Thread(target=server.start, daemon=True)
+        thread.start()
+        try:
+            # the pool is filled in the background
+            for i in range(50):
+                if len(server._accounts) == 3:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(len(server._accounts), 3)
+
+            url = f"http://localhost:{server.port}"
+            accounts = [json.loads(urlopen(Request(url, data=b"", method="POST")).read()) for i in range(2)]
+            self.assertEqual([a["gsf_id"] for a in accounts], [1, 2])
         finally:
-            os.remove(path)
+            server.stop()
+            thread.join(timeout=5)
+
+    def test_expired(self):
+        server = AuthRenewServer(pool_size=2, max_age=10, login=self._login)
+        server._accounts.append({"gsf_id": 100, "ast": "old", "created": time.time() - 20})
+        server._accounts.append({"gsf_id": 101, "ast": "new", "created": time.time()})
+        self.assertEqual(server.get_account()["gsf_id"], 101)
+
+        # minted on demand when the pool is empty
+        self.assertEqual(server.get_account()["gsf_id"], 1)
+
+
+class TestAccountPool(TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.accounts = [Account(1, "ast1"), Account(2, "ast2")]
+        self.pool = AccountPool(self.accounts, rate=1, burst=1, max_errors=2, cooldown=10, clock=self.clock)
+
+    def test_acquire(self):
+        # requests are spread over the accounts
+        acquired = [self.pool.acquire() for i in range(4)]
+        self.assertEqual(sorted(account.gsf_id for account, _ in acquired[:2]), [1, 2])
+        self.assertEqual([delay for _, delay in acquired], [0, 0, 1, 1])
+
+        # subsequent requests of a package use the same account
+        account = acquired[0][0]
+        self.assertEqual(self.pool.reserve(account), 2)
+
+    def test_cooldown(self):
+        account = self.accounts[0]
+        self.pool.failure(account)
+        self.assertEqual(self.pool.acquire(), (account, 0))
+        self.pool.failure(account)
+
+        # the account is cooling down, so the other account is used
+        for i in range(3):
+            acquired, _ = self.pool.acquire()
+            self.assertEqual(acquired, self.accounts[1])
+
+        self.clock.advance(10)
+        acquired, delay = self.pool.acquire()
+        self.assertEqual((acquired, delay), (account, 0))
+
+    def test_auth_failure(self):
+        self.assertTrue(self.pool.failure(self.accounts[0], auth=True))
+        self.assertEqual(self.pool.healthy_accounts(), [self.accounts[1]])
+
+        self.assertTrue(self.pool.failure(self.accounts[1], auth=True))
+        self.assertIsNone(self.pool.acquire())
+
+
+class TestParseDoc(TestCase):
+    def test_bulk_details(self):
+        wrapper = ResponseWrapper()
+        entry = wrapper.payload.bulkDetailsResponse.entry.add()
+        entry.item.id = "com.example"
+        entry.item.title = "Example"
+        entry.item.details.appDetails.versionString = "1.0"
+        entry.item.details.appDetails.versionCode = 3
+        entry.item.details.appDetails.developerAddress = "Street 1"
+        screenshot = entry.item.image.add()
+        screenshot.imageType = 1
+        screenshot.imageUrl = "https://example.org/screenshot.png"
+        icon = entry.item.image.add()
+        icon.imageType = 4
+        icon.imageUrl = "https://example.org/icon.png"
+
+        entries = ResponseWrapper.FromString(wrapper.SerializeToString()).payload.bulkDetailsResponse.entry
+        meta, versions = parse_doc(entries[0].item)
+        self.assertEqual(meta["pkg_name"], "com.example")
+        self.assertEqual(meta["app_name"], "Example")
+        self.assertEqual(meta["icon_url"], "https://example.org/icon.png")
+        self.assertEqual(meta["developer_address"], "Street 1")
+        self.assertEqual(versions["1.0"]["code"], 3)
+
+
+class TestGooglePlaySpider(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.crawler = get_crawler(GooglePlaySpider, {"GPLAY_PARAMS": {}})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _spider(self, nr_anonymous_accounts=2, **kwargs):
+        spider = GooglePlaySpider(self.crawler, os.path.join(self.tmpdir.name, "accounts.db"), nr_anonymous_accounts, 1234, True, **kwargs)
+        spider.accounts.clock = Clock()
+        return spider
+
+    def _account_response(self, request, gsf_id):
+        body = json.dumps({"gsf_id": gsf_id, "ast": f"ast{gsf_id}", "created": time.time()})
+        return TextResponse(request.url, body=body, encoding="utf-8", request=request)
+
+    def _pkg_page(self, pkg_name):
+        url = f"https://play.google.com/store/apps/details?id={pkg_name}"
+        request = scrapy.Request(url, meta={"__pkg_start_time": datetime(2022, 1, 1)})
+        return HtmlResponse(url, body=b"<html></html>", encoding="utf-8", request=request)
+
+    def test_account_create_failed(self):
+        spider = self._spider()
+        requests = spider._account_create_requests()
+        self.assertEqual(len(requests), 2)
+
+        # a failed attempt is retried, after a backoff that doubles with every consecutive failure
+        delays = []
+        for i in range(3):
+            retried = spider.account_create_failed(Failure(ConnectionRefusedError()))
+            self.assertEqual(len(retried), 1)
+            delays.append(retried[0].meta["not_before"] - spider.accounts.clock.seconds())
+        self.assertEqual(delays, [2, 4, 8])
+        self.assertEqual(spider.open_account_renewals, 2)
+
+        spider.parse_account_create(self._account_response(retried[0], 1))
+        self.assertEqual(spider.account_create_failures, 0)
+        self.assertEqual(len(spider.accounts.healthy_accounts()), 1)
+
+    def test_packages_wait_for_account(self):
+        spider = self._spider()
+        create_requests = spider._account_create_requests()
+
+        # without any account, the packages are held back rather than dropped
+        self.assertEqual(spider.parse_pkg_page(self._pkg_page("com.example1")), [])
+        self.assertEqual(spider.parse_pkg_page(self._pkg_page("com.example2")), [])
+        self.assertEqual(len(spider.waiting_for_account), 2)
+
+        res = spider.parse_account_create(self._account_response(create_requests[0], 1))
+        self.assertEqual([r.url for r in res], [
+            "https://android.clients.google.com/fdfe/details?doc=com.example1",
+            "https://android.clients.google.com/fdfe/details?doc=com.example2",
+        ])
+        self.assertEqual(res[0].meta["_account"].gsf_id, 1)
+        self.assertEqual(res[0].meta["__pkg_start_time"], datetime(2022, 1, 1))
+        self.assertFalse(spider.waiting_for_account)
+
+    def test_account_created_for_waiting_packages(self):
+        spider = self._spider(nr_anonymous_accounts=0)
+
+        # an account is created when packages wait and none is being created
+        res = spider.parse_pkg_page(self._pkg_page("com.example"))
+        self.assertEqual([r.url for r in res], ["http://localhost:1234"])
+        self.assertEqual(len(spider.waiting_for_account), 1)
+
+    def test_api_details_requests(self):
+        spider = self._spider(nr_anonymous_accounts=1, bulk_size=2, max_account_age=100)
+        meta = {"__pkg_start_time": datetime(2022, 1, 1)}
+        create_requests = spider._account_create_requests()
+
+        # without any account, the packages wait for one instead of falling back to their pages
+        self.assertEqual(list(spider.package_requests(["com.example1", "com.example2", "com.example3"], meta)), [])
+
+        res = spider.parse_account_create(self._account_response(create_requests[0], 1))
+        self.assertEqual(len(res), 2)
+        self.assertEqual(res[0].meta["pkg_names"], ["com.example1", "com.example2"])
+        self.assertEqual(res[1].url, "https://android.clients.google.com/fdfe/details?doc=com.example3")
+
+        # an expired account is replaced
+        spider.accounts.healthy_accounts()[0].created = time.time() - 200
+        res = list(spider.package_requests(["com.example4"], meta))
+        self.assertEqual([r.url for r in res], ["http://localhost:1234", "https://android.clients.google.com/fdfe/details?doc=com.example4"])
+
+
+def _bulk_details_body(*pkg_names):
+    wrapper = ResponseWrapper()
+    for pkg_name in pkg_names:
+        entry = wrapper.payload.bulkDetailsResponse.entry.add()
+        if not pkg_name:
+            continue  # unknown package
+        entry.item.id = pkg_name
+        entry.item.title = pkg_name
+        entry.item.details.appDetails.versionString = "1.0"
+        entry.item.details.appDetails.versionCode = 3
+        offer = entry.item.offer.add()
+        offer.offerType = 1
+    return wrapper.SerializeToString()
+
+
+def _delivery_body():
+    wrapper = ResponseWrapper()
+    data = wrapper.payload.deliveryResponse.appDeliveryData
+    data.downloadUrl = "https://play.googleapis.com/download/app.apk"
+    cookie = data.downloadAuthCookie.add()
+    cookie.name = "MarketDA"
+    cookie.value = "1"
+    return wrapper.SerializeToString()
+
+
+def _queued(request):
+    """
+    Returns the request as read from the disk queue, i.e. with its own copy of the item
+    """
+    return request.replace(meta=dict(request.meta, meta=copy.deepcopy(request.meta["meta"]), versions=copy.deepcopy(request.meta["versions"])))
+
+
+def _purchase_body():
+    wrapper = ResponseWrapper()
+    wrapper.payload.buyResponse.encodedDeliveryToken = "token"
+    return wrapper.SerializeToString()
+
+
+class TestGooglePlayApi(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.crawler = get_crawler(GooglePlaySpider, {"GPLAY_PARAMS": {}})
+        self.account = Account(1, "ast1", created=time.time())
+        self.pkg_start_time = datetime(2022, 1, 1)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _spider(self, apk_enabled=True, **kwargs):
+        spider = GooglePlaySpider(self.crawler, os.path.join(self.tmpdir.name, "accounts.db"), 0, 1234, apk_enabled, **kwargs)
+        spider.accounts.clock = Clock()
+        spider.accounts.add(self.account)
+        return spider
+
+    def _bulk_details(self, spider, *pkg_names):
+        request = spider._craft_bulk_details_req([p or "com.unknown" for p in pkg_names], self.account, meta={"__pkg_start_time": self.pkg_start_time})
+        response = Response(request.url, body=_bulk_details_body(*pkg_names), request=request)
+        return spider.parse_api_bulk_details(response)
+
+    def _deliver(self, spider, purchase):
+        request = spider._craft_delivery_request(purchase.meta["meta"]["pkg_name"], 3, 1, "token", self.account, meta={
+            "version": purchase.meta["version"],
+            "meta": purchase.meta["meta"],
+            "versions": purchase.meta["versions"],
+            "__pkg_start_time": self.pkg_start_time
+        })
+        return spider.parse_delivery(Response(request.url, body=_delivery_body(), request=request))
+
+    def _purchase(self, spider, purchase):
+        """
+        Returns the items of the deliveries of the purchase
+        """
+        deliveries = spider.parse_api_purchase(Response(purchase.url, body=_purchase_body(), request=_queued(purchase)))
+        return [item for d in deliveries for item in spider.parse_delivery(Response(d.url, body=_delivery_body(), request=_queued(d)))]
+
+    def _enrich(self, spider, request):
+        body = b'<html><img alt="Cover art" src="https://example.org/icon.png"></html>'
+        return spider.parse_pkg_enrichment(HtmlResponse(request.url, body=body, encoding="utf-8", request=request))
+
+    def test_bulk_details(self):
+        spider = self._spider()
+        res = self._bulk_details(spider, "com.example1", None, "com.example2")
+
+        # a purchase request per known package
+        self.assertEqual([r.url for r in res], ["https://android.clients.google.com/fdfe/purchase"] * 2)
+        self.assertEqual(res[0].body, b"ot=1&doc=com.example1&vc=3")
+        self.assertEqual(res[1].meta["meta"]["pkg_name"], "com.example2")
+        self.assertEqual(res[1].meta["version"], "1.0")
+        self.assertIs(res[1].meta["_account"], self.account)
+
+        item, = self._deliver(spider, res[0])
+        self.assertEqual(item["versions"]["1.0"]["download_url"], "https://play.googleapis.com/download/app.apk")
+        self.assertEqual(item["__pkg_start_time"], self.pkg_start_time)
+
+    def test_bulk_details_without_apks(self):
+        spider = self._spider(apk_enabled=False)
+        items = self._bulk_details(spider, "com.example1", "com.example2")
+        self.assertEqual([item["meta"]["pkg_name"] for item in items], ["com.example1", "com.example2"])
+        self.assertEqual(items[0]["versions"], {"1.0": {"timestamp": "", "code": 3}})
+
+    def test_details(self):
+        spider = self._spider()
+        request = spider._craft_api_details_req(["com.example"], self.pkg_start_time, self.account)
+        self.assertEqual(request.url, "https://android.clients.google.com/fdfe/details?doc=com.example")
+
+        wrapper = ResponseWrapper()
+        wrapper.payload.detailsResponse.item.ParseFromString(ResponseWrapper.FromString(_bulk_details_body("com.example")).payload.bulkDetailsResponse.entry[0].item.SerializeToString())
+        res = spider.parse_api_details(Response(request.url, body=wrapper.SerializeToString(), request=request))
+        self.assertEqual([r.body for r in res], [b"ot=1&doc=com.example&vc=3"])
+
+    def test_enrichment_does_not_gate_purchase(self):
+        spider = self._spider(html_enrichment=True)
+        enrichment, purchase = self._bulk_details(spider, "com.example")
+        self.assertEqual(enrichment.url, "https://play.google.com/store/apps/details?id=com.example")
+        self.assertEqual(purchase.url, "https://android.clients.google.com/fdfe/purchase")
+        self.assertGreaterEqual(enrichment.priority, purchase.priority)
+
+        # the item waits for the page of its package
+        self.assertEqual(self._deliver(spider, purchase), [])
+        item, = self._enrich(spider, enrichment)
+        self.assertEqual(item["meta"]["icon_url"], "https://example.org/icon.png")
+        self.assertEqual(item["versions"]["1.0"]["download_url"], "https://play.googleapis.com/download/app.apk")
+        self.assertEqual(spider.enrichments, {})
+
+    def test_enrichment_before_item(self):
+        spider = self._spider(html_enrichment=True)
+        enrichment, purchase = self._bulk_details(spider, "com.example")
+
+        self.assertEqual(self._enrich(spider, enrichment), [])
+        item, = self._deliver(spider, purchase)
+        self.assertEqual(item["meta"]["icon_url"], "https://example.org/icon.png")
+
+        # the item continues without the page if it cannot be retrieved
+        enrichment, purchase = self._bulk_details(spider, "com.example")
+        self.assertEqual(self._deliver(spider, purchase), [])
+        failure = Failure(ConnectionRefusedError())
+        failure.request = enrichment
+        item, = spider.enrichment_failed(failure)
+        self.assertNotIn("icon_url", item["meta"])
+        self.assertEqual(spider.enrichments, {})
+
+    def test_enrichment_of_failed_purchase(self):
+        spider = self._spider(html_enrichment=True)
+        enrichment, purchase = self._bulk_details(spider, "com.example")
+        self.assertEqual(self._enrich(spider, enrichment), [])
+
+        failure = Failure(ConnectionRefusedError())
+        failure.request = purchase
+        spider.surpress_error(failure)
+        self.assertEqual(spider.enrichments, {})
+
+    def test_enrichment_of_versions(self):
+        meta = {"pkg_name": "com.example", "offer_type": 1}
+        versions = {"1.0": {"code": 1}, "2.0": {"code": 2}}
+        for page_first in [True, False]:
+            spider = self._spider(html_enrichment=True)
+            enrichment, *purchases = spider._process_details(dict(meta), dict(versions), self.account, self.pkg_start_time)
+            self.assertEqual(len(purchases), 2)
+
+            items = []
+            if page_first:
+                items.extend(self._enrich(spider, enrichment))
+            for purchase in purchases:
+                items.extend(self._purchase(spider, purchase))
+            if not page_first:
+                items.extend(self._enrich(spider, enrichment))
+
+            # every item of the package is enriched, regardless of the order
+            self.assertEqual(len(items), 4)
+            for item in items:
+                self.assertEqual(item["meta"]["icon_url"], "https://example.org/icon.png")
+            self.assertEqual(spider.enrichments, {})
+
@@ -1,14 +1,26 @@
+import os
 import struct
 from datetime import datetime
 import scrapy
+from scrapy import signals
+from scrapy.utils.job import job_dir
+from twisted.internet import task
 
-from crawler.pipelines.database import _engine_from_params
+from crawler.frontier import Frontier
+from crawler.package_sources import PackageSources
+from crawler.pipelines.database import engine_from_crawler
+from crawler.sharding import shard_from_params
 from crawler.util import market_from_spider
 
 
 class PackageListSpider(scrapy.Spider):
     """
     A superclass that starts with feeding the URL list with packages from (1) a file list and (2) the packages in the database
+    Packages are deduplicated over all sources, and a resumed crawl continues reading the package files where it left off (see crawler.package_sources)
+    When sharding is enabled, the spider only crawls the packages that belong to its shard (see crawler.sharding),
+    such that the crawl of a market can be spread over multiple workers
+    When the frontier is enabled, the packages are instead added to the frontier in the database (see crawler.frontier),
+    from which the spider claims batches of packages, together with any other crawlers of the market
     """
 
     def __init__(self, **kwargs):
@@ -20,6 +32,9 @@ class PackageListSpider(scrapy.Spider):
         self.retrieve_package_files = self.settings.get("RETRIEVE_PACKAGE_FILES", False)
         self.retrieve_base_requests = self.settings.get("RETRIEVE_BASE_REQUESTS", False)
         self.retrieve_from_db = self.settings.get("RETRIEVE_FROM_DB", False)
+        self.shard = shard_from_params(self.settings.get("SHARDING_PARAMS", {}))
+        self.frontier = self._init_frontier(self.settings.get("FRONTIER_PARAMS", {}))
+        self.package_sources = self._init_package_sources(self.settings.get("PACKAGE_DEDUP_PARAMS", {}))
 
         meta = {
             'dont_redirect': True,
@@ -29,21 +44,18 @@ class PackageListSpider(scrapy.Spider):
         # re-crawl packages from database
         if self.retrieve_from_db:
             self.logger.debug("retrieving from db")
-            params = self.settings.get("DATABASE_PARAMS")
-            engine, _ = _engine_from_params(params)
+            engine, _ = engine_from_crawler(self.crawler)
 
             market = market_from_spider(self)
             qry = f"SELECT distinct pkg_name FROM packages WHERE pkg_name is not null and pkg_name != '' AND market = '{market}'"
-            try:
-                with engine.connect() as con:
-                    res = con.execute(qry)
-            finally:
-                engine.dispose()
-
-            rows = res.fetchall()
-            for row in rows:
-                url = self.url_by_package(row.pkg_name.strip())
-                yield scrapy.Request(url, priority=-1, callback=self.parse_pkg_page, meta=meta)
+            with engine.connect() as con:
+                rows = con.execute(qry).fetchall()
+            pkgs = self._own_packages(self.package_sources.packages(row.pkg_name.strip() for row in rows))
+            if self.frontier:
+                self.frontier.add(pkgs)
+            else:
+                for req in self.package_requests(pkgs, meta):
+                    yield req
         else:
             self.logger.debug("NOT retrieving from db")
 
@@ -53,25 +65,129 @@ class PackageListSpider(scrapy.Spider):
             pkg_files = self.settings.get("PACKAGE_FILES", [])
             for pkg_file in pkg_files:
                 self.logger.debug(f"fetching packages from '{pkg_file}'")
-                with open(pkg_file, 'r') as f:
-                    line = f.readline()
-                    while line:
-                        pkg = line.strip()
-                        self.logger.debug(f"- '{pkg}'")
-                        url = self.url_by_package(pkg)
-                        yield scrapy.Request(url, priority=-1, callback=self.parse_pkg_page, meta=meta)
-                        line = f.readline()
+                pkgs = self._own_packages(self.package_sources.read_file(pkg_file))
+                if self.frontier:
+                    self.frontier.add(pkgs)
+                else:
+                    for req in self.package_requests(pkgs, meta):
+                        yield req
         else:
             self.logger.debug("NOT retrieving from package files")
 
-        # crawl the store as usual
-        if self.retrieve_base_requests:
+        if self.frontier:
+            for req in self._frontier_requests(meta):
+                yield req
+
+        # crawl the store as usual, by a single shard only
+        if self.retrieve_base_requests and self.shard and not self.shard.owns(market_from_spider(self)):
+            self.logger.debug("NOT retrieving from base requests, as they belong to another shard")
+        elif self.retrieve_base_requests:
             self.logger.debug("retrieving from base requests")
             for req in self.base_requests(meta=meta):
                 yield req
         else:
             self.logger.debug("NOT retrieving from base requests")
 
+    def _init_frontier(self, params):
+        """
+        Returns the Frontier of the market of the spider if enabled, of which the leases are renewed periodically and released when the spider closes
+        """
+        if not params.get("enabled", False):
+            return None
+        engine, dbtype = engine_from_crawler(self.crawler)
+        lease_time = params.get("lease_time", 600)
+        frontier = Frontier(
+            engine,
+            dbtype,
+            market_from_spider(self),
+            worker=params.get("worker", None),
+            lease_time=lease_time,
+            max_attempts=params.get("max_attempts", 3)
+        )
+        self.frontier_batch_size = params.get("batch_size", 100)
+
+        self._renew_task = task.LoopingCall(self._renew_frontier, frontier)
+        self._renew_task.start(lease_time / 3, now=False)
+        self.crawler.signals.connect(self._frontier_item_done, signal=signals.item_scraped)
+        self.crawler.signals.connect(self._frontier_item_done, signal=signals.item_dropped)
+        self.crawler.signals.connect(self._frontier_closed, signal=signals.spider_closed)
+        return frontier
+
+    def _renew_frontier(self, frontier):
+        """
+        Renews the leases of the frontier, of which a failure (e.g. a lost database connection) is logged,
+        such that the renewals continue rather than the leases expiring while the spider crawls
+        """
+        try:
+            frontier.renew()
+        except Exception as e:
+            self.logger.warning(f"failed to renew the leases of the frontier: {e}")
+
+    def _frontier_requests(self, meta):
+        """
+        Generator of the requests for the packages claimed from the frontier, one batch at a time until the frontier is exhausted
+        As the engine consumes the start requests lazily, a batch is only claimed once the requests of the previous batch are consumed
+        """
+        while True:
+            pkgs = self.frontier.claim(self.frontier_batch_size)
+            if not pkgs:
+                self.logger.debug("frontier is exhausted")
+                return
+            self.crawler.stats.inc_value("frontier/claimed", len(pkgs))
+            for req in self.package_requests(pkgs, meta):
+                yield req
+
+    def _frontier_item_done(self, item, spider, **kwargs):
+        pkg_name = item.get("meta", {}).get("pkg_name", None)
+        if pkg_name:
+            self.frontier.complete(pkg_name)
+            self.crawler.stats.inc_value("frontier/completed")
+
+    def _frontier_closed(self, spider, reason):
+        if self._renew_task.running:
+            self._renew_task.stop()
+        self.frontier.release()
+
+    def _own_packages(self, pkgs):
+        """
+        Generator of the packages that belong to the shard of the spider
+        """
+        for pkg in pkgs:
+            if not self.shard or self.shard.owns(pkg):
+                yield pkg
+            else:
+                self.crawler.stats.inc_value("sharding/skipped")
+
+    def _init_package_sources(self, params):
+        """
+        Returns the PackageSources of the spider, of which the state is kept in the JOBDIR (if any) and saved when the spider closes
+        """
+        jobdir = job_dir(self.settings)
+        sources = PackageSources(
+            capacity=params.get("capacity", 10000000),
+            error_rate=params.get("error_rate", 0.001),
+            state_path=os.path.join(jobdir, "package_sources.state") if jobdir else None
+        )
+        self.crawler.signals.connect(self._package_sources_closed, signal=signals.spider_closed)
+        return sources
+
+    def _package_sources_closed(self, spider, reason):
+        self.package_sources.save()
+        self.crawler.stats.set_value("package_sources/duplicates", self.package_sources.duplicates)
+
+    def package_requests(self, pkgs, meta):
+        """
+        Generator of the requests to crawl the given packages, by default visiting the page of every package
+        Spiders can override this, e.g. to batch multiple packages into a single request
+        Args:
+            pkgs: iterable of package names
+            meta: dict
+                meta of the requests
+        """
+        for pkg in pkgs:
+            url = self.url_by_package(pkg)
+            yield scrapy.Request(url, priority=-1, callback=self.parse_pkg_page, meta=meta)
+
     def base_requests(self, meta={}):
         raise NotImplementedError()
 
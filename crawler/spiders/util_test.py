@@ -1,6 +1,15 @@
+import os
+import tempfile
 import unittest
+from unittest import mock
 
-from crawler.spiders.util import version_name
+from scrapy.utils.test import get_crawler
+from sqlalchemy.exc import OperationalError
+from twisted.internet.task import Clock
+
+from crawler.spiders import SPIDERS, spider_by_name
+from crawler.spiders.util import PackageListSpider, version_name
+from crawler.util import market_from_spider
 
 
 class TestUtil(unittest.TestCase):
@@ -18,5 +27,50 @@ class TestUtil(unittest.TestCase):
         self.assertEqual("1 (3)", vn)
 
 
+class ExampleSpider(PackageListSpider):
+    name = "example_spider"
+
+    def __init__(self, crawler):
+        super().__init__(crawler=crawler, settings=crawler.settings)
+
+
+class TestFrontierRenewal(unittest.TestCase):
+    def test_renew_failure(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            crawler = get_crawler(ExampleSpider, {
+                "DATABASE_PARAMS": dict(type="sqlite", sqlite=dict(dbfile=os.path.join(tmpdir, "test.db")))
+            })
+            spider = ExampleSpider(crawler)
+            frontier = spider._init_frontier(dict(enabled=True, lease_time=30))
+
+            # renew by a fake clock, every 10 seconds
+            clock = Clock()
+            spider._renew_task.stop()
+            spider._renew_task.clock = clock
+            spider._renew_task.start(10, now=False)
+
+            with mock.patch.object(frontier, "renew", side_effect=[OperationalError("UPDATE", {}, Exception("gone")), 0]) as renew:
+                clock.advance(10)
+                # a failed renewal does not stop the renewals
+                self.assertTrue(spider._renew_task.running)
+                clock.advance(10)
+                self.assertEqual(renew.call_count, 2)
+            spider._renew_task.stop()
+
+
+class TestRegistry(unittest.TestCase):
+    def test_spider_by_name(self):
+        spider = spider_by_name("fdroid")
+        self.assertEqual(market_from_spider(spider), "fdroid")
+
+        with self.assertRaises(Exception):
+            spider_by_name("unknown")
+
+    def test_spider_list(self):
+        with open("config/spider_list.txt") as f:
+            names = [l.strip() for l in f if l.strip()]
+        self.assertEqual(sorted(names), sorted(SPIDERS))
+
+
 if __name__ == '__main__':
     unittest.main()
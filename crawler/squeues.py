@@ -0,0 +1,288 @@
+import datetime
+import hashlib
+import os
+import pickle
+import sqlite3
+import struct
+
+import msgpack
+from queuelib import queue
+from scrapy.utils.request import request_from_dict
+
+# Keys of requests and their meta (including items) that are packed as small integers instead of strings.
+# The code of a key is its index, so keys may only be appended, or the queues in existing JOBDIRs are read incorrectly.
+_KEYS = (
+    # Request.to_dict
+    "url", "callback", "errback", "headers", "method", "body", "cookies", "meta", "encoding", "priority", "dont_filter", "flags",
+    "cb_kwargs", "_class",
+    # Scrapy meta
+    "depth", "download_timeout", "download_slot", "download_latency", "download_maxsize", "proxy", "dont_redirect",
+    "redirect_times", "redirect_ttl", "redirect_urls", "redirect_reasons", "handle_httpstatus_list", "handle_httpstatus_all",
+    "dont_merge_cookies", "cookiejar", "splash",
+    # crawler meta
+    "__pkg_start_time", "__request_start_time", "_account", "not_before", "pkg_name", "pkg_names", "id", "market", "version",
+    "versions", "item",
+    # item meta
+    "app_name", "app_description", "app_summary", "developer_name", "developer_address", "developer_email", "developer_website",
+    "icon_url", "categories", "downloads", "user_rating", "content_rating", "languages", "price", "currency", "offer_type",
+    "privacy_policy", "terms", "uploader", "timestamp", "component_versions",
+    # item versions
+    "download_url", "file_path", "file_md5", "file_sha256", "file_size", "file_success", "icon_path", "icon_md5", "icon_sha256",
+    "icon_success", "analysis", "privacy_policy_path", "privacy_policy_status", "status_code",
+)
+_KEY_CODES = {key: code for code, key in enumerate(_KEYS)}
+
+_EXT_DATETIME = 1
+_EXT_DATE = 2
+_EXT_PACKED = 3  # meta value that is unpacked separately
+_EXT_PAYLOAD = 4  # reference to a meta value in the payload store
+_EXT_PICKLE = 127  # any other object
+
+_DATETIME = struct.Struct(">HBBBBBI")
+_DATE = struct.Struct(">HBB")
+
+
+class PayloadStore:
+    """
+    Large values of queued requests, stored out of line in SQLite, by their digest.
+    Equal values are stored once, with the number of queued requests that refer to them.
+    """
+
+    def __init__(self, path, commit_interval=1000):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA synchronous=OFF")  # like the queues, the store is only consistent after it is closed
+        self.conn.execute("CREATE TABLE IF NOT EXISTS payloads (digest BLOB PRIMARY KEY, data BLOB, refs INTEGER)")
+        self._writes = 0
+
+    def put(self, data):
+        """
+        Returns: bytes
+            digest of the data, by which it is retrieved
+        """
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        self.conn.execute(
+            "INSERT INTO payloads VALUES (?, ?, 1) ON CONFLICT (digest) DO UPDATE SET refs = refs + 1",
+            (digest, data)
+        )
+        self._written()
+        return digest
+
+    def get(self, digest, release=True):
+        """
+        Returns the data of the digest, which is removed once it is released by all requests that refer to it
+        """
+        row = self.conn.execute("SELECT data, refs FROM payloads WHERE digest = ?", (digest,)).fetchone()
+        if not row:
+            raise ValueError(f"missing payload {digest.hex()} in '{self.path}'")
+        data, refs = row
+        if release:
+            if refs > 1:
+                self.conn.execute("UPDATE payloads SET refs = refs - 1 WHERE digest = ?", (digest,))
+            else:
+                self.conn.execute("DELETE FROM payloads WHERE digest = ?", (digest,))
+            self._written()
+        return data
+
+    def _written(self):
+        self._writes += 1
+        if self._writes >= self.commit_interval:
+            self.conn.commit()
+            self._writes = 0
+
+    def close(self, remove=False):
+        self.conn.commit()
+        self.conn.close()
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class RequestCodec:
+    """
+    Serializes the dicts of requests (see Request.to_dict) to msgpack, which is more compact than pickle:
+    - the keys of requests, their meta, cb_kwargs and items (the values of 'meta', 'item' and 'versions') are packed as small integers (see _KEYS)
+    - (naive) datetimes and dates are packed as extension types, and any other object that msgpack does not support is pickled
+    - the values in the meta and cb_kwargs of a request that are larger than 'payload_threshold' bytes (e.g. items)
+      are stored out of line in the payload store, if any, such that requests that carry the same item share it
+    Like JSON, msgpack does not distinguish tuples from lists, so tuples are restored as lists.
+    """
+
+    def __init__(self, payloads=None, payload_threshold=1024):
+        self.payloads = payloads
+        self.payload_threshold = payload_threshold
+        self._release = True
+
+    def dumps(self, request):
+        """
+        Args:
+            request: dict
+        Returns: bytes
+        """
+        try:
+            request = _encode_keys(request)
+            for key in (_KEY_CODES["meta"], _KEY_CODES["cb_kwargs"]):
+                if request.get(key):
+                    request[key] = {k: self._pack_value(v) for k, v in request[key].items()}
+            return self._pack(request)
+        except (pickle.PicklingError, AttributeError, TypeError) as e:
+            # the scheduler keeps requests that cannot be serialized in memory
+            raise ValueError(str(e)) from e
+
+    def loads(self, data, release=True):
+        """
+        Args:
+            data: bytes
+            release: bool
+                whether the payloads of the request are released, i.e. the request is removed from the queue
+        Returns: dict
+        """
+        self._release = release
+        return _decode_keys(self._unpack(data))
+
+    def _pack(self, obj):
+        return msgpack.packb(obj, default=self._default, use_bin_type=True)
+
+    def _unpack(self, data):
+        return msgpack.unpackb(data, ext_hook=self._ext_hook, raw=False, strict_map_key=False)
+
+    def _pack_value(self, value):
+        if type(value) not in (dict, list):
+            return value
+        packed = self._pack(value)
+        if self.payloads is not None and len(packed) > self.payload_threshold:
+            return msgpack.ExtType(_EXT_PAYLOAD, self.payloads.put(packed))
+        return msgpack.ExtType(_EXT_PACKED, packed)
+
+    @staticmethod
+    def _default(obj):
+        t = type(obj)
+        if t is datetime.datetime and obj.tzinfo is None:
+            return msgpack.ExtType(_EXT_DATETIME, _DATETIME.pack(
+                obj.year, obj.month, obj.day, obj.hour, obj.minute, obj.second, obj.microsecond
+            ))
+        if t is datetime.date:
+            return msgpack.ExtType(_EXT_DATE, _DATE.pack(obj.year, obj.month, obj.day))
+        return msgpack.ExtType(_EXT_PICKLE, pickle.dumps(obj, protocol=4))
+
+    def _ext_hook(self, code, data):
+        if code == _EXT_DATETIME:
+            return datetime.datetime(*_DATETIME.unpack(data))
+        if code == _EXT_DATE:
+            return datetime.date(*_DATE.unpack(data))
+        if code == _EXT_PACKED:
+            return self._unpack(data)
+        if code == _EXT_PAYLOAD:
+            return self._unpack(self.payloads.get(data, release=self._release))
+        if code == _EXT_PICKLE:
+            return pickle.loads(data)
+        return msgpack.ExtType(code, data)
+
+
+# keys of which the values are dicts with known keys as well
+_NESTED_CODES = [_KEY_CODES[key] for key in ("meta", "cb_kwargs", "item")]
+_VERSIONS_CODE = _KEY_CODES["versions"]
+_KEY_NAMES = dict(enumerate(_KEYS))
+
+
+def _encode_keys(d):
+    """
+    Returns a copy of the dict with the known keys replaced by their codes, including the keys of nested meta, items and versions
+    """
+    res = _encode_flat(d)
+    for code in _NESTED_CODES:
+        v = res.get(code)
+        if type(v) is dict:
+            res[code] = _encode_keys(v)
+    versions = res.get(_VERSIONS_CODE)
+    if type(versions) is dict:
+        res[_VERSIONS_CODE] = {version: _encode_flat(values) if type(values) is dict else values for version, values in versions.items()}
+    return res
+
+
+def _encode_flat(d):
+    if int in map(type, d):
+        raise TypeError("integer keys cannot be distinguished from known keys")
+    return {_KEY_CODES.get(k, k): v for k, v in d.items()}
+
+
+def _decode_keys(d):
+    """
+    Inverse of _encode_keys
+    """
+    # the unpacked dicts are not shared, so they are updated in place
+    for code in _NESTED_CODES:
+        v = d.get(code)
+        if type(v) is dict:
+            d[code] = _decode_keys(v)
+    versions = d.get(_VERSIONS_CODE)
+    if type(versions) is dict:
+        for version, values in versions.items():
+            if type(values) is dict:
+                versions[version] = {_KEY_NAMES.get(k, k): v for k, v in values.items()}
+    return {_KEY_NAMES.get(k, k): v for k, v in d.items()}
+
+
+def _msgpack_queue(queue_class):
+    """
+    Returns a disk queue of requests that serializes them by a RequestCodec, with a payload store next to the queue file
+    """
+
+    class MsgpackRequestQueue(queue_class):
+        def __init__(self, crawler, key, payload_threshold=1024):
+            self.spider = crawler.spider
+            os.makedirs(os.path.dirname(key), exist_ok=True)
+            super().__init__(key)
+            self.payloads = PayloadStore(f"{key}.payloads")
+            self.codec = RequestCodec(self.payloads, payload_threshold=payload_threshold)
+
+        @classmethod
+        def from_crawler(cls, crawler, key, *args, **kwargs):
+            params = crawler.settings.getdict("DISK_QUEUE_PARAMS")
+            return cls(crawler, key, payload_threshold=params.get("payload_threshold", 1024))
+
+        def push(self, request):
+            super().push(self.codec.dumps(request.to_dict(spider=self.spider)))
+
+        def pop(self):
+            data = super().pop()
+            if not data:
+                return None
+            return request_from_dict(self.codec.loads(data), spider=self.spider)
+
+        def peek(self):
+            data = super().peek()
+            if not data:
+                return None
+            return request_from_dict(self.codec.loads(data, release=False), spider=self.spider)
+
+        def close(self):
+            self.payloads.close(remove=not len(self))
+            super().close()
+
+    return MsgpackRequestQueue
+
+
+MsgpackFifoDiskQueue = _msgpack_queue(queue.FifoDiskQueue)
+MsgpackLifoDiskQueue = _msgpack_queue(queue.LifoDiskQueue)
+
+
+def queued_serialization(jobdir):
+    """
+    Returns the serialization of the requests that a previous crawl left queued in the jobdir,
+    i.e. 'msgpack', 'pickle', or None if there are no queued requests
+    Scrapy removes the queues that are empty when the crawl stops, and every msgpack queue has its payload store next to it
+    """
+    res = None
+    for dirpath, dirnames, filenames in os.walk(os.path.join(jobdir, "requests.queue")):
+        if "info.json" in filenames:
+            # a FIFO queue, of which the chunks are files in a directory
+            dirnames.clear()
+            queues = [dirpath]
+        else:
+            queues = [os.path.join(dirpath, f) for f in filenames if not f.endswith((".json", ".payloads"))]
+        for path in queues:
+            if not os.path.exists(f"{path}.payloads"):
+                return "pickle"
+            res = "msgpack"
+    return res
@@ -0,0 +1,124 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from scrapy import Request, Spider
+from scrapy.squeues import PickleFifoDiskQueue, PickleLifoDiskQueue
+from scrapy.utils.test import get_crawler
+
+from crawler.squeues import MsgpackFifoDiskQueue, MsgpackLifoDiskQueue, RequestCodec, queued_serialization
+
+
+class ExampleSpider(Spider):
+    name = "test"
+
+    def parse_details(self, response):
+        pass
+
+
+def _item(pkg_name):
+    return {
+        'meta': {'pkg_name': pkg_name, 'app_name': 'Example', 'app_description': 'x' * 2000},
+        'versions': {'1.0': {'timestamp': datetime.datetime(2022, 1, 2, 3, 4, 5), 'download_url': 'https://example.com/app.apk'}}
+    }
+
+
+class TestRequestCodec(unittest.TestCase):
+    def test_roundtrip(self):
+        codec = RequestCodec()
+        request = dict(
+            url="https://example.com",
+            headers={b"Accept": [b"*/*"]},
+            meta={
+                "__pkg_start_time": datetime.datetime.now(),
+                "date": datetime.date(2022, 1, 2),
+                "pair": [1, "a"],
+                "ids": {1: "a", 2: "b"},
+                "item": _item("com.example"),
+                "unknown": {"custom_key": [1.5, None, True]}
+            },
+            priority=-1,
+            dont_filter=False
+        )
+        self.assertEqual(codec.loads(codec.dumps(request)), request)
+
+    def test_unserializable(self):
+        with self.assertRaises(ValueError):
+            RequestCodec().dumps(dict(url="https://example.com", meta={"callback": lambda x: x}))
+        # integer keys of meta would be read as known keys
+        with self.assertRaises(ValueError):
+            RequestCodec().dumps(dict(url="https://example.com", meta={1: "a"}))
+
+
+class TestMsgpackDiskQueue(unittest.TestCase):
+    def setUp(self):
+        self.jobdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.jobdir.name, "requests.queue", "p0")
+        self.crawler = get_crawler(ExampleSpider)
+        self.crawler.spider = self.spider = ExampleSpider()
+
+    def tearDown(self):
+        self.jobdir.cleanup()
+
+    def _payload_count(self, q):
+        return q.payloads.conn.execute("SELECT count(*), coalesce(sum(refs), 0) FROM payloads").fetchone()
+
+    def test_shared_payloads(self):
+        q = MsgpackFifoDiskQueue.from_crawler(self.crawler, self.path)
+        item = _item("com.example")
+        for i in range(3):
+            q.push(Request(f"https://example.com/{i}", callback=self.spider.parse_details, meta={"item": item, "depth": 1}))
+        # the item is stored once, for all three requests
+        self.assertEqual(self._payload_count(q), (1, 3))
+
+        request = q.peek()
+        self.assertEqual(request.url, "https://example.com/0")
+        self.assertEqual(self._payload_count(q), (1, 3))
+
+        for i in range(3):
+            request = q.pop()
+            self.assertEqual(request.url, f"https://example.com/{i}")
+            self.assertEqual(request.meta["item"], item)
+            self.assertEqual(request.callback, self.spider.parse_details)
+        self.assertEqual(self._payload_count(q), (0, 0))
+
+        # the payloads of an empty queue are removed with the queue
+        q.close()
+        self.assertFalse(os.path.exists(f"{self.path}.payloads"))
+
+    def test_resume(self):
+        q = MsgpackLifoDiskQueue.from_crawler(self.crawler, self.path)
+        q.push(Request("https://example.com/1", meta={"item": _item("com.example1")}))
+        q.push(Request("https://example.com/2", meta={"item": _item("com.example2")}))
+        q.close()
+
+        q = MsgpackLifoDiskQueue.from_crawler(self.crawler, self.path)
+        self.assertEqual(len(q), 2)
+        request = q.pop()
+        self.assertEqual(request.url, "https://example.com/2")
+        self.assertEqual(request.meta["item"]["meta"]["pkg_name"], "com.example2")
+        q.close()
+
+    def test_queued_serialization(self):
+        self.assertIsNone(queued_serialization(self.jobdir.name))
+        for queue_class, serialization in [
+            (MsgpackLifoDiskQueue, "msgpack"),
+            (MsgpackFifoDiskQueue, "msgpack"),
+            (PickleLifoDiskQueue, "pickle"),
+            (PickleFifoDiskQueue, "pickle"),
+        ]:
+            q = queue_class.from_crawler(self.crawler, self.path)
+            q.push(Request("https://example.com"))
+            q.close()
+            self.assertEqual(queued_serialization(self.jobdir.name), serialization)
+
+            # empty queues are removed
+            q = queue_class.from_crawler(self.crawler, self.path)
+            q.pop()
+            q.close()
+            self.assertIsNone(queued_serialization(self.jobdir.name))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,28 +1,37 @@
 import io
-import time
-from datetime import datetime, timedelta
+import logging
+from datetime import timedelta
 import hashlib
+import heapq
 import os
 import re
-from random import choice
+from random import randrange
 
 import scrapy
 from scrapy.settings import Settings
+from scrapy.signalmanager import SignalManager
 from scrapy.statscollectors import MemoryStatsCollector
 from treq import get as treqget
 from twisted.internet import defer
 
+from crawler.proxy_health import HealthTracker
+
 PROXY_POOL = None
 
+logger = logging.getLogger(__name__)
+
 
 class NoProxiesError(Exception):
     pass
 
 
-def init_proxy_pool(crawler, proxies):
+def init_proxy_pool(crawler, proxies, health_params={}, shared_state=None):
     global PROXY_POOL
     if not PROXY_POOL:
-        PROXY_POOL = BackoffProxyPool(crawler, proxies)
+        PROXY_POOL = BackoffProxyPool(crawler, proxies, health_params=health_params, shared_state=shared_state)
+
+
+_proxy_pattern = re.compile("\d{1,3}\.\d{1,3}\.\d{1,3}.\d{1,3}:\d+")
 
 
 def _is_valid(proxy):
@@ -31,105 +40,248 @@ def _is_valid(proxy):
     """
     if not proxy:
         return False
-    pattern = "\d{1,3}\.\d{1,3}\.\d{1,3}.\d{1,3}:\d+"
-    return re.match(pattern, proxy)
+    return _proxy_pattern.match(proxy)
+
+
+def _proxy_key(proxy):
+    """
+    Returns the proxy as stored in the proxy pool, i.e. without the scheme used in request.meta['proxy']
+    """
+    if proxy and "://" in proxy:
+        return proxy.split("://", 1)[1]
+    return proxy
 
 
 class BackoffProxyPool:
-    def __init__(self, crawler, proxies):
+    """
+    Pool of proxies, of which individual proxies can be blocked for some time (e.g. after being rate limited).
+    Proxies are acquired asynchronously: when all proxies are blocked, the returned Deferred fires
+    as soon as the first proxy becomes available again, without blocking the reactor.
+
+    Available proxies are kept in a list (with an index for O(1) removal) for O(1) random selection,
+    and blocked proxies in a min-heap of the times at which they become available again.
+
+    Unless disabled, the health of proxies is tracked (see crawler.proxy_health.HealthTracker):
+    proxies are selected by the "power of two choices", i.e. the healthier of two random available proxies,
+    and persistently bad proxies are quarantined by backing them off.
+
+    When given a crawler.shared_state.SharedState, backoffs are shared with the pools of other processes on the host.
+    """
+
+    def __init__(self, crawler, proxies, clock=None, health_params={}, shared_state=None):
+        if clock is None:
+            from twisted.internet import reactor
+            clock = reactor
         self.crawler = crawler
-        self.proxies = {}
+        self.clock = clock
+        self.proxies = {}  # proxy -> time until which it is blocked, or None
+        self._available = []
+        self._available_index = {}
+        self._blocked = []  # heap of (blocked_until, proxy), entries are stale if they do not match 'proxies'
         for proxy in proxies:
             if _is_valid(proxy):
                 self.proxies[proxy] = None
+                self._make_available(proxy)
             else:
-                crawler.spider.logger.debug(f"dropping invalid proxy: {proxy}")
+                logger.debug(f"dropping invalid proxy: {proxy}")
 
-        self.use_proxies = len(proxies) > 0
-        self.non_proxy_until = datetime.now()
+        self.use_proxies = len(self.proxies) > 0
+        self.non_proxy_until = self.clock.seconds()
 
-        crawler.spider.logger.debug(f"initialized {len(proxies)} proxies")
+        self._waiters = []
+        self._release_call = None
+
+        health_params = dict(health_params)
+        self.health = HealthTracker(**health_params) if health_params.pop("enabled", True) else None
+
+        self.shared_state = shared_state
+
+        logger.debug(f"initialized {len(self.proxies)} proxies")
+
+    def _make_available(self, proxy):
+        if proxy not in self._available_index:
+            self._available_index[proxy] = len(self._available)
+            self._available.append(proxy)
+
+    def _make_unavailable(self, proxy):
+        idx = self._available_index.pop(proxy, None)
+        if idx is None:
+            return
+        last = self._available.pop()
+        if last != proxy:
+            self._available[idx] = last
+            self._available_index[last] = idx
+
+    def _block(self, proxy, until):
+        """
+        Blocks the proxy until the given time, unless it is blocked for longer already (e.g. quarantined)
+        Returns: float
+            time until which the proxy is blocked
+        """
+        current = self.proxies[proxy] or 0
+        if until <= current:
+            return current
+        self.proxies[proxy] = until
+        self._make_unavailable(proxy)
+        heapq.heappush(self._blocked, (until, proxy))
+        return until
+
+    def _sync(self):
+        """
+        Applies the backoffs of other processes
+        """
+        for proxy, until in self.shared_state.poll_backoffs(self.clock.seconds()):
+            if proxy in self.proxies:
+                self._block(proxy, until)
+
+    def _unblock_expired(self):
+        """
+        Makes the proxies whose blocking time has passed available again
+        """
+        if self.shared_state:
+            self._sync()
+        now = self.clock.seconds()
+        while self._blocked and self._blocked[0][0] <= now:
+            until, proxy = heapq.heappop(self._blocked)
+            if self.proxies.get(proxy, None) == until:
+                self.proxies[proxy] = None
+                self._make_available(proxy)
 
     def _available_proxies(self):
         """
         Returns the list of proxies that is currently available
         """
-        res = []
-
-        now = datetime.now()
-        for proxy, blocked_until in self.proxies.items():
-            if not blocked_until:
-                res.append(proxy)
-            elif now >= blocked_until:
-                res.append(proxy)
-                self.proxies[proxy] = None
-        return res
+        self._unblock_expired()
+        return list(self._available)
 
     def _time_until_next_available(self):
         """
         Returns the time until the first proxy becomes available
         """
         if not self.use_proxies:
-            res = (self.non_proxy_until - datetime.now()).total_seconds()
-            res = max(res, 0)
-            return res
-        else:
-            earliest_available = None
-            for until in self.proxies.values():
-                if not earliest_available or (until and until < earliest_available):
-                    earliest_available = until
-            if not earliest_available:
-                return 0
-            res = (earliest_available - datetime.now()).total_seconds()
+            res = self.non_proxy_until - self.clock.seconds()
             res = max(res, 0)
             return res
 
-    def _pause(self, t):
+        self._unblock_expired()
+        if self._available:
+            return 0
+        while self.proxies.get(self._blocked[0][1], None) != self._blocked[0][0]:
+            heapq.heappop(self._blocked)  # drop stale entry
+        res = self._blocked[0][0] - self.clock.seconds()
+        res = max(res, 0)
+        return res
+
+    def get_proxy(self):
         """
-        Pause the crawler 't' seconds
+        Returns a Deferred that fires with a random proxy that is not rate limited, or None when not using proxies
+        If none is available, the Deferred fires once the first proxy becomes available
         """
-        try:
-            self.crawler.engine.pause()
-            time.sleep(t)
-        finally:
-            self.crawler.engine.unpause()
+        d = defer.Deferred()
+        self._waiters.append(d)
+        self._release()
+        return d
 
-    def get_proxy(self):
+    def _release(self):
         """
-        Returns a random proxy that is not rate limited
-        If none available, return the time until the next becomes available
+        Fires the Deferreds of all waiting requests if a proxy is available, otherwise schedules a timer for when one becomes available
         """
         wait_time = self._time_until_next_available()
-        if wait_time:
-            self.crawler.spider.logger.debug(f"backing off for {wait_time:.2f} seconds")
-        self._pause(wait_time)
+        if wait_time > 0:
+            release_at = self.clock.seconds() + wait_time
+            if self._release_call and self._release_call.active():
+                if self._release_call.getTime() > release_at:
+                    self._release_call.reset(wait_time)
+            else:
+                logger.debug(f"backing off for {wait_time:.2f} seconds")
+                self._release_call = self.clock.callLater(wait_time, self._release)
+            return
 
+        waiters, self._waiters = self._waiters, []
         if not self.use_proxies:
-            return {}
-        else:
-            available = self._available_proxies()
-            if available:
-                return choice(available)
-            return Exception("should never happen!")
+            for d in waiters:
+                d.callback(None)
+            return
+
+        for d in waiters:
+            d.callback(self._choose())
+
+    def _choose(self):
+        """
+        Returns a random available proxy, or the healthier of two random available proxies when tracking health
+        """
+        n = len(self._available)
+        proxy = self._available[randrange(n)]
+        if not self.health or n == 1:
+            return proxy
+        other = self._available[randrange(n)]
+        if self.health.score(other) > self.health.score(proxy):
+            return other
+        return proxy
+
+    def record(self, proxy, latency, size=0, error=False):
+        """
+        Records a finished request of the proxy for its health, and quarantines the proxy if it is persistently bad
+        Args:
+            proxy: proxy of the request, with or without scheme
+            latency: number of seconds the request took
+            size: number of bytes in the response body
+            error: whether the request failed
+        """
+        proxy = _proxy_key(proxy)
+        if not self.health or proxy not in self.proxies:
+            return
+        quarantine_time = self.health.record(proxy, latency, size=size, error=error)
+        if quarantine_time:
+            logger.info(f"quarantining unhealthy proxy {proxy} for {quarantine_time:.0f} seconds")
+            self.crawler.stats.inc_value("proxies/quarantined")
+            self.backoff(proxy, seconds=quarantine_time)
 
     def get_proxy_as_dict(self):
-        return get_proxy_as_dict(self.get_proxy())
+        return self.get_proxy().addCallback(get_proxy_as_dict)
 
     def backoff(self, proxy, **kwargs):
         """
-        Blocks the proxy from being used until "until"
+        Blocks the proxy from being used for the given time
+        A backoff never shortens an earlier, longer backoff of the proxy
         Args:
-            proxy: proxy to backoff
-            duration: time delta in milliseconds
+            proxy: proxy to backoff, with or without scheme
+            kwargs: arguments of datetime.timedelta
 
         Returns:
 
         """
-        until = datetime.now() + timedelta(**kwargs)
+        until = self.clock.seconds() + timedelta(**kwargs).total_seconds()
+        proxy = _proxy_key(proxy)
         if not proxy:
-            self.non_proxy_until = until
-        else:
-            self.proxies[proxy] = until
+            self.non_proxy_until = max(self.non_proxy_until, until)
+        elif proxy in self.proxies:
+            until = self._block(proxy, until)
+            if self.shared_state:
+                self.shared_state.backoff(proxy, until, self.clock.seconds())
+
+    def get_state(self):
+        """
+        Returns the state of the pool to be persisted across restarts, i.e. the active backoffs and the health of the proxies
+        """
+        now = self.clock.seconds()
+        return dict(
+            backoffs={proxy: until for proxy, until in self.proxies.items() if until and until > now},
+            non_proxy_until=self.non_proxy_until,
+            health=self.health.get_state() if self.health else {}
+        )
+
+    def set_state(self, state):
+        """
+        Restores the state as returned by 'get_state', ignoring backoffs that expired in the meantime and unknown proxies
+        """
+        now = self.clock.seconds()
+        for proxy, until in state.get("backoffs", {}).items():
+            if proxy in self.proxies and until > now:
+                self._block(proxy, until)
+        self.non_proxy_until = max(self.non_proxy_until, state.get("non_proxy_until", 0))
+        if self.health:
+            self.health.set_state({proxy: health for proxy, health in state.get("health", {}).items() if proxy in self.proxies})
 
 
 def get_proxy_as_dict(proxy):
@@ -164,6 +316,22 @@ def get_identifier(meta):
     raise Exception('cannot find identifier for app')
 
 
+def media_request_meta(item, **kwargs):
+    """
+    Returns the meta of a request for a file of an item (e.g. an APK, icon or ads.txt), which only holds the identifiers of the app
+    (as needed for its directory and error reports), instead of the entire item.
+    Files pipelines receive the item itself in 'file_path' and 'item_completed', in which the results are joined back into the item.
+    Args:
+        item: dict
+        kwargs:
+            other meta of the request, e.g. 'download_timeout'
+    Returns: dict
+    """
+    meta = item.get("meta", {})
+    handle = {key: meta[key] for key in ("pkg_name", "id") if meta.get(key)}
+    return dict(meta=handle, **kwargs)
+
+
 def market_from_spider(spider):
     """
     Returns the name of the marker of a given spider instance
@@ -210,6 +378,7 @@ class TestEngine:
 class TestCrawler:
     def __init__(self):
         self.settings = Settings()
+        self.signals = SignalManager(self)
         self.stats = MemoryStatsCollector(self)
         self.engine = TestEngine()
         self.spider = None
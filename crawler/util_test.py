@@ -1,79 +1,187 @@
 import random
-import time
 import unittest
 
-from crawler.util import BackoffProxyPool, TestCrawler
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
 
+from crawler.util import BackoffProxyPool, TestCrawler, media_request_meta
+
+
+class TestProxyPool(SynchronousTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.clock.advance(1000)
 
-class TestProxyPool(unittest.TestCase):
     def test_available_proxies(self):
         proxies = [
-            "proxy1",
-            "proxy2"
+            "1.1.1.1:80",
+            "2.2.2.2:80"
         ]
         crawler = TestCrawler()
-        pp = BackoffProxyPool(crawler, proxies)
+        pp = BackoffProxyPool(crawler, proxies, clock=self.clock)
 
         available = pp._available_proxies()
-        self.assertEqual(["proxy1", "proxy2"], available)
+        self.assertEqual(["1.1.1.1:80", "2.2.2.2:80"], available)
 
-        pp.backoff("proxy1", milliseconds=10)
-        pp.backoff("proxy2", milliseconds=20)
+        pp.backoff("1.1.1.1:80", milliseconds=10)
+        pp.backoff("http://2.2.2.2:80", milliseconds=20)  # as found in request.meta['proxy']
 
         available = pp._available_proxies()
         self.assertEqual([], available)
 
-        time.sleep(0.015)  # sleep 15 ms
+        self.clock.advance(0.015)
         available = pp._available_proxies()
-        self.assertEqual(["proxy1"], available)
+        self.assertEqual(["1.1.1.1:80"], available)
 
-        time.sleep(0.01)  # sleep another 10 ms
+        self.clock.advance(0.01)
         available = pp._available_proxies()
-        self.assertEqual(["proxy1", "proxy2"], available)
+        self.assertEqual(["1.1.1.1:80", "2.2.2.2:80"], available)
 
     def test_get_proxy(self):
         proxies = [
-            "proxy1",
-            "proxy2"
+            "1.1.1.1:80",
+            "2.2.2.2:80"
         ]
         crawler = TestCrawler()
-        pp = BackoffProxyPool(crawler, proxies)
+        pp = BackoffProxyPool(crawler, proxies, clock=self.clock)
 
         # both should be seen
-        expected_vals = ["proxy1", "proxy1", "proxy2"]
-        for expected_val in expected_vals:
-            proxy, waittime = pp._get_proxy()
-            self.assertEqual(proxy, expected_val)
+        random.seed(1)
+        seen = set()
+        for i in range(20):
+            seen.add(self.successResultOf(pp.get_proxy()))
+        self.assertEqual(seen, set(proxies))
 
         # proxy1 is backing off, so only proxy2
-        pp.backoff("proxy1", milliseconds=1)
+        pp.backoff("1.1.1.1:80", milliseconds=1)
+        for i in range(5):
+            self.assertEqual(self.successResultOf(pp.get_proxy()), "2.2.2.2:80")
+
+        # both backing off, so the request waits until the first proxy becomes available
+        pp.backoff("2.2.2.2:80", milliseconds=10)
+        d = pp.get_proxy()
+        self.assertNoResult(d)
+
+        self.clock.advance(0.002)
+        self.assertEqual(self.successResultOf(d), "1.1.1.1:80")
+
+    def test_get_proxy_waiters(self):
+        crawler = TestCrawler()
+        pp = BackoffProxyPool(crawler, ["1.1.1.1:80"], clock=self.clock)
+
+        pp.backoff("1.1.1.1:80", seconds=5)
+        waiting = [pp.get_proxy() for i in range(3)]
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)  # a single timer for all waiting requests
+
+        self.clock.advance(4)
+        for d in waiting:
+            self.assertNoResult(d)
+
+        self.clock.advance(1)
+        for d in waiting:
+            self.assertEqual(self.successResultOf(d), "1.1.1.1:80")
+
+    def test_backoff_extended(self):
+        crawler = TestCrawler()
+        pp = BackoffProxyPool(crawler, ["1.1.1.1:80", "2.2.2.2:80"], clock=self.clock)
+
+        pp.backoff("1.1.1.1:80", seconds=1)
+        pp.backoff("1.1.1.1:80", seconds=10)  # extends the earlier backoff
+        pp.backoff("2.2.2.2:80", seconds=5)
+        self.assertEqual(pp._time_until_next_available(), 5)
 
-        expected_vals = ["proxy2", "proxy2", "proxy2"]
-        for expected_val in expected_vals:
-            proxy, waittime = pp._get_proxy()
-            self.assertEqual(proxy, expected_val)
+        self.clock.advance(5)
+        self.assertEqual(pp._available_proxies(), ["2.2.2.2:80"])
+        pp.backoff("2.2.2.2:80", seconds=10)
+        self.assertEqual(pp._time_until_next_available(), 5)
 
-        time.sleep(0.002)
+        self.clock.advance(5)
+        self.assertEqual(pp._available_proxies(), ["1.1.1.1:80"])
 
-        # back to default state, because proxy1 not backing off anymore
+    def test_backoff_not_shortened(self):
+        crawler = TestCrawler()
+        pp = BackoffProxyPool(crawler, ["1.1.1.1:80"], clock=self.clock)
+
+        pp.backoff("1.1.1.1:80", seconds=600)
+        pp.backoff("1.1.1.1:80", seconds=5)  # does not cut the longer backoff short
+        self.assertEqual(pp._time_until_next_available(), 600)
+
+        # nor does a restored state
+        pp.set_state(dict(backoffs={"1.1.1.1:80": self.clock.seconds() + 10}))
+        self.clock.advance(10)
+        self.assertEqual(pp._available_proxies(), [])
+        self.clock.advance(590)
+        self.assertEqual(pp._available_proxies(), ["1.1.1.1:80"])
+
+        pp.backoff(None, seconds=10)
+        pp.backoff(None, seconds=1)
+        self.assertEqual(pp.non_proxy_until, self.clock.seconds() + 10)
+
+    def test_get_proxy_without_proxies(self):
+        crawler = TestCrawler()
+        pp = BackoffProxyPool(crawler, [], clock=self.clock)
+        self.assertIsNone(self.successResultOf(pp.get_proxy()))
+
+        pp.backoff(None, seconds=1)
+        d = pp.get_proxy()
+        self.assertNoResult(d)
+        self.clock.advance(1)
+        self.assertIsNone(self.successResultOf(d))
+
+    def test_health(self):
+        crawler = TestCrawler()
+        pp = BackoffProxyPool(crawler, ["1.1.1.1:80", "2.2.2.2:80"], clock=self.clock, health_params={"min_samples": 5, "quarantine_time": 60})
+
+        for i in range(5):
+            pp.record("http://1.1.1.1:80", 0.1)
+            pp.record("http://2.2.2.2:80", 5)
+
+        # the healthier proxy is picked unless both random choices are the unhealthy one
         random.seed(1)
-        expected_vals = ["proxy1", "proxy1", "proxy2"]
-        for expected_val in expected_vals:
-            proxy, _ = pp._get_proxy()
-            self.assertEqual(proxy, expected_val)
-
-        # proxy2 is backing off, so only proxy1
-        pp.backoff("proxy2", milliseconds=1)
-        expected_vals = ["proxy1", "proxy1", "proxy1"]
-        for expected_val in expected_vals:
-            proxy, _ = pp._get_proxy()
-            self.assertEqual(proxy, expected_val)
-
-        # both backing off, expect to see a backoff time returned
-        pp.backoff("proxy1", milliseconds=1)
-        pp.backoff("proxy2", milliseconds=1)
-        _, waittime = pp._get_proxy()
-        self.assertNotEqual(waittime, 0)
+        picked = [self.successResultOf(pp.get_proxy()) for i in range(100)]
+        self.assertGreater(picked.count("1.1.1.1:80"), 60)
+
+        # a failing proxy is quarantined
+        for i in range(5):
+            pp.record("http://2.2.2.2:80", 30, error=True)
+        self.assertEqual(pp._available_proxies(), ["1.1.1.1:80"])
+        self.assertEqual(crawler.stats.get_value("proxies/quarantined"), 1)
+        self.clock.advance(60)
+        self.assertEqual(sorted(pp._available_proxies()), ["1.1.1.1:80", "2.2.2.2:80"])
+
+    def test_quarantine_not_lifted_by_backoff(self):
+        crawler = TestCrawler()
+        pp = BackoffProxyPool(crawler, ["1.1.1.1:80", "2.2.2.2:80"], clock=self.clock, health_params={"min_samples": 5, "quarantine_time": 600})
+        for i in range(5):
+            pp.record("http://1.1.1.1:80", 0.1)
+            pp.record("http://2.2.2.2:80", 30, error=True)
+        self.assertEqual(pp._available_proxies(), ["1.1.1.1:80"])
+
+        # a request that was in flight during the quarantine is rate limited
+        pp.backoff("http://2.2.2.2:80", seconds=5)
+        self.clock.advance(5)
+        self.assertEqual(pp._available_proxies(), ["1.1.1.1:80"])
+
+        self.clock.advance(595)
+        self.assertEqual(sorted(pp._available_proxies()), ["1.1.1.1:80", "2.2.2.2:80"])
+
+
+class TestMediaRequestMeta(unittest.TestCase):
+    def test_media_request_meta(self):
+        item = dict(
+            meta=dict(pkg_name="com.example", app_name="Example", developer_website="https://example.com"),
+            versions={"1.0": dict(download_url="https://example.com/app.apk")}
+        )
+        meta = media_request_meta(item, download_timeout=3)
+        self.assertEqual(meta, dict(meta=dict(pkg_name="com.example"), download_timeout=3))
+
+        # middlewares that update the meta of the request do not touch the item
+        meta['proxy'] = "http://127.0.0.1:8080"
+        meta['meta']['pkg_name'] = "com.other"
+        self.assertNotIn("proxy", item)
+        self.assertEqual(item['meta']['pkg_name'], "com.example")
+
+        self.assertEqual(media_request_meta(dict(meta=dict(id="123")), version="1.0"), dict(meta=dict(id="123"), version="1.0"))
 
 
 if __name__ == '__main__':
@@ -30,7 +30,7 @@ def update_analysis(q_tasks, q_progress, db_string):
 
         for v, dat in versions.items():
             file_path = dat.get("file_path", "")
-            new_analysis = analyse(file_path)
+            new_analysis = analyse(file_path, analysis=dat.get("analysis", None))
             dat['analysis'] = new_analysis
             versions[v] = dat
 
@@ -71,6 +71,7 @@ def progress(q, rowcount):
 def main(args):
     """
     Adds signer information (i.e. the certificates that actually signed the .apk, not *all* certificates in the .apk) to every row in the 'versions' table.
+    More generally, recomputes only the analysis components that are missing or outdated in the stored analysis of every row.
     Reads the current information from the 'meta' column, and create a 'meta_new' column, as to keep the old column as a backup
     """
     for namespace, level in [
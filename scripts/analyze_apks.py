@@ -1,33 +1,162 @@
 import argparse
-import os
 import json
+import logging
+import os
+import re
 import sys
+import time
+from multiprocessing import Pool, cpu_count
+
+import yaml
+from sqlalchemy import text
 
 sys.path.append(os.path.abspath('.'))
-from apk.analysis import analyse
-from scripts.util import walk_spider_dir
+from crawler.pipelines.analyze_apks import analyse
+from crawler.pipelines.database import _engine_from_params
+from scripts.util import merge
+
+_sha_pattern = re.compile("^([0-9a-f]{64})\\.apk$")
+
+
+def apks_from_store(rootdir):
+    """
+    Generator of (sha256, path) tuples of the APKs in the content-addressed APK store of the crawler
+    Args:
+        rootdir: str
+            root directory of the crawler, which contains the 'apks' directory
+    """
+    apkdir = os.path.join(rootdir, "apks")
+    with os.scandir(apkdir) as it:
+        for entry in it:
+            m = _sha_pattern.match(entry.name)
+            if m and entry.is_file():
+                yield m.group(1), entry.path
+
+
+def apks_from_db(params):
+    """
+    Generator of (sha256, path) tuples of the APKs in the 'apks' table of the database
+    Args:
+        params: dict
+            database parameters, as in the 'database' section of the configuration
+    """
+    engine, _ = _engine_from_params(params)
+    try:
+        with engine.connect() as con:
+            res = con.execution_options(stream_results=True).execute(text("SELECT sha256, path FROM apks"))
+            for sha, path in res:
+                if sha and path:
+                    yield sha, path
+    finally:
+        engine.dispose()
+
+
+def analysed_shas(outfile):
+    """
+    Returns the set of SHA256 values of the APKs that are present in the output file of a previous run
+    A partially written last line (e.g. when the previous run was killed) is removed from the file
+    """
+    res = set()
+    if not os.path.exists(outfile):
+        return res
 
+    with open(outfile, "rb+") as f:
+        end = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            end += len(line)
+            try:
+                res.add(json.loads(line)['sha256'])
+            except (ValueError, KeyError):
+                pass
+        f.truncate(end)
+    return res
 
-def main(args):
-    with open(args.spidertxt, "r") as f:
-        spiders = [l.strip() for l in f.readlines()]
 
-    with open(args.outfile, "w") as outf:
-        for spider in spiders:
-            spiderdir = os.path.join(args.dir, spider)
+def _analyse(task):
+    """
+    Analyses a single APK, executed by a worker process
+    Returns the serialized output line, such that serialization does not happen in the writing process
+    """
+    sha, path = task
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+    analysis = analyse(path)
+    line = json.dumps(dict(sha256=sha, analysis=analysis))
+    return size, line
 
-            if os.path.exists(spiderdir):
-                for path in walk_spider_dir(spiderdir, spider, regex=".*\.apk"):
-                    with open(path, "r") as f:
-                        a = analyse(f.name)
-                        outf.write(json.dumps(a).strip() + "\n")
+
+class ThroughputReporter:
+    def __init__(self, log, interval):
+        self.log = log
+        self.interval = interval
+        self.start = time.time()
+        self.last = self.start
+        self.count = 0
+        self.bytes = 0
+
+    def add(self, size):
+        self.count += 1
+        self.bytes += size
+
+        now = time.time()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.report()
+
+    def report(self):
+        elapsed = max(time.time() - self.start, 1e-9)
+        self.log.info(f"analysed {self.count} APKs ({self.bytes / 1e9:.2f} GB) in {elapsed:.0f}s: {self.count / elapsed:.2f} APKs/s, {self.bytes / 1e6 / elapsed:.2f} MB/s")
+
+
+def main(config, args):
+    log = logging.getLogger("main")
+
+    if args.source == "db":
+        apks = apks_from_db(config.get("database", {}))
+    else:
+        rootdir = args.rootdir or config.get("output", {}).get("rootdir", "/tmp/crawl")
+        apks = apks_from_store(rootdir)
+
+    seen = analysed_shas(args.outfile)
+    if seen:
+        log.info(f"skipping {len(seen)} APKs that are already present in '{args.outfile}'")
+    tasks = ((sha, path) for sha, path in apks if sha not in seen)
+
+    reporter = ThroughputReporter(log, args.report_interval)
+    with open(args.outfile, "a", buffering=1024 * 1024) as outf, Pool(args.nprocesses) as pool:
+        for size, line in pool.imap_unordered(_analyse, tasks, chunksize=args.chunksize):
+            outf.write(line + "\n")
+            reporter.add(size)
+            if reporter.count % args.flush_every == 0:
+                # output file doubles as checkpoint
+                outf.flush()
+    reporter.report()
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description='Analyze all APKs')
-    parser.add_argument("--dir", help="Directory to traverse", default=".")
-    parser.add_argument("--spidertxt", help="File which contains names of spiders", default="config/spider_list.txt")
-    parser.add_argument("--outfile", help="Name of output file", default="apks.json")
+    logging.getLogger("androguard").setLevel(logging.ERROR)
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s-10s - %(levelname)-8s %(message)s',
+        level=logging.INFO
+    )
+
+    parser = argparse.ArgumentParser(description='Analyze all APKs in the APK store or database, and write the analyses as JSON lines')
+    parser.add_argument("--configs", help="Path to YAML configuration files", nargs="+", default=[])
+    parser.add_argument("--source", help="Where to find the APKs", choices=["store", "db"], default="store")
+    parser.add_argument("--rootdir", help="Root directory of the crawler (overrides configuration)")
+    parser.add_argument("--outfile", help="Name of output file, APKs already present in the file are skipped", default="apks.jsonl")
+    parser.add_argument("--nprocesses", help="Number of analysis processes", default=cpu_count(), type=int)
+    parser.add_argument("--chunksize", help="Number of APKs sent to an analysis process at once", default=4, type=int)
+    parser.add_argument("--flush_every", help="Number of analyses after which the output file is flushed", default=100, type=int)
+    parser.add_argument("--report_interval", help="Number of seconds between throughput reports", default=30, type=float)
     args = parser.parse_args()
 
-    main(args)
+    cnf = {}
+    for cnf_file in args.configs:
+        with open(cnf_file) as f:
+            cnf = merge(cnf, yaml.load(f, Loader=yaml.FullLoader))
+    main(cnf, args)
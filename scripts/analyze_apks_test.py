@@ -0,0 +1,42 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from scripts.analyze_apks import apks_from_store, analysed_shas
+
+
+class TestAnalyzeApks(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_apks_from_store(self):
+        apkdir = os.path.join(self.tmpdir, "apks")
+        os.makedirs(apkdir)
+        sha = "a" * 64
+        for fname in [f"{sha}.apk", "1.0.0.apk", f"{sha}.apk.tmp"]:
+            open(os.path.join(apkdir, fname), "w").close()
+
+        actual = list(apks_from_store(self.tmpdir))
+        self.assertEqual(actual, [(sha, os.path.join(apkdir, f"{sha}.apk"))])
+
+    def test_analysed_shas(self):
+        outfile = os.path.join(self.tmpdir, "apks.jsonl")
+        self.assertEqual(analysed_shas(outfile), set())
+
+        lines = [json.dumps(dict(sha256=sha, analysis={})) + "\n" for sha in ["a", "b"]]
+        with open(outfile, "w") as f:
+            f.writelines(lines)
+            f.write('{"sha256": "c", "anal')  # partially written line
+
+        self.assertEqual(analysed_shas(outfile), {"a", "b"})
+        with open(outfile) as f:
+            self.assertEqual(f.read(), "".join(lines))
+
+
+if __name__ == '__main__':
+    unittest.main()
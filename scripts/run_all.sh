@@ -1,12 +1,25 @@
 #!/usr/bin/env bash
-if [ "$#" -ne 2 ]; then
-    echo "Illegal number of parameters: need 2 (configdir, logdir)"
+if [ "$#" -lt 2 ] || [ "$#" -gt 3 ]; then
+    echo "Illegal number of parameters: need 2 (configdir, logdir) and optionally --single-process"
     exit 2
 fi
 
 configdir=$1
 logdir=$2
 
+if python -c "import sys, yaml; c = yaml.safe_load(open(sys.argv[1])) or {}; sys.exit(0 if c.get('analysis', {}).get('server', {}).get('enabled') else 1)" $1/config.yml; then
+    echo "[*] Starting analysis server in background"
+    python scripts/run_analysis_server.py --configs $1/config.yml > $2/analysis_server.log 2>&1 &
+    analysis_server_pid=$!
+    trap "kill $analysis_server_pid" EXIT
+fi
+
+if [ "$3" == "--single-process" ]; then
+    echo "[*] Starting all spiders in a single process"
+    python scripts/run_spider.py --configs $1/config.yml --market_configdir $1 --logdir $2 --spider $(cat config/spider_list.txt)
+    exit $?
+fi
+
 echo "[*] Starting all spiders in background"
 echo "  > Configuration directory:            $1"
 echo "  > Main configuration file:            $1/config.yml"
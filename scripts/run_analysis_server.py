@@ -0,0 +1,43 @@
+import argparse
+import logging
+import os
+import sys
+
+import yaml
+
+sys.path.append(os.path.abspath('.'))
+from crawler.analysis_server import AnalysisServer
+from scripts.util import merge
+
+
+def main(config, args):
+    params = config.get("analysis", {}).get("server", {})
+
+    host = args.host or params.get("host", "127.0.0.1")
+    port = args.port or params.get("port", 8765)
+    workers = args.workers or params.get("workers", None)
+    cache_size = params.get("cache_size", 10000)
+
+    server = AnalysisServer(host=host, port=port, workers=workers, cache_size=cache_size)
+    server.start()
+
+
+if __name__ == "__main__":
+    logging.getLogger("androguard").setLevel(logging.ERROR)
+
+    parser = argparse.ArgumentParser(description='Local APK analysis service shared by all spider processes')
+    parser.add_argument("--configs", help="Path to YAML configuration files", nargs="+",
+                        default=["config/config.template.yml"])
+    parser.add_argument("--host", help="Address to listen on (overrides configuration)")
+    parser.add_argument("--port", help="Port to listen on (overrides configuration)", type=int)
+    parser.add_argument("--workers", help="Number of worker processes (overrides configuration, default: number of CPUs)", type=int)
+    args = parser.parse_args()
+
+    cnf = {}
+    for cnf_file in args.configs:
+        try:
+            with open(cnf_file) as f:
+                cnf = merge(cnf, yaml.load(f, Loader=yaml.FullLoader))
+        except Exception as e:
+            pass
+    main(cnf, args)
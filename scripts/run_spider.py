@@ -8,38 +8,14 @@ from multiprocessing import Process
 
 import sentry_sdk
 import yaml
-from scrapy.crawler import CrawlerProcess
+from scrapy.crawler import Crawler, CrawlerProcess
+from scrapy.settings import default_settings
 
 sys.path.append(os.path.abspath('.'))
-from crawler.pipelines.util import InfluxDBClient
-from crawler.util import market_from_spider
-from crawler.spiders.apkmirror import ApkMirrorSpider
-from crawler.spiders.apkmonk import ApkMonkSpider
-from crawler.spiders.baidu import BaiduSpider
-from crawler.spiders.fdroid import FDroidSpider
-from crawler.spiders.gplay import GooglePlaySpider, AuthRenewServer
-from crawler.spiders.huawei import HuaweiSpider
-from crawler.spiders.mi import MiSpider
-from crawler.spiders.slideme import SlideMeSpider
-from crawler.spiders.tencent import TencentSpider
-from crawler.spiders.threesixty import ThreeSixtySpider
-from crawler.spiders.nine_game import NineGameSpider
+from crawler.sharding import parse_shard
+from crawler.spiders import spider_by_name
 from scripts.util import merge
 
-ALL_SPIDERS = [
-    ApkMirrorSpider,
-    ApkMonkSpider,
-    BaiduSpider,
-    FDroidSpider,
-    HuaweiSpider,
-    MiSpider,
-    SlideMeSpider,
-    TencentSpider,
-    ThreeSixtySpider,
-    GooglePlaySpider,
-    NineGameSpider
-]
-
 
 def _load_user_agents(path):
     try:
@@ -59,37 +35,42 @@ def _load_proxies(path):
         return []
 
 
-def spider_by_name(name):
-    """
-    Returns an instance of a spider for the given name
-    Args:
-        name: str
-
-    Returns:
-        scrapy.Spider
-    """
-    spider = None
-    for s in ALL_SPIDERS:
-        if market_from_spider(s) == name:
-            spider = s
-            break
-    if not spider:
-        raise Exception("Unknown spider")
-    return spider
-
-
 class YamlException(Exception):
     def __init__(self, required_field):
         msg = f"Invalid YAML file: missing '{required_field}'"
         super().__init__(msg)
 
 
-def get_settings(config, spidername, logdir):
+class JobdirException(Exception):
+    def __init__(self, jobdir, queued, configured):
+        msg = f"The requests queued in '{jobdir}' are serialized by {queued}, but 'scrapy/resumation/queue' configures {configured}: " \
+              f"change the configuration back to resume the crawl, or remove the jobdir to start a new crawl"
+        super().__init__(msg)
+
+
+def _check_jobdir(jobdir, use_msgpack):
+    """
+    Raises a JobdirException if the requests queued in the jobdir of a previous crawl cannot be read by the configured queue
+    """
+    if not os.path.isdir(jobdir):
+        return
+    from crawler.squeues import queued_serialization
+
+    queued = queued_serialization(jobdir)
+    configured = "msgpack" if use_msgpack else "pickle"
+    if queued and queued != configured:
+        raise JobdirException(jobdir, queued, configured)
+
+
+def get_settings(config, spidername, logdir, spider=True):
     """
     Return a dictionary used as settings for Scrapy crawling
     Args:
         config: dict
             Configuration dictionary read from YAML file
+        spider: bool
+            whether the settings are of a spider, or only of the process that runs multiple spiders,
+            which has no settings that belong to a single spider (e.g. its jobdir and log file)
 
     Returns: dict
         Scrapy settings
@@ -108,6 +89,9 @@ def get_settings(config, spidername, logdir):
     retrieve_package_files = input.get("from_package_files", False)
     retrieve_base_requests = input.get("from_base_requests", False)
     retrieve_from_db = input.get("from_db", False)
+    sharding = input.get("sharding", {})
+    frontier = input.get("frontier", {})
+    package_dedup = input.get("dedup", {})
 
     scrapy = config.get("scrapy", None)
     if not scrapy:
@@ -127,6 +111,8 @@ def get_settings(config, spidername, logdir):
     ratelimit = scrapy.get("ratelimit", None)
     if not ratelimit:
         raise YamlException("scrapy/ratelimit")
+    proxy_health = scrapy.get("proxy_health", {})
+    shared_state = scrapy.get("shared_state", {})
 
     resumation = scrapy.get("resumation", None)
     if not resumation:
@@ -134,7 +120,11 @@ def get_settings(config, spidername, logdir):
 
     resumation_enabled = resumation.get("enabled", True)
     jobdir = resumation.get("jobdir", "./jobdir")
-    jobdir = os.path.join(jobdir, spidername)
+    disk_queue = resumation.get("queue", {})
+    # workers of the same market on one host each need their own job directory and log file
+    shardname = f"{spidername}.{sharding['node']}" if sharding.get("enabled", False) else spidername
+    jobdir = os.path.join(jobdir, shardname)
+    dupefilter = scrapy.get("dupefilter", {})
 
     downloads = config.get("downloads", None)
     if not downloads:
@@ -143,10 +133,20 @@ def get_settings(config, spidername, logdir):
     apk_enabled = downloads.get("apk", True)
     icon_enabled = downloads.get("icon", True)
 
+    analysis = config.get("analysis", {})
+    analysis_server = analysis.get("server", {})
+    if analysis_server.get("enabled", False):
+        host = analysis_server.get("host", "127.0.0.1")
+        port = analysis_server.get("port", 8765)
+        analysis_server_url = f"http://{host}:{port}"
+    else:
+        analysis_server_url = None
+    analysis_server_timeout = analysis_server.get("timeout", 600)
+    analysis_priority = analysis.get("priority", 0)
+
     statsd = config.get("statsd", {})
 
     influxdb = config.get("influxdb", {})
-    influxdb_client = InfluxDBClient(influxdb)
 
     gplay = config.get("googleplay", {})
     if not gplay:
@@ -158,7 +158,7 @@ def get_settings(config, spidername, logdir):
     if not database:
         raise YamlException("database")
 
-    log_file = os.path.join(logdir, f"{spidername}.log")
+    log_file = os.path.join(logdir, f"{shardname}.log")
 
     splash = scrapy.get("splash", {})
     splash_enabled = splash.get("enabled", False)
@@ -185,6 +185,7 @@ def get_settings(config, spidername, logdir):
         'scrapy.downloadermiddlewares.retry.RetryMiddleware': None,
         'crawler.middlewares.sentry.SentryMiddleware': 1,
         'crawler.middlewares.status_code.StatuscodeMiddleware': 2,
+        'crawler.middlewares.pacing.PacingMiddleware': 50,
         'crawler.middlewares.proxy.HttpProxyMiddleware': 100,
         'crawler.middlewares.stats.StatsMiddleware': 120,
         'crawler.middlewares.duration.DurationMiddleware': 200,
@@ -206,7 +207,8 @@ def get_settings(config, spidername, logdir):
     extensions = {
         'crawler.extensions.stats.InfluxdbLogs': 100,
         'crawler.extensions.stats.DumpStatsExtension': 101,
-        'crawler.extensions.stats.MonitorDownloadsExtension': 102
+        'crawler.extensions.stats.MonitorDownloadsExtension': 102,
+        'crawler.extensions.state.PersistStateExtension': 103
     }
 
     user_agents = _load_user_agents(args.user_agents_file)
@@ -244,19 +246,32 @@ def get_settings(config, spidername, logdir):
         DOWNLOAD_TIMEOUT=120,
         DOWNLOAD_MAXSIZE=0,
         RATELIMIT_PARAMS=ratelimit,
+        PROXY_HEALTH_PARAMS=proxy_health,
+        SHARED_STATE_PARAMS=shared_state,
         RETRIEVE_PACKAGE_FILES=retrieve_package_files,
         RETRIEVE_BASE_REQUESTS=retrieve_base_requests,
         RETRIEVE_FROM_DB=retrieve_from_db,
         PACKAGE_FILES=package_files,
+        SHARDING_PARAMS=sharding,
+        FRONTIER_PARAMS=frontier,
+        PACKAGE_DEDUP_PARAMS=package_dedup,
+        DUPEFILTER_PARAMS=dupefilter,
+        DISK_QUEUE_PARAMS=disk_queue,
         STATSD_PARAMS=statsd,
-        INFLUXDB_CLIENT=influxdb_client,
+        INFLUXDB_PARAMS=influxdb,
         GPLAY_PARAMS=gplay,
         APKMIRROR_PARAMS=apkmirror,
         DATABASE_PARAMS=database,
         RECURSIVE=recursive,
         APK_ENABLED=apk_enabled,
+        ANALYSIS_SERVER_URL=analysis_server_url,
+        ANALYSIS_SERVER_TIMEOUT=analysis_server_timeout,
+        ANALYSIS_PRIORITY=analysis_priority,
     )
+    if dupefilter.get("enabled", False):
+        settings['DUPEFILTER_CLASS'] = 'crawler.dupefilter.BloomDupeFilter'
     if splash_enabled:
+        # splash requests are deduplicated by their arguments, which the Bloom dupefilter does not know of
         settings['DUPEFILTER_CLASS'] = 'scrapyjs.SplashAwareDupeFilter'
         settings['HTTPCACHE_STORAGE'] = 'scrapy_splash.SplashAwareFSCacheStorage'
 
@@ -268,39 +283,81 @@ def get_settings(config, spidername, logdir):
     if telnet_password:
         settings['TELNETCONSOLE_PASSWORD'] = telnet_password
 
+    if not spider:
+        return settings
+
     if scrapy.get("log_to_file", True):
         settings['LOG_FILE'] = log_file
 
     if resumation_enabled:
         settings['JOBDIR'] = jobdir
+        _check_jobdir(jobdir, disk_queue.get("msgpack", False))
+        if disk_queue.get("msgpack", False):
+            settings['SCHEDULER_DISK_QUEUE'] = 'crawler.squeues.MsgpackLifoDiskQueue'
 
     return settings
 
 
-def main(config, spidername, logdir):
+def _log_to_file(spider, settings):
+    """
+    Writes the log messages of the spider itself to its own log file, when running multiple spiders in one process
+    """
+    handler = logging.FileHandler(settings['LOG_FILE'], encoding="utf-8")
+    handler.setFormatter(logging.Formatter(default_settings.LOG_FORMAT, default_settings.LOG_DATEFORMAT))
+    logging.getLogger(spider.name).addHandler(handler)
+
+
+def main(config, spidernames, logdir, market_configs={}):
+    """
+    Runs the spiders of the given markets in a single process
+    Every spider has its own engine and settings (e.g. concurrency), from the configuration merged with the configuration of its market,
+    but the spiders share the reactor, DNS cache, proxy pool, rate limiters, database engine and InfluxDB client of the process.
+    Args:
+        config: dict
+            Configuration dictionary read from YAML file
+        spidernames: list of str
+        logdir: str
+        market_configs: dict
+            market name -> configuration dictionary that overrides 'config' for that market
+    """
     dsn = config.get("sentry", {}).get("dsn", "")
     if dsn:
         sentry_sdk.init(dsn)
 
-    settings = get_settings(config, spidername, logdir)
+    market_settings = {}
+    for spidername in spidernames:
+        market_config = merge(config, market_configs.get(spidername, {}))
+        market_settings[spidername] = get_settings(market_config, spidername, logdir)
 
-    spider = spider_by_name(spidername)
+    server_process = None
+    if "googleplay" in market_settings:
+        from crawler.spiders.gplay import AuthRenewServer
 
-    if spider == GooglePlaySpider:
-        server = AuthRenewServer()
+        gplay = market_settings["googleplay"]['GPLAY_PARAMS']
+        server = AuthRenewServer(pool_size=gplay.get("warm_accounts", 10), max_age=gplay.get("max_warm_account_age", 1800))
         server_process = Process(target=server.start)
         server_process.start()
 
         # wait for HTTP server to start
         time.sleep(3)
 
-        settings['GPLAY_PARAMS']['server_port'] = server.port
+        gplay['server_port'] = server.port
+
+    # settings of the process as a whole (e.g. logging, reactor, DNS cache)
+    if len(spidernames) == 1:
+        process_settings = market_settings[spidernames[0]]
+    else:
+        process_settings = get_settings(config, "markets", logdir, spider=False)
+    process = CrawlerProcess(process_settings)
 
-    process = CrawlerProcess(settings)
-    process.crawl(spider)
+    for spidername, settings in market_settings.items():
+        spider = spider_by_name(spidername)
+        if len(spidernames) > 1 and 'LOG_FILE' in settings:
+            _log_to_file(spider, settings)
+        process.crawl(Crawler(spider, settings))
     process.start()  # the script will block here until the crawling is finished
 
-    if spider == GooglePlaySpider:
+    if server_process:
         server_process.terminate()
         server_process.join(timeout=0.1)
 
@@ -336,7 +393,9 @@ if __name__ == "__main__":
     parser.add_argument("--configs", help="Path to YAML configuration files", nargs="+",
                         default="config/config.template.yml")
     parser.add_argument("--logdir", help="Directory in which to store the log files", default="logs")
-    parser.add_argument("--spider", help="Spider to run", required=True, default="config/spider_list.txt")
+    parser.add_argument("--spider", help="Spider(s) to run, multiple spiders are run in a single process", nargs="+", required=True)
+    parser.add_argument("--shard", help="Shard of the packages to crawl, as 'i/N' for the i-th (zero-based) of N workers", type=parse_shard)
+    parser.add_argument("--market_configdir", help="Directory of per-market configuration files (<market>.yml), which override the configuration for that market")
     parser.add_argument("--user_agents_file", help="Path to file of user agents", default="config/user_agents.txt")
     parser.add_argument("--proxies_file", help="Path to file of proxy addresses", default="config/proxies.txt")
     args = parser.parse_args()
@@ -348,4 +407,15 @@ if __name__ == "__main__":
                 cnf = merge(cnf, yaml.load(f, Loader=yaml.FullLoader))
         except Exception as e:
             pass
-    main(cnf, args.spider, args.logdir)
+    if args.shard:
+        cnf = merge(cnf, {"input": {"sharding": args.shard}})
+
+    market_cnfs = {}
+    if args.market_configdir:
+        for spidername in args.spider:
+            try:
+                with open(os.path.join(args.market_configdir, f"{spidername}.yml")) as f:
+                    market_cnfs[spidername] = yaml.load(f, Loader=yaml.FullLoader) or {}
+            except FileNotFoundError:
+                pass
+    main(cnf, args.spider, args.logdir, market_configs=market_cnfs)
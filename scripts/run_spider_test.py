@@ -0,0 +1,62 @@
+import argparse
+import os
+import tempfile
+import unittest
+
+import yaml
+from scrapy import Request, Spider
+from scrapy.squeues import PickleLifoDiskQueue
+from scrapy.utils.test import get_crawler
+
+from scripts import run_spider
+from scripts.util import merge
+
+_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "config", "config.template.yml")
+
+
+class GetSettingsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        with open(_CONFIG_PATH) as f:
+            self.config = merge(yaml.safe_load(f), {"scrapy": {"resumation": {"jobdir": self.tmpdir.name}}})
+        run_spider.args = argparse.Namespace(
+            user_agents_file=os.path.join(self.tmpdir.name, "user_agents.txt"),
+            proxies_file=os.path.join(self.tmpdir.name, "proxies.txt")
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_jobdir_serialization(self):
+        settings = run_spider.get_settings(self.config, "fdroid", self.tmpdir.name)
+        self.assertNotIn("SCHEDULER_DISK_QUEUE", settings)
+
+        # a previous crawl left requests in the jobdir, serialized by pickle
+        crawler = get_crawler(Spider)
+        crawler.spider = Spider("fdroid")
+        q = PickleLifoDiskQueue.from_crawler(crawler, os.path.join(settings["JOBDIR"], "requests.queue", "p0"))
+        q.push(Request("https://example.com"))
+        q.close()
+        self.assertEqual(run_spider.get_settings(self.config, "fdroid", self.tmpdir.name)["JOBDIR"], settings["JOBDIR"])
+
+        msgpack_config = merge(self.config, {"scrapy": {"resumation": {"queue": {"msgpack": True}}}})
+        with self.assertRaises(run_spider.JobdirException):
+            run_spider.get_settings(msgpack_config, "fdroid", self.tmpdir.name)
+
+    def test_process_settings(self):
+        # a previous crawl left requests of another serialization in the jobdir of the process, which is not used
+        crawler = get_crawler(Spider)
+        crawler.spider = Spider("markets")
+        q = PickleLifoDiskQueue.from_crawler(crawler, os.path.join(self.tmpdir.name, "markets", "requests.queue", "p0"))
+        q.push(Request("https://example.com"))
+        q.close()
+
+        msgpack_config = merge(self.config, {"scrapy": {"resumation": {"queue": {"msgpack": True}}}})
+        settings = run_spider.get_settings(msgpack_config, "markets", self.tmpdir.name, spider=False)
+        for key in ["JOBDIR", "LOG_FILE", "SCHEDULER_DISK_QUEUE"]:
+            self.assertNotIn(key, settings)
+        self.assertIn("JOBDIR", run_spider.get_settings(self.config, "fdroid", self.tmpdir.name))
+
+
+if __name__ == '__main__':
+    unittest.main()